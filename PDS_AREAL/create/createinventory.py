@@ -1,10 +1,16 @@
-import glob
+import heapq
 import os
+import tempfile
+from PDS_AREAL.utils.catalog import read_catalog
+from PDS_AREAL.utils.dirindex import index_glob
+from PDS_AREAL.utils.manifest import collection_file
+from PDS_AREAL.utils.pdsutils import iter_paths
 
-def create_inventory(bundle_name, collection_path, data_path, file_extension):
+def create_inventory(bundle_name, collection_path, data_path, file_extension, catalog=None, sort=False, chunk_size=100000, index=None, rewrite=False):
 	"""Create Inventory
 
-	Create a CSV inventory for any collection.
+	Create a CSV inventory for any collection. The collection is walked lazily with os.scandir and rows are
+	written out as they're found, so memory use stays flat however large the collection is.
 
 	Args:
 		bundle_name (str): The name of the bundle directory.
@@ -15,26 +21,86 @@ def create_inventory(bundle_name, collection_path, data_path, file_extension):
 			subdirectories of the collection.
 			Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\*/\*/\*.fits'
 		file_extension (str): The type of file to be included. Ex. '.fits', '.txt' or '.tif'
+		catalog (:obj:`str`, optional): Path to a catalog made by PDS_AREAL.utils.catalog.build_catalog.
+			The files matching data_path are then listed from the catalog instead of the file system.
+		sort (:obj:`bool`, optional): Default is False, which lists products in directory order. Set to True
+			for a deterministic inventory sorted by LID. Large collections are sorted in chunks on disk and
+			merged, so this doesn't need memory for the whole inventory either.
+		chunk_size (:obj:`int`, optional): With sort = True, the number of rows sorted in memory at a time.
+			Defaults to 100000.
+		index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering data_path.
+			The files matching data_path are then listed from the index instead of the file system.
+		rewrite (:obj:`bool`, optional): Default is False, which leaves an existing inventory alone. Set to True
+			to replace it, ex. after files are added to or removed from the collection.
 		
 	"""
 	collection_name = collection_path.rsplit('/',1)[1]
 	inventory_filename = 'collection_' + bundle_name + '_' + collection_name + '_inventory.csv'
 	inventory_path = collection_path + '/' + inventory_filename
-	if os.path.exists(inventory_path):
+	if not rewrite and os.path.exists(inventory_path):
 		print('File already exists')
 		return
 	print('Creating temp file ' + inventory_filename + ' for ' + collection_name)
-	inventory_rows = ''
-	for path in glob.glob(data_path):
+	if catalog is not None:
+		paths = (record['path'] for record in read_catalog(catalog, data_path))
+	elif index is not None:
+		paths = index_glob(index, data_path)
+	else:
+		paths = iter_paths(data_path)
+	rows = _inventory_rows(paths, bundle_name, collection_name, file_extension)
+	#kept next to the collection rather than in it, so a failed run can't leave it in a delivery
+	temp_path = collection_file(collection_path, 'inventory.tmp')
+	try:
+		with tempfile.TemporaryDirectory() as chunk_dir:
+			if sort:
+				rows = _sorted_rows(rows, chunk_dir, chunk_size)
+			#rows end in CR LF, as the collection label's record_delimiter says, so newlines aren't translated
+			with open(temp_path, 'w', buffering=1024 * 1024, newline='') as inventory:
+				for row in rows:
+					inventory.write(row + '\r\n')
+	except BaseException:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
+	print('Writing temp file to permanent file')
+	os.replace(temp_path, inventory_path)
+	print('Done. Nice work!')
+
+def _inventory_rows(paths, bundle_name, collection_name, file_extension):
+	for path in paths:
 		if path[-len(file_extension):] == file_extension:
 			filename = path.rsplit('/',1)[1]
 			file_id = filename[:-len(file_extension)]
-			inventory_rows += 'P, ' + 'urn:nasa:pds:' + bundle_name + ':' + collection_name + ':' + file_id + '::1.0\n\n'
-	inventory = open(inventory_path, 'w')
-	print('Writing temp file to permanent file')
-	inventory.write(inventory_rows)
-	inventory.close
-	print('Done. Nice work!')
+			yield 'P, ' + 'urn:nasa:pds:' + bundle_name + ':' + collection_name + ':' + file_id + '::1.0'
+
+def _sorted_rows(rows, chunk_dir, chunk_size):
+	#external merge sort: sort chunk_size rows at a time into files, then merge the sorted files
+	chunk = []
+	chunk_paths = []
+	for row in rows:
+		chunk.append(row)
+		if len(chunk) == chunk_size:
+			chunk_paths.append(_write_chunk(sorted(chunk), chunk_dir, len(chunk_paths)))
+			chunk = []
+	if not chunk_paths:
+		yield from sorted(chunk)
+		return
+	if chunk:
+		chunk_paths.append(_write_chunk(sorted(chunk), chunk_dir, len(chunk_paths)))
+	chunk_files = [open(chunk_path, 'r') for chunk_path in chunk_paths]
+	try:
+		for row in heapq.merge(*[(line.rstrip('\n') for line in chunk_file) for chunk_file in chunk_files]):
+			yield row
+	finally:
+		for chunk_file in chunk_files:
+			chunk_file.close()
+
+def _write_chunk(chunk, chunk_dir, number):
+	chunk_path = os.path.join(chunk_dir, 'chunk' + str(number))
+	with open(chunk_path, 'w', buffering=1024 * 1024) as chunk_file:
+		for row in chunk:
+			chunk_file.write(row + '\n')
+	return chunk_path
 
 def create_inventory_instructions():
     print("'*bundle_name* is a string that is the directory name within which the collection exists. Ex. 'jup_supp.irtf_mirsi'\n*collection_path* is a string that is the path to the collection which needs the inventory. Do not include a trailing slash. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw'\n*data_path* is a string that is the path all the way to individual fits files, using wildcards for the subdirectories of the collection. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/*/*/*.fits'\n*file_extension* is a string and the type of file (including '.') that should be included. Ex. '.fits' or '.tif'")
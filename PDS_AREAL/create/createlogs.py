@@ -4,14 +4,28 @@
 # *day_path* is the path to the day-level directories of the data in the form of '/prvt/juno1/PDART_files/bundle_name/data_raw/*/*'. The fits files should be in these day directories (the code below is set up for data in a directory with the format of '/path-to-bundle/data_raw/yyyy/mm-dd/filename.fits'). This path variable should go only as deep as the mm-dd subdirectory, with the year and date as wilcards, for example: 'prvt/juno1/PDART_files/jup_supp.geminis_trecs/data_raw/*/*' (NO TRAILING SLASH)
 # *documents* is the name of your documents folder (it should be in the path in logs_path)
 ########--------End Variables--------#####
+import csv
 import glob
+from itertools import repeat
+import io
 import os
-from astropy.io import fits
+from PDS_AREAL.utils.fitsheader import read_header
+from PDS_AREAL.utils.dirindex import index_glob
+from PDS_AREAL.utils.catalog import check_catalog_keys, file_record, prefetch_records, read_catalog
+from PDS_AREAL.utils.manifest import collection_root
+from PDS_AREAL.utils.profiles import Extractor, registered_keys, resolve_profile
+from PDS_AREAL.utils.pdsutils import atomic_write
+from PDS_AREAL.utils.progress import RunStats
+from PDS_AREAL.utils.sinks import open_sink
+import time
 
-def create_header_observing_logs(logs_path, day_path, documents = 'document', WAVELENG = 'WAVELENG', DATEOBS = 'DATE-OBS', TIMEOBS = 'TIME-OBS', CHPFREQ = 'CHPFREQ', OBSMODE = 'OBSMODE',AIRMASS = 'AIRMASS'):
+#the columns of each log
+LOG_COLUMNS = ['File Name', 'Wavelength', 'Observation Date', 'Time in UT', 'Chop Frequency', 'Observation Mode', 'Air Mass']
+
+def create_header_observing_logs(logs_path, day_path, documents = 'document', WAVELENG = None, DATEOBS = None, TIMEOBS = None, CHPFREQ = None, OBSMODE = None, AIRMASS = None, catalog = None, reporter = 'print', prefetch = None, profile = None, workers = None, csv_path = None, index = None, sink = None, rewrite = False):
     """Create Header Observing Logs
 
-    Use this to create the observing logs of a data_raw collection. It takes specific data from the header, uses Astropy fits to create a dictionary, and then prints the header logs. A text file is created for each day.
+    Use this to create the observing logs of a data_raw collection. It takes specific data from the header, reads it into a dictionary, and then prints the header logs. A text file is created for each day.
 
     Args:
         logs_path (str): the path to where the logs should be saved. 
@@ -25,135 +39,262 @@ def create_header_observing_logs(logs_path, day_path, documents = 'document', WA
             as wilcards, for example: 'prvt/juno1/PDART_files/jup_supp.geminis_trecs/data_raw/\*/\*' 
             (NO TRAILING SLASH)
         documents (:obj:`str`, optional): The name of your documents folder (it should be in the path in logs_path).
-        WAVELENG (:obj:`str`, optional): The header entries might have different key names in each collection. This
-            defaults to 'WAVELENG', however check a sample fits header for the correct wavelength key.
-        DATEOBS (:obj:`str`, optional): The header entries might have different key names in each collection. This
-            defaults to 'DATE-OBS', however check a sample fits header for the correct observation date key.
-        TIMEOBS (:obj:`str`, optional):The header entries might have different key names in each collection. This
-            defaults to 'TIME-OBS', however check a sample fits header for the correct observation time key.
-        CHPFREQ (:obj:`str`, optional): The header entries might have different key names in each collection. This
-            defaults to 'CHPFREQ', however check a sample fits header for the correct chop frequency key.
-        OBSMODE (:obj:`str`, optional): The header entries might have different key names in each collection. This
-            defaults to 'OBSMODE', however check a sample fits header for the correct observation mode key.
-        AIRMASS (:obj:`str`, optional): The header entries might have different key names in each collection. This
-            defaults to 'AIRMASS', however check a sample fits header for the correct airmass key.
+        WAVELENG (:obj:`str`, optional): The header key for the wavelength. Defaults to the keys in the instrument 
+            profile (usually 'WAVELENG'). Check a sample fits header if the collection uses a different key.
+        DATEOBS (:obj:`str`, optional): The header key for the observation date. Defaults to the keys in the instrument 
+            profile (usually 'DATE-OBS'). Check a sample fits header if the collection uses a different key.
+        TIMEOBS (:obj:`str`, optional): The header key for the observation time. Defaults to the keys in the instrument 
+            profile (usually 'TIME-OBS'). Check a sample fits header if the collection uses a different key.
+        CHPFREQ (:obj:`str`, optional): The header key for the chop frequency. Defaults to the keys in the instrument 
+            profile (usually 'CHPFREQ'). Check a sample fits header if the collection uses a different key.
+        OBSMODE (:obj:`str`, optional): The header key for the observation mode. Defaults to the keys in the instrument 
+            profile (usually 'OBSMODE'). Check a sample fits header if the collection uses a different key.
+        AIRMASS (:obj:`str`, optional): The header key for the airmass. Defaults to the keys in the instrument 
+            profile (usually 'AIRMASS'). Check a sample fits header if the collection uses a different key.
+        catalog (:obj:`str`, optional): Path to a catalog made by PDS_AREAL.utils.catalog.build_catalog. The day 
+            directories, fits files and headers are then taken from the catalog instead of the file system. 
+            The catalog must have been built with all of the header keys the profile reads.
+        reporter (:obj:`str`, optional): How to report progress. 'print' (the default) prints the messages for 
+            every day and file, 'progress' shows a progress bar instead, 'jsonl' writes a JSON line per file and 
+            'quiet' prints nothing. Apart from 'quiet', a summary of throughput and of the time spent globbing, 
+            opening, formatting and writing is printed at the end. See PDS_AREAL.utils.progress.RunStats.
+        prefetch (:obj:`int`, optional): Number of headers to read ahead on background threads while each log 
+            is written, ex. prefetch = 32. On a network file system this keeps that many reads in flight instead 
+            of one, and the files are still added to the log in glob order. Default is None, which reads each 
+            header in turn. Not used with catalog.
+        profile (:obj:`str` or :obj:`dict`, optional): The instrument profile, which says which header keys hold 
+            the values in the log and gives the wavelength of each filter for files without a wavelength key. 
+            One of 'mirsi', 'trecs', 'comics', 'mirlin', 'mirac' or 'default', or a profile registered with 
+            PDS_AREAL.utils.profiles.register_profile. Default is None, which detects the profile from the 
+            INSTRUME card of the first file.
+        workers (:obj:`int`, optional): Number of worker processes to spread the days across, each writing its 
+            own log. Default is None, which does one day at a time. The messages are reported in day order either way.
+        csv_path (:obj:`str`, optional): A directory to also write each day's rows to as CSV, for analysis, 
+            ex. '/prvt/juno1/PDART_files/logs_csv/'. Keep it outside the bundle. Default is None, which writes no CSV.
+        index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering day_path. The day 
+            directories and their fits files are then listed from the index instead of globbing each day. 
+            Not needed with catalog.
+        sink (:obj:`str` or sink, optional): Where to write the logs. Default is None, which writes them to logs_path. 
+            A path ending in .tar, .tar.gz or .zip streams them into that archive instead, named from the 
+            bundle directory down, and a sink from PDS_AREAL.utils.sinks can also be passed in. Logs already in 
+            the sink are skipped, as they are in logs_path. create_header_observing_labels reads the logs from 
+            logs_path, so label them before archiving them, or pass it the same MemorySink.
+        rewrite (:obj:`bool`, optional): Default is False, which skips days that already have a log. Set to True 
+            to make every log again, ex. after files are added to or removed from a day. Logs that come out the 
+            same aren't written, so their labels' modification dates stay as they were.
 
     """
-    for day in glob.glob(day_path):
-        print('Accessing: ' + day)
-        #Get the year from the path, then check to make sure it's not the documents folder. We'll also use the year in the second for-loop.
-        year = day.rsplit('/')[-2]
-        if year == documents:
-            continue
-        #gets the name of the date folder and assigns it to variable 'date'
-        date = day.rsplit('/',1)[1]
-        print('Looping through folder: ' + date)
-        #gets the rest of the path. We use this below in the second for-loop
-        path = day.rsplit('/',2)[0]
-        #gets the logs_path, adds the date from previous line, and adds .txt file extention
-        log_name = str(logs_path + year + '_' + date + '.txt')
-        print('Creating: ' + log_name)
-        #checks that the file doesn't already exists
-        if os.path.exists(log_name) == True:
-            print(log_name + ' already exists. Starting back at the top.')
-            continue
-        #Creates the new text file
-        log = open(log_name, 'x')
-        print('Opening ' + log_name)
-        #This is the heading of our new text file.
-        #You might have to adjust the tabs to get this perfect.
-        log.write('File Name\t\t\t\tWavelength\t\tObservation Date\tTime in UT\t\tChop Frequency\t\tObservation Mode\t\tAir Mass')
-        print('Wrote heading')
-        ### Need to add something here that will limit the data_path in the next for-loop so that it only looks in the data of that day!
-        data_path = path + '/' + year + '/' + date + '/*.fits'
-        #This for loop now goes through each fits file in the date folder
-        for path in glob.glob(data_path):
-            print('Adding ' + path + ' to log.')
-            #gets the filename from the path 
-            filename = path.rsplit('/',1)[1]
-            #uses astropy fits to create a header object. A data object is also created, but we don't use it here.
-            img = fits.open(path)
-            header = img[0].header
-            #uses astropy verify to fix the header before continuing.
-            img[0].verify('fix')
-            #create the strings for printing, dealing with any errors that come up
-            try:
-                wavelength = str(header[WAVELENG])
-            except KeyError:
-                try:
-                    if str(header['FILTER']) == 'K':
-                        wavelength = str('2.2   ')
-                    elif str(header['FILTER']) == 'N0':
-                        wavelength = str('7.9   ')
-                    elif str(header['FILTER']) == 'N1':
-                        wavelength = str('8.7   ')
-                    elif str(header['FILTER']) == 'N2':
-                        wavelength = str('9.6   ')
-                    elif str(header['FILTER']) == 'N3':
-                        wavelength = str('10.3  ')
-                    elif str(header['FILTER']) == 'N4':
-                        wavelength = str('11.7  ')
-                    elif str(header['FILTER']) == 'N5':
-                        wavelength = str('12.5  ')
-                    elif str(header['FILTER']) == 'Q0':
-                        wavelength = str('17.24 ')
-                    elif str(header['FILTER']) == 'Q1':
-                        wavelength = str('17.93 ')
-                    elif str(header['FILTER']) == 'Q2':
-                        wavelength = str('18.67 ')
-                    elif str(header['FILTER']) == 'Q3':
-                        wavelength = str('20.82 ')
-                    elif str(header['FILTER']) == 'Q4':
-                        wavelength = str('22.79 ')
-                    elif str(header['FILTER']) == 'Qt':
-                        wavelength = str('24.2  ')
-                    elif str(header['FILTER']) == 'Q5':
-                        wavelength = str('24.2  ')
-                    elif str(header['FILTER']) == 'Q-s':
-                        wavelength = str('17.9  ')
-                    elif str(header['FILTER']) == 'Q-1':
-                        wavelength = str('22.43 ')
-                    elif str(header['FILTER']) == 'N':
-                        wavelength = str('10.79 ')
-                    elif str(header['FILTER']) == 'M':
-                        wavelength = str('4.8   ')
-                    else:
-                        wavelength = 'unknown'
-                except KeyError:
-                    wavelength = 'unknown'
-            # Make the wavelength entries the same length for proper formatting.
-            if len(wavelength) == 3:
-                wavelength = wavelength + '   '
-            if len(wavelength) == 4:
-                wavelength = wavelength + '  '
-            if len(wavelength) == 5:
-                wavelength = wavelength + ' '
-            try:
-                observationDate = str(header[DATEOBS])
-            except KeyError:
-                observationDate = 'unknown'
-            try:
-                observationTime = str(header[TIMEOBS])
-            except KeyError:
-                observationTime = 'unknown'
-            try:
-                frequency = str(header[CHPFREQ])
-            except KeyError:
-                frequency = 'unknown'
-            try:
-                observationMode = str(header[OBSMODE])
-            except KeyError:
-                observationMode = 'unknown'
-            try:
-                airmass = str(header[AIRMASS])
-            except KeyError:
-                airmass = 'unknown'
-            #This is the data of our new text file.
-            #You might have to adjust the tabs and spaces here depending on the lengths of the strings
-            log.write('\n' + filename + '\t\t' + wavelength + '  ' + '\t\t' + observationDate + '\t\t' + observationTime + '\t\t\t' + frequency + '  ' + '\t\t\t' + observationMode + '    ' + '\t\t\t' + airmass)
-        #Always make sure to close up shop!
-        log.close()
-        print('Done.')
+    stats = RunStats(reporter)
+    with stats.stage('glob'):
+        if catalog is None:
+            days = glob.glob(day_path) if index is None else index_glob(index, day_path)
+        else:
+            #group the cataloged files by the day directory they're in
+            day_records = {}
+            #checked before it's read, and for the profile's keys below
+            check_catalog_keys(catalog, [])
+            for record in read_catalog(catalog, day_path + '/*.fits'):
+                day_records.setdefault(record['path'].rsplit('/',1)[0], []).append(record)
+            days = list(day_records)
+    #the instrument profile is worked out once, from the first file, and any keys given above replace its own
+    sample = None
+    if catalog is None:
+        first = next((path for day in days for path in (glob.glob(day + '/*.fits') if index is None else index_glob(index, day + '/*.fits'))), None)
+        if first is not None:
+            sample = file_record(first, registered_keys())['header']
+    elif days:
+        sample = day_records[days[0]][0]['header']
+    profile = dict(resolve_profile(profile, sample))
+    for field, key in [('wavelength_keys', WAVELENG), ('date_keys', DATEOBS), ('time_keys', TIMEOBS), ('chop_keys', CHPFREQ), 
+            ('mode_keys', OBSMODE), ('airmass_keys', AIRMASS)]:
+        if key is not None:
+            profile[field] = [key]
+    extractor = Extractor(profile)
+    keys = extractor.keys
+    if catalog is not None:
+        check_catalog_keys(catalog, keys)
+    if csv_path is not None:
+        os.makedirs(csv_path, exist_ok = True)
+    #archive members are named from the bundle directory down
+    output = open_sink(sink, os.path.dirname(os.path.dirname(collection_root(logs_path, documents))))
+    #the workers check logs_path for logs that already exist, and the sink is checked here
+    if not output.in_place and not rewrite:
+        for day in [day for day in days if output.exists(_log_name(day, logs_path))]:
+            stats.message(_log_name(day, logs_path) + ' already exists. Starting back at the top.')
+            days.remove(day)
+    jobs = []
+    for day in days:
+        if catalog is not None:
+            jobs.append(day_records[day])
+        elif index is not None:
+            jobs.append(index_glob(index, day + '/*.fits'))
+        else:
+            jobs.append(None)
+    pool = None
+    if workers:
+        #imported here since multiprocessing slows down importing this module for serial runs
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        #every day has its own log, so the workers never write to the same file. They're started by a fork
+        #server, since forking a process with threads (ex. the pipeline's) isn't safe
+        pool = ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context('forkserver'))
+        results = pool.map(_write_day_log, days, jobs, repeat(logs_path), repeat(documents), repeat(extractor), repeat(prefetch), 
+            repeat(csv_path), repeat(output.in_place), repeat(rewrite))
+    else:
+        results = map(_write_day_log, days, jobs, repeat(logs_path), repeat(documents), repeat(extractor), repeat(prefetch), 
+            repeat(csv_path), repeat(output.in_place), repeat(rewrite))
+    try:
+        for result in results:
+            if result['log'] is not None:
+                #logs for sinks that aren't logs_path are handed back and written here, in day order
+                start = time.perf_counter()
+                output.write(*result['log'])
+                result['durations']['write'] += time.perf_counter() - start
+            for text in result['messages']:
+                stats.message(text)
+            for path, durations, messages in result['files']:
+                stats.file(path, durations, messages)
+            for name, seconds in result['durations'].items():
+                stats.add(name, seconds)
+            if result['written']:
+                stats.message('Done.')
+    except BaseException:
+        if isinstance(sink, str):
+            output.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if isinstance(sink, str):
+        output.close()
+    stats.summary()
+
+def _write_day_log(day, records, logs_path, documents, extractor, prefetch, csv_path, in_place, rewrite=False):
+    """Write the log for a single day directory.
+
+    Used by create_header_observing_logs, either directly or from a worker process. records is the day's 
+    catalog records, its fits files from the directory index, or None to glob the day directory. The log is 
+    written to logs_path if in_place, and otherwise handed back to be written to the sink.
+
+    Returns:
+        dict: The 'messages' for the day, the path, stage durations and messages of each of its 'files', the 
+        'durations' of the day's glob and write, whether the log was 'written', and the path and text of the 
+        'log' if it's still to be written (otherwise None).
+
+    """
+    result = {'messages': ['Accessing: ' + day], 'files': [], 'durations': {}, 'written': False, 'log': None}
+    #Get the year from the path, then check to make sure it's not the documents folder.
+    year = day.rsplit('/')[-2]
+    if year == documents:
+        return result
+    #gets the name of the date folder and assigns it to variable 'date'
+    date = day.rsplit('/',1)[1]
+    result['messages'].append('Looping through folder: ' + date)
+    #gets the logs_path, adds the date from previous line, and adds .txt file extention
+    log_name = _log_name(day, logs_path)
+    result['messages'].append('Creating: ' + log_name)
+    #checks that the file doesn't already exists
+    if in_place and not rewrite and os.path.exists(log_name) == True:
+        result['messages'].append(log_name + ' already exists. Starting back at the top.')
+        return result
+    result['messages'].append('Opening ' + log_name)
+    result['messages'].append('Wrote heading')
+    start = time.perf_counter()
+    items = glob.glob(day + '/*.fits') if records is None else records
+    result['durations']['glob'] = time.perf_counter() - start
+    if prefetch and items and isinstance(items[0], str):
+        items = _waited(prefetch_records(items, extractor.keys, prefetch), result['durations'])
+    #the rows are collected first, so the column widths can be worked out before the log is written
+    rows = []
+    for item in items:
+        path = item if isinstance(item, str) else item['path']
+        #gets the filename from the path 
+        filename = path.rsplit('/',1)[1]
+        #reads only the header cards we need. Files with a malformed header are read (and fixed) with astropy instead.
+        durations = {}
+        if isinstance(item, str):
+            start = time.perf_counter()
+            header = read_header(path, extractor.keys)[0]
+            durations['open'] = time.perf_counter() - start
+        elif item['error'] is not None:
+            raise OSError(item['error'] + ' | File: ' + path)
+        else:
+            header = item['header']
+        start = time.perf_counter()
+        #'unknown' for anything missing from the header
+        observation = extractor(header)
+        rows.append([filename] + [_or_unknown(observation[name]) for name in ['wavelength', 'date', 'time', 'chop_frequency', 'mode', 'airmass']])
+        durations['render'] = time.perf_counter() - start
+        result['files'].append((path, durations, ['Adding ' + path + ' to log.']))
+    #The log is written in one go, to a temporary file that's renamed into place, so an interrupted run 
+    #never leaves a partial log (which would then be skipped as already existing)
+    start = time.perf_counter()
+    if in_place:
+        text = format_log(rows)
+        if not (rewrite and _unchanged(log_name, text)):
+            atomic_write(log_name, text)
+    else:
+        result['log'] = (log_name, format_log(rows))
+    if csv_path is not None:
+        sidecar = io.StringIO()
+        writer = csv.writer(sidecar, lineterminator = '\n')
+        writer.writerow(LOG_COLUMNS)
+        writer.writerows(rows)
+        atomic_write(os.path.join(csv_path, year + '_' + date + '.csv'), sidecar.getvalue())
+    result['durations']['write'] = time.perf_counter() - start
+    result['written'] = True
+    return result
+
+def _log_name(day, logs_path):
+    """The path of the log for a day directory, ex. logs_path + '2003_05-06.txt'."""
+    year, date = day.rsplit('/')[-2:]
+    return str(logs_path + year + '_' + date + '.txt')
+
+def _unchanged(path, text):
+    #whether path already holds exactly text
+    try:
+        with open(path, 'r') as f:
+            return f.read() == text
+    except OSError:
+        return False
+
+def _waited(iterable, durations):
+    #the time spent waiting on the prefetched headers is counted as the open stage
+    durations['open'] = 0
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            durations['open'] += time.perf_counter() - start
+        yield item
+
+def format_log(rows, columns=LOG_COLUMNS):
+    """ Format Log
+
+    Line up the rows of a log in fixed-width columns, each as wide as its longest value.
+
+    Args:
+        rows (list): The rows of the log, each a list of strings.
+        columns (:obj:`list`, optional): The column headings. Defaults to LOG_COLUMNS.
+
+    Returns:
+        str: The heading and the rows, one per line, with the columns separated by at least two spaces.
+
+    """
+    widths = [len(column) for column in columns]
+    for row in rows:
+        for i, value in enumerate(row):
+            if len(value) > widths[i]:
+                widths[i] = len(value)
+    line = '  '.join('%-' + str(width) + 's' for width in widths)
+    return '\n'.join((line % tuple(row)).rstrip() for row in [columns] + rows)
+
+def _or_unknown(value):
+    return 'unknown' if value is None else value
 
 def create_logs_instructions():
     print("####--------About the variables------######\n# The header entries might have different key names in each collection, and so the keys are variables which you may change, however they have defaults set (ex. waveleng = 'WAVELENG').\n# *logs_path* is the path to where the logs should be saved. !!!Make sure there is a trailing slash!!! For example: /prvt/juno1/PDART_files/jup_supp.geminis_trecs/document/header_observing_logs/\n# *day_path* is the path to the day-level directories of the data in the form of '/prvt/juno1/PDART_files/bundle_name/data_raw/*/*'. The fits files should be in these day directories (the code below is set up for data in a directory with the format of '/path-to-bundle/data_raw/yyyy/mm-dd/filename.fits'). This path variable should go only as deep as the mm-dd subdirectory, with the year and date as wilcards, for example: 'prvt/juno1/PDART_files/jup_supp.geminis_trecs/data_raw/*/*' (NO TRAILING SLASH)\n# *documents* is the name of your documents folder (it should be in the path in logs_path)\n########--------End Variables--------#####")
@@ -1 +0,0 @@
-print('Ok, ready to create labels! Refer to the docs for all required and optional arguments.')
@@ -0,0 +1,290 @@
+import datetime
+import os
+from PDS_AREAL.utils.labeltemplate import compile_template, render
+from PDS_AREAL.utils.manifest import collection_file, load_manifest
+from PDS_AREAL.utils.pdsutils import atomic_write
+from PDS_AREAL.utils.validate import parse_time
+
+#template variables of the collection label
+COLLECTION_SLOTS = ['LID', 'TITLE', 'PRODUCT_AUTHOR_LIST', 'EDITOR_LIST', 'PUBLICATION_YEAR', 'DESCRIPTION', 'MODIFICATION_DATE',
+    'START_DATE_TIME', 'STOP_DATE_TIME', 'PROCESSING_LEVEL', 'PRODUCTS', 'WAVELENGTH_MIN', 'WAVELENGTH_MAX', 'WAVELENGTH_RANGE',
+    'INVESTIGATION_NAME', 'INVESTIGATION_TYPE', 'INVESTIGATION_LID', 'TARGET_NAME', 'TARGET_TYPE', 'TARGET_LID', 'COLLECTION_TYPE',
+    'INVENTORY_FILE_NAME', 'INVENTORY_FILE_SIZE', 'RECORDS']
+#template variables of the bundle label
+BUNDLE_SLOTS = [slot for slot in COLLECTION_SLOTS if slot not in ('COLLECTION_TYPE', 'INVENTORY_FILE_NAME', 'INVENTORY_FILE_SIZE',
+    'RECORDS')] + ['BUNDLE_MEMBER_ENTRIES']
+#the bundle's reference type for each kind of collection, by the start of the collection name. Anything else is data.
+MEMBER_TYPES = [
+    ('document', 'bundle_has_document_collection'),
+    ('calibration', 'bundle_has_calibration_collection'),
+    ('context', 'bundle_has_context_collection'),
+    ('xml_schema', 'bundle_has_schema_collection'),
+    ('browse', 'bundle_has_browse_collection'),
+    ('miscellaneous', 'bundle_has_member_collection'),
+]
+MEMBER_ENTRY = '''    <Bundle_Member_Entry>
+        <lid_reference>urn:nasa:pds:$LID$</lid_reference>
+        <member_status>Primary</member_status>
+        <reference_type>$REFERENCE_TYPE$</reference_type>
+    </Bundle_Member_Entry>'''
+
+def summarize_observations(entries):
+    """ Summarize Observations
+
+    Reduce the observation details that create_fits_labels records in the manifest to the fields a collection
+    or bundle label needs, in one pass, without reading any headers.
+
+    Args:
+        entries (iterable): Manifest entries (the values of manifest['files']), each with an 'observation'.
+
+    Returns:
+        dict: The number of 'products', the earliest 'start' and latest 'stop' date times as they appear in
+        the labels (None if no product has a valid one) and the lowest and highest wavelengths in
+        'wavelength_min' and 'wavelength_max' (None if no product has one). Products whose stop time is nil
+        count as stopping when they start.
+
+    """
+    products = 0
+    start = stop = None
+    wavelength_min = wavelength_max = None
+    for entry in entries:
+        products += 1
+        observation = entry['observation']
+        begins = parse_time(observation['start'])
+        if begins is not None and (start is None or begins < start[0]):
+            start = (begins, observation['start'])
+        ends = parse_time(observation['stop']) if observation['stop'] is not None else None
+        if ends is None and begins is not None:
+            ends = (begins, observation['start'])
+        elif ends is not None:
+            ends = (ends, observation['stop'])
+        if ends is not None and (stop is None or ends[0] > stop[0]):
+            stop = ends
+        try:
+            wavelength = float(observation['wavelength'])
+        except (TypeError, ValueError):
+            continue
+        if wavelength != wavelength:
+            continue
+        if wavelength_min is None or wavelength < wavelength_min:
+            wavelength_min = wavelength
+        if wavelength_max is None or wavelength > wavelength_max:
+            wavelength_max = wavelength
+    return {
+        'products': products,
+        'start': start[1] if start is not None else None,
+        'stop': stop[1] if stop is not None else None,
+        'wavelength_min': wavelength_min,
+        'wavelength_max': wavelength_max,
+    }
+
+def collection_entries(collection_path, manifest=None):
+    """ Collection Entries
+
+    Args:
+        collection_path (str): The collection directory, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw'
+        manifest (:obj:`str`, optional): The manifest create_fits_labels kept for the collection. Defaults to
+            the one next to the collection.
+
+    Returns:
+        dict: The manifest entry of each labeled file that's still in the collection, by its path relative to
+        the collection.
+
+    """
+    if manifest is None:
+        manifest = collection_file(collection_path, 'manifest.json')
+    #files removed since they were labeled are still in the manifest, but not in the collection
+    files = {relpath: entry for relpath, entry in load_manifest(manifest)['files'].items()
+        if os.path.exists(collection_path + '/' + relpath)}
+    if not files:
+        raise ValueError('No labels are recorded in ' + manifest + '. Run create_fits_labels on the collection first.')
+    missing = [relpath for relpath, entry in files.items() if 'observation' not in entry]
+    if missing:
+        raise ValueError(str(len(missing)) + ' files in ' + manifest + ' have no observation details recorded, ex. ' + missing[0] +
+            '. Make their labels again with create_fits_labels(..., rewrite = True) to record them.')
+    return files
+
+def inventory_records(inventory):
+    """ Inventory Records
+
+    Args:
+        inventory (str): The path to a CSV made by create_inventory.
+
+    Returns:
+        dict: The number of 'records' in the inventory, its 'file_size' in bytes and the 'lids' of its
+        products, without their versions.
+
+    """
+    records = 0
+    lids = set()
+    with open(inventory, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records += 1
+                lids.add(line.split(',', 1)[1].strip().split('::', 1)[0])
+    return {'records': records, 'file_size': os.path.getsize(inventory), 'lids': lids}
+
+def _check_inventory(files, inventory, lid, inventory_path):
+    #the inventory and the manifest have to list the same products, or the label's records would be wrong
+    lids = set('urn:nasa:pds:' + lid + ':' + os.path.basename(relpath).rsplit('.', 1)[0] for relpath in files)
+    unlabeled = inventory['lids'] - lids
+    uninventoried = lids - inventory['lids']
+    if unlabeled or uninventoried or inventory['records'] != len(files):
+        raise ValueError(inventory_path + ' has ' + str(inventory['records']) + ' records but ' + str(len(files)) +
+            ' labels are recorded for the collection (' + str(len(unlabeled)) + ' inventoried products without labels, ' +
+            str(len(uninventoried)) + ' labeled products not in the inventory). Make the inventory again, or the labels with rewrite = True.')
+
+def _wavelength(value):
+    return 'unknown' if value is None else '%g' % value
+
+def create_collection_label(collection_path, templatevar, bundle_name, title, product_author_list, description, processing_level, editor_list = 'Neakrase, Lynn; Huber, Lyle', publication_year = str(datetime.date.today().year), wavelength_range = 'Infrared', investigation_name = 'Jupiter Support Monitoring Observations', investigation_type = 'Observing Campaign', investigation_lid = 'observing_campaign.jupiter_support', target_name = 'Jupiter', target_type = 'Planet', target_lid = 'planet.jupiter', collection_type = 'Data', manifest = None, inventory = None):
+    """Create Collection Label
+
+    Create the collection_<bundle>_<collection>.xml label of a collection of fits files. The start and stop
+    times, the number of products and the wavelength coverage are worked out from the observation details
+    create_fits_labels records in the collection's manifest, so no headers are read, and the records and
+    size of the inventory are taken from the inventory made by create_inventory. The labels and the
+    inventory have to list the same products.
+
+    Args:
+        collection_path (str): The collection directory, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw'
+        templatevar (str): The absolute path to the label template. Ex. '/home/bblakley/scripts/pdart_collection_label.txt'
+        bundle_name (str): The name of the bundle directory. Ex. 'jup_supp.irtf_mirsi'
+        title (str): The title of the collection. Ex. 'NASA IRTF 3-Meter Telescope - MIRSI Raw Data Collection'
+        product_author_list (str): The authors of the observations, as for create_fits_labels.
+        description (str): A description of the collection. Ex. 'Ground Based FITS, raw data.'
+        processing_level (str): The processing level of the collection. Ex. 'Raw'
+        editor_list (:obj:`str`, optional): PDS editors. Defaults to 'Neakrase, Lynn; Huber, Lyle'.
+        publication_year (:obj:`str`, optional): Year that the bundle will be published to the PDS.
+            With no user input, defaults to this year (uses datetime).
+        wavelength_range (:obj:`str`, optional): Wavelength range of the observations. Defaults to 'Infrared'.
+        investigation_name (:obj:`str`, optional): Defaults to 'Jupiter Support Monitoring Observations'.
+        investigation_type (:obj:`str`, optional): Defaults to 'Observing Campaign'.
+        investigation_lid (:obj:`str`, optional): Defaults to 'observing_campaign.jupiter_support'.
+        target_name (:obj:`str`, optional): Defaults to 'Jupiter'.
+        target_type (:obj:`str`, optional): Defaults to 'Planet'.
+        target_lid (:obj:`str`, optional): Defaults to 'planet.jupiter'.
+        collection_type (:obj:`str`, optional): Defaults to 'Data'.
+        manifest (:obj:`str`, optional): The manifest create_fits_labels kept for the collection. Defaults to
+            the one next to the collection.
+        inventory (:obj:`str`, optional): The inventory. Defaults to the one create_inventory makes in the collection.
+
+    Returns:
+        str: The path of the label.
+
+    """
+    collection_path = collection_path.rstrip('/')
+    collection_name = os.path.basename(collection_path)
+    inventory_name = 'collection_' + bundle_name + '_' + collection_name + '_inventory.csv'
+    if inventory is None:
+        inventory = collection_path + '/' + inventory_name
+    lid = bundle_name + ':' + collection_name
+    files = collection_entries(collection_path, manifest)
+    records = inventory_records(inventory)
+    _check_inventory(files, records, lid, inventory)
+    summary = summarize_observations(files.values())
+    if summary['start'] is None:
+        raise ValueError('None of the labels in ' + collection_name + ' have a valid start_date_time.')
+    values = {
+        'LID': lid,
+        'TITLE': title,
+        'PRODUCT_AUTHOR_LIST': product_author_list,
+        'EDITOR_LIST': editor_list,
+        'PUBLICATION_YEAR': publication_year,
+        'DESCRIPTION': description,
+        'MODIFICATION_DATE': datetime.date.today().isoformat(),
+        'START_DATE_TIME': summary['start'],
+        'STOP_DATE_TIME': summary['stop'],
+        'PROCESSING_LEVEL': processing_level,
+        'PRODUCTS': str(summary['products']),
+        'WAVELENGTH_MIN': _wavelength(summary['wavelength_min']),
+        'WAVELENGTH_MAX': _wavelength(summary['wavelength_max']),
+        'WAVELENGTH_RANGE': wavelength_range,
+        'INVESTIGATION_NAME': investigation_name,
+        'INVESTIGATION_TYPE': investigation_type,
+        'INVESTIGATION_LID': investigation_lid,
+        'TARGET_NAME': target_name,
+        'TARGET_TYPE': target_type,
+        'TARGET_LID': target_lid,
+        'COLLECTION_TYPE': collection_type,
+        'INVENTORY_FILE_NAME': os.path.basename(inventory),
+        'INVENTORY_FILE_SIZE': str(records['file_size']),
+        'RECORDS': str(records['records']),
+    }
+    label_path = collection_path + '/collection_' + bundle_name + '_' + collection_name + '.xml'
+    atomic_write(label_path, render(compile_template(templatevar, COLLECTION_SLOTS), values))
+    print('Wrote ' + label_path + ' for ' + str(summary['products']) + ' products, ' + summary['start'] + ' to ' + summary['stop'])
+    return label_path
+
+def create_bundle_label(bundle_path, templatevar, title, product_author_list, description, processing_level, collections = None, editor_list = 'Neakrase, Lynn; Huber, Lyle', publication_year = str(datetime.date.today().year), wavelength_range = 'Infrared', investigation_name = 'Jupiter Support Monitoring Observations', investigation_type = 'Observing Campaign', investigation_lid = 'observing_campaign.jupiter_support', target_name = 'Jupiter', target_type = 'Planet', target_lid = 'planet.jupiter', bundle_name = None):
+    """Create Bundle Label
+
+    Create the bundle.xml label of a bundle, with a Bundle_Member_Entry for each collection. The start and
+    stop times, the number of products and the wavelength coverage span every collection with a manifest
+    from create_fits_labels (collections without one, such as the documents, are only listed as members).
+
+    Args:
+        bundle_path (str): The bundle directory, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi'
+        templatevar (str): The absolute path to the label template. Ex. '/home/bblakley/scripts/pdart_bundle_label.txt'
+        title (str): The title of the bundle. Ex. 'NASA IRTF 3-Meter Telescope - MIRSI Observations of Jupiter'
+        product_author_list (str): The authors of the observations, as for create_fits_labels.
+        description (str): A description of the bundle.
+        processing_level (str): The processing level of the bundle. Ex. 'Raw' or 'Derived'
+        collections (:obj:`list`, optional): The names of the collection directories in the bundle. Defaults to
+            every directory with an inventory from create_inventory, in name order.
+        editor_list, publication_year, wavelength_range, investigation_name, investigation_type,
+            investigation_lid, target_name, target_type, target_lid (:obj:`str`, optional): As for
+            create_collection_label.
+        bundle_name (:obj:`str`, optional): The name of the bundle. Defaults to the name of the bundle directory.
+
+    Returns:
+        str: The path of the label.
+
+    """
+    bundle_path = bundle_path.rstrip('/')
+    if bundle_name is None:
+        bundle_name = os.path.basename(bundle_path)
+    if collections is None:
+        collections = sorted(name for name in os.listdir(bundle_path) if
+            os.path.exists(bundle_path + '/' + name + '/collection_' + bundle_name + '_' + name + '_inventory.csv'))
+    if not collections:
+        raise ValueError('No collections with an inventory were found in ' + bundle_path + '. Run create_inventory on them first.')
+    entries = []
+    members = []
+    for name in collections:
+        manifest = collection_file(bundle_path + '/' + name, 'manifest.json')
+        if os.path.exists(manifest):
+            entries.extend(collection_entries(bundle_path + '/' + name, manifest).values())
+        reference_type = next((kind for prefix, kind in MEMBER_TYPES if name.startswith(prefix)), 'bundle_has_data_collection')
+        members.append(MEMBER_ENTRY.replace('$LID$', bundle_name + ':' + name).replace('$REFERENCE_TYPE$', reference_type))
+    summary = summarize_observations(entries)
+    if summary['start'] is None:
+        raise ValueError('None of the collections in ' + bundle_path + ' have labels with a valid start_date_time.')
+    values = {
+        'LID': bundle_name,
+        'TITLE': title,
+        'PRODUCT_AUTHOR_LIST': product_author_list,
+        'EDITOR_LIST': editor_list,
+        'PUBLICATION_YEAR': publication_year,
+        'DESCRIPTION': description,
+        'MODIFICATION_DATE': datetime.date.today().isoformat(),
+        'START_DATE_TIME': summary['start'],
+        'STOP_DATE_TIME': summary['stop'],
+        'PROCESSING_LEVEL': processing_level,
+        'PRODUCTS': str(summary['products']),
+        'WAVELENGTH_MIN': _wavelength(summary['wavelength_min']),
+        'WAVELENGTH_MAX': _wavelength(summary['wavelength_max']),
+        'WAVELENGTH_RANGE': wavelength_range,
+        'INVESTIGATION_NAME': investigation_name,
+        'INVESTIGATION_TYPE': investigation_type,
+        'INVESTIGATION_LID': investigation_lid,
+        'TARGET_NAME': target_name,
+        'TARGET_TYPE': target_type,
+        'TARGET_LID': target_lid,
+        'BUNDLE_MEMBER_ENTRIES': '\n'.join(members),
+    }
+    label_path = bundle_path + '/bundle.xml'
+    atomic_write(label_path, render(compile_template(templatevar, BUNDLE_SLOTS), values))
+    print('Wrote ' + label_path + ' for ' + str(len(collections)) + ' collections, ' + summary['start'] + ' to ' + summary['stop'])
+    return label_path
@@ -1,12 +1,36 @@
-from astropy.io import fits
+from PDS_AREAL.utils.fitsheader import BLOCK_SIZE, scan_hdus
+from PDS_AREAL.utils.arraystats import STATISTICS_SLOTS, array_statistics, statistics_values
+from PDS_AREAL.utils.dirindex import index_file, index_glob
+from PDS_AREAL.utils.catalog import check_catalog_keys, file_record, prefetch_records, read_catalog
+from PDS_AREAL.utils.labeltemplate import compile_template, prerender, render
+from PDS_AREAL.utils.manifest import collection_root, collection_file, load_manifest, save_manifest, hash_settings, manifest_entry, is_stale, file_md5, cached_md5, load_journal, start_journal, journal_done
+from PDS_AREAL.utils.profiles import Extractor, registered_keys, resolve_profile
+from PDS_AREAL.utils.pdsutils import atomic_write, bounded_map
+from PDS_AREAL.utils.progress import RunStats
+from PDS_AREAL.utils.sinks import open_sink
+from PDS_AREAL.utils.xmledits import escape
+from itertools import repeat
 import datetime
 import glob
 import os
-import math
-from stat import *
 import re
+from stat import *
+import time
+
+#primary header cards used to fill in a label, besides the ones the instrument profile reads
+IMAGE_KEYS = ['NAXIS1', 'NAXIS2']
+#the number of files sent to a worker process at a time
+FILES_PER_CHUNK = 16
+#template variables that change from file to file
+FILE_SLOTS = ['PRODUCT_ID', 'LID', 'DESCRIPTION', 'MODIFICATION_DATE', 'FILE_NAME', 'PRODUCT_CREATION_DATE', 'PRODUCT_STOP_TIME', 
+    'PROCESSING_LEVEL', 'PRIMARY_DESCRIPTION', 'FILE_SIZE', 'BYTES', 'LINE_SAMPLES', 'LINES', 'MD5_CHECKSUM', 'EXTENSION_AREAS', 
+    'ARRAY_SCALING']
+#PDS4 data type of each fits BITPIX
+BITPIX_TYPES = {8: 'UnsignedByte', 16: 'SignedMSB2', 32: 'SignedMSB4', 64: 'SignedMSB8', -32: 'IEEE754MSBSingle', -64: 'IEEE754MSBDouble'}
+#PDS4 array class and axis names for each number of axes, slowest axis first. Others are an Array with numbered axes.
+ARRAY_CLASSES = {1: ('Array_1D', ['Sample']), 2: ('Array_2D_Image', ['Line', 'Sample']), 3: ('Array_3D_Image', ['Band', 'Line', 'Sample'])}
 
-def create_fits_labels(pathvar, templatevar, collection_name, bundle_name, title, product_class, product_author_list, observing_system, telescope_name, telescope_lid, instrument_name, instrument_lid, document_lid, fits_desc, fits_prolvl, fits_primdesc, mu_desc = 'Ground Based FITS, emission angle adjustment for cylindrical map.', cmap_desc = 'Ground Based FITS, cylindrical map projection.', vdop_desc = 'Ground Based FITS, doppler shift adjustment for cylindrical map.', mu_prolvl = 'Derived', cmap_prolvl = 'Derived', vdop_prolvl = 'Derived', mu_primdesc = 'Cosine of the emission angle for each point on cylindrical map from the angle between the local zenith and direction of the Earth-based observer', cmap_primdesc = 'Projection onto linear cylindrical coordinate system longitude in System III along abscissa and planetocentric latitude in the ordinate', vdop_primdesc = 'Radial velocity of cylindrical map according to an Earth-based observer for CH4 emission interference at 7.9 microns with telluric CH4 absorption', extrablocks = 0, editor_list = 'Neakrase, Lynn; Huber, Lyle', publication_year = str(datetime.date.today().year), wavelength_range = 'Infrared', investigation_name = 'Jupiter Support Monitoring Observations', investigation_type = 'Observing Campaign', investigation_lid = 'observing_campaign.jupiter_support', observatory_name = 'NASA InfraRed Telescope Facility', observatory_lid = 'observatory.irtf-maunakea.3m2', target_name = 'Jupiter', target_type = 'Planet', target_lid = 'planet.jupiter', parsing_standard = 'FITS 3.0', header_description = 'The header contains information about how the image was collected and any processing that may have happened.', image_description = "The image shows Jupiter's atmosphere.", array_type = 'IEEE754MSBSingle', array_unit = 'DN', rewrite = False): 
+def create_fits_labels(pathvar, templatevar, collection_name, bundle_name, title, product_class, product_author_list, observing_system, telescope_name, telescope_lid, instrument_name, instrument_lid, document_lid, fits_desc, fits_prolvl, fits_primdesc, mu_desc = 'Ground Based FITS, emission angle adjustment for cylindrical map.', cmap_desc = 'Ground Based FITS, cylindrical map projection.', vdop_desc = 'Ground Based FITS, doppler shift adjustment for cylindrical map.', mu_prolvl = 'Derived', cmap_prolvl = 'Derived', vdop_prolvl = 'Derived', mu_primdesc = 'Cosine of the emission angle for each point on cylindrical map from the angle between the local zenith and direction of the Earth-based observer', cmap_primdesc = 'Projection onto linear cylindrical coordinate system longitude in System III along abscissa and planetocentric latitude in the ordinate', vdop_primdesc = 'Radial velocity of cylindrical map according to an Earth-based observer for CH4 emission interference at 7.9 microns with telluric CH4 absorption', extrablocks = None, editor_list = 'Neakrase, Lynn; Huber, Lyle', publication_year = str(datetime.date.today().year), wavelength_range = 'Infrared', investigation_name = 'Jupiter Support Monitoring Observations', investigation_type = 'Observing Campaign', investigation_lid = 'observing_campaign.jupiter_support', observatory_name = 'NASA InfraRed Telescope Facility', observatory_lid = 'observatory.irtf-maunakea.3m2', target_name = 'Jupiter', target_type = 'Planet', target_lid = 'planet.jupiter', parsing_standard = 'FITS 3.0', header_description = 'The header contains information about how the image was collected and any processing that may have happened.', image_description = "The image shows Jupiter's atmosphere.", array_type = 'IEEE754MSBSingle', array_unit = 'DN', rewrite = False, workers = None, manifest = None, catalog = None, reporter = 'print', prefetch = None, profile = None, md5 = False, statistics = False, index = None, sink = None, hdus = False): 
     """Create fits labels
     
     Create new (or overwrite existing) xml labels for fits files in data_raw, data_calibrated, or calibration collections.
@@ -69,8 +93,8 @@ def create_fits_labels(pathvar, templatevar, collection_name, bundle_name, title
             defaults to 'Radial velocity of cylindrical map according to an Earth-based observer for CH4 
             emission interference at 7.9 microns with telluric CH4 absorption'
         extrablocks (:obj:`int`, optional): Number of extra blocks to add to the offset size for the image. 
-            Default = 0. For most collections this can stay at default of 0, however for T-ReCS it must be 2 
-            (extrablocks = 2).
+            Default is None, which uses the instrument profile's value. That is 0 for every built-in profile; 
+            for T-ReCS it must be 2 (extrablocks = 2).
         editor_list (:obj:`str`, optional): PDS editors. Defaults to 'Neakrase, Lynn; Huber, Lyle'.
         publication_year (:obj:`str`, optional): Year that the bundle will be published to the PDS. 
             With no user input, defaults to this year (uses datetime).
@@ -95,175 +119,525 @@ def create_fits_labels(pathvar, templatevar, collection_name, bundle_name, title
             how the image was collected and any processing that may have happened.'
         image_description (:obj:`str`, optional): A brief description of the image itself. Since there are so 
             many you'll likely want to keep this standardized. Defaults to 'The image shows Jupiter's atmosphere.'
-        array_type (:obj:`str`, optional): Defaults to 'IEEE754MSBSingle'.
+        array_type (:obj:`str`, optional): Defaults to 'IEEE754MSBSingle'. With hdus = True, each image's type 
+            comes from its BITPIX instead.
         array_unit (:obj:`str`, optional): Defaults to 'DN'.
         rewrite (:obj:`bool`, optional): Default is False. This means that if you're running labels in a 
             collection and the code finds labels that already exist, it will skip those and only create labels 
             that don't already exist. If you wish to overwrite incorrect labels, set this to rewrite = True.
+            Set rewrite = 'stale' to only remake the labels whose fits file, header, template or arguments have 
+            changed since the label was made (according to the manifest, see below). After a template fix or a 
+            header correction, this skips every label that would come out the same.
+        workers (:obj:`int`, optional): Number of worker processes to spread the files across. Default is None,
+            which labels the files one at a time in this process. Each label is written by exactly the same code 
+            either way, so the output is identical to a serial run. When using workers from a script, call 
+            create_fits_labels from inside an ``if __name__ == '__main__':`` block.
+        manifest (:obj:`str`, optional): Path to the manifest, which records the size, mtime and header hash of 
+            each labeled file, and a hash of the template and arguments its label was made with. Defaults to a 
+            hidden file next to the collection, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/.data_raw.manifest.json'.
+        catalog (:obj:`str`, optional): Path to a catalog made by PDS_AREAL.utils.catalog.build_catalog. The files 
+            matching pathvar, their sizes and their headers are then taken from the catalog, and no fits file is 
+            opened. Default is None, which globs pathvar and reads each header.
+        reporter (:obj:`str`, optional): How to report progress. 'print' (the default) prints the messages for 
+            every file, 'progress' shows a progress bar instead, 'jsonl' writes a JSON line per file and 'quiet' 
+            prints nothing per file. Apart from 'quiet', a summary of throughput and of the time spent globbing, 
+            opening, rendering and writing is printed at the end. See PDS_AREAL.utils.progress.RunStats.
+        prefetch (:obj:`int`, optional): Number of headers to read ahead on background threads while labels are 
+            written, ex. prefetch = 32. On a network file system, where each open is a round trip to the server, 
+            this keeps that many reads in flight instead of one. The labels are still written in glob order. 
+            Default is None, which reads each header just before its label is written. Not used with workers or 
+            catalog, since each worker process reads its own files and a catalog needs no reads.
+        profile (:obj:`str` or :obj:`dict`, optional): The instrument profile, which says which header keys hold 
+            the observation date and times and what formats the dates are in. One of 'mirsi', 'trecs', 'comics', 
+            'mirlin', 'mirac' or 'default', or a profile registered with PDS_AREAL.utils.profiles.register_profile. 
+            Default is None, which detects the profile from the INSTRUME card of the first file, and falls back 
+            to 'default' (which accepts every key variant) if the instrument isn't recognized.
+        md5 (:obj:`bool`, optional): Set md5 = True to fill in the $MD5_CHECKSUM$ slot of the template with each 
+            file's md5 checksum, ex. with <md5_checksum>$MD5_CHECKSUM$</md5_checksum> after file_size in the File 
+            element. Files are read in 1 MiB chunks, by the workers if there are any, and the checksums are kept 
+            in the manifest, so a file that hasn't changed since its last checksum isn't read again. Default is 
+            False. A ValueError is raised if the template's $MD5_CHECKSUM$ slot and md5 don't agree.
+        statistics (:obj:`bool`, optional): Set statistics = True to fill in the $ARRAY_MINIMUM$, $ARRAY_MAXIMUM$, 
+            $ARRAY_MEAN$, $ARRAY_STANDARD_DEVIATION$ and $ARRAY_NAN_COUNT$ slots of the template with the statistics 
+            of each image, ex. with an Object_Statistics element after the last Axis_Array of Array_2D_Image:
+            <Object_Statistics><maximum>$ARRAY_MAXIMUM$</maximum><minimum>$ARRAY_MINIMUM$</minimum>
+            <mean>$ARRAY_MEAN$</mean><standard_deviation>$ARRAY_STANDARD_DEVIATION$</standard_deviation>
+            <description>$ARRAY_NAN_COUNT$ NaN values</description></Object_Statistics>. The data after the header 
+            offset is memory-mapped as array_type and reduced in chunks (see PDS_AREAL.utils.arraystats), so memory 
+            use stays the same for the largest cmap and vdop images. Needs numpy. Each file's md5 checksum is kept in 
+            the manifest as well, so a file whose data changed without changing its size or header is found stale. 
+            Default is False. A ValueError is raised if the template's statistics slots and statistics don't agree.
+        index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering pathvar. The 
+            files, whether their labels exist, and their sizes, mtimes and ctimes are then looked up in the index 
+            rather than globbing and stat'ing each file, which saves a round trip per file on a network file 
+            system. Default is None. Not needed with catalog.
+        sink (:obj:`str` or sink, optional): Where to write the labels. Default is None, which writes each label 
+            next to its fits file. A path ending in .tar, .tar.gz or .zip streams the labels into that archive 
+            instead, named from the bundle directory down, ex. for delivery, and a sink from PDS_AREAL.utils.sinks (ex. an ArchiveSink shared with the 
+            logs, or a MemorySink for a dry run) can also be passed in. Labels only count as existing if they're 
+            in the sink, and the manifest and journal are only kept for labels written next to their files.
+        hdus (:obj:`bool`, optional): Set hdus = True to walk every header-data unit of each file with 
+            PDS_AREAL.utils.fitsheader.scan_hdus (reading only the headers) instead of using extrablocks. $BYTES$, 
+            $LINES$ and $LINE_SAMPLES$ then describe the first 2-D image in the file wherever it is, and every HDU 
+            after it gets a Header element and (if it holds an image) an Array element in $EXTENSION_AREAS$, which 
+            goes after the template's Array_2D_Image, ex. '</Array_2D_Image>$EXTENSION_AREAS$'. The image's 
+            $ARRAY_TYPE$ comes from its BITPIX, and its BSCALE and BZERO fill $ARRAY_SCALING$ with scaling_factor and 
+            value_offset elements, ex. '<unit>$ARRAY_UNIT$</unit>$ARRAY_SCALING$'. Default is False. A ValueError 
+            is raised if the template has no $EXTENSION_AREAS$ or $ARRAY_SCALING$.
 
     """
     errors = ''
     error_count = 0
-    for path in glob.glob(pathvar):
+    #values that are the same for every label in the collection
+    values = {
+       'COLLECTION_NAME': collection_name,
+       'BUNDLE_NAME': bundle_name,
+       'TITLE': title,
+       'PRODUCT_CLASS': product_class,
+       'PRODUCT_AUTHOR_LIST': product_author_list,
+       'EDITOR_LIST': editor_list,
+       'PUBLICATION_YEAR': publication_year,
+       'REFERENCE_LID': bundle_name + ':document:' + document_lid,
+       'WAVELENGTH_RANGE': wavelength_range,
+       'INVESTIGATION_NAME': investigation_name,
+       'INVESTIGATION_TYPE': investigation_type,
+       'INVESTIGATION_LID': investigation_lid,
+       'OBSERVING_SYSTEM': observing_system,
+       'OBSERVATORY_NAME': observatory_name,
+       'OBSERVATORY_LID': observatory_lid,
+       'TELESCOPE_NAME': telescope_name,
+       'TELESCOPE_LID': telescope_lid,
+       'INSTRUMENT_NAME': instrument_name,
+       'INSTRUMENT_LID': instrument_lid,
+       'TARGET_NAME': target_name,
+       'TARGET_TYPE': target_type,
+       'TARGET_LID': target_lid,
+       'DOCUMENT_LID': document_lid,
+       'PARSING_STANDARD': parsing_standard,
+       'HEADER_DESCRIPTION': header_description,
+       'IMAGE_DESCRIPTION': image_description,
+       'ARRAY_TYPE': array_type,
+       'ARRAY_UNIT': array_unit,
+    }
+    #descriptions, processing levels and primary descriptions for each kind of file
+    kinds = {
+       'mu.fits': (mu_desc, mu_prolvl, mu_primdesc),
+       'cmap.fits': (cmap_desc, cmap_prolvl, cmap_primdesc),
+       'vdop.fits': (vdop_desc, vdop_prolvl, vdop_primdesc),
+       'fits': (fits_desc, fits_prolvl, fits_primdesc),
+    }
+    #the template is read once, and everything but the per-file values is filled in up front
+    template = compile_template(templatevar, list(values) + FILE_SLOTS + list(STATISTICS_SLOTS.values()))
+    if md5 != ('MD5_CHECKSUM' in template[1::2]):
+        if md5:
+            raise ValueError('md5 = True, but ' + templatevar + ' has no $MD5_CHECKSUM$ for the checksum.')
+        raise ValueError(templatevar + ' uses $MD5_CHECKSUM$. Set md5 = True to fill in the checksums.')
+    if statistics != any(slot in template[1::2] for slot in STATISTICS_SLOTS.values()):
+        if statistics:
+            raise ValueError('statistics = True, but ' + templatevar + ' has none of the slots for them: ' + 
+                ', '.join('$' + slot + '$' for slot in STATISTICS_SLOTS.values()))
+        raise ValueError(templatevar + ' uses array statistics slots. Set statistics = True to fill them in.')
+    if hdus and 'EXTENSION_AREAS' not in template[1::2]:
+        raise ValueError('hdus = True, but ' + templatevar + ' has no $EXTENSION_AREAS$ for the extensions.')
+    if hdus and 'ARRAY_SCALING' not in template[1::2]:
+        raise ValueError('hdus = True, but ' + templatevar + ' has no $ARRAY_SCALING$ for the image\'s BSCALE and BZERO.')
+    #with hdus, the image's type is read from each file
+    template = prerender(template, dict((name, value) for name, value in values.items() if not (hdus and name == 'ARRAY_TYPE')))
+    #the manifest records what each label was made from, so rewrite = 'stale' can skip unchanged files
+    root = collection_root(pathvar, collection_name)
+    if manifest is None:
+        manifest = collection_file(root, 'manifest.json')
+    records = load_manifest(manifest)
+    stats = RunStats(reporter)
+    #with a catalog, each file is a record of its stat and header rather than just a path
+    with stats.stage('glob'):
+        if catalog is not None:
+            #the catalog is checked before it's read, and again below once the profile's keys are known
+            check_catalog_keys(catalog, IMAGE_KEYS)
+            files = read_catalog(catalog, pathvar)
+        elif index is not None:
+            files = index_glob(index, pathvar)
+        else:
+            files = glob.glob(pathvar)
+    #the instrument profile is worked out once for the whole collection, from its first file
+    sample = None
+    if files:
+        sample = (file_record(files[0], registered_keys()) if catalog is None else files[0])['header']
+    profile = resolve_profile(profile, sample)
+    extractor = Extractor(profile)
+    if extrablocks is None:
+        extrablocks = profile['extrablocks']
+    keys = extractor.keys + IMAGE_KEYS
+    if catalog is not None:
+        check_catalog_keys(catalog, keys)
+    #with hdus, the offsets come from the files rather than from extrablocks
+    settings = hash_settings(template, kinds, 'hdus' if hdus else extrablocks, profile)
+    #the journal lists the labels finished so far, so an interrupted run picks up where it stopped
+    journal = collection_file(root, 'journal')
+    run_key = hash_settings(settings, pathvar, rewrite, md5, statistics)
+    #archive members are named from the bundle directory down
+    output = open_sink(sink, os.path.dirname(os.path.dirname(root)))
+    done = load_journal(journal, run_key) if output.in_place else {}
+    if done:
+        stats.message('Resuming an interrupted run, ' + str(len(done)) + ' labels were already written.')
+        records['files'].update(done)
+    paths = []
+    items = []
+    #the manifest entry of each file, for its cached checksum
+    entries = []
+    #the size, mtime and ctime of each file from the index, so it isn't stat'ed again
+    known = []
+    for item in files:
+        path = item if catalog is None else item['path']
+        relpath = os.path.relpath(path, root)
+        if relpath in done:
+            continue
+        entry = records['files'].get(relpath)
+        filestat = index_file(index, path) if index is not None and catalog is None else None
         if rewrite == False:
-            if os.path.exists(path.replace('.fits', '.xml')):
+            if _label_exists(path, index, output):
                 continue
-        template = open(templatevar, 'r')
-        filename = path.rsplit('/',1)[1]
-        print('Opening: ' + path)
+        elif rewrite == 'stale':
+            if catalog is not None:
+                size, mtime = item['size'], item['mtime']
+            elif filestat is not None:
+                size, mtime = filestat['size'], filestat['mtime']
+            else:
+                filestats = os.stat(path)
+                size, mtime = filestats.st_size, filestats.st_mtime_ns
+            if _label_exists(path, index, output) and not is_stale(entry, path, size, mtime, settings, md5, statistics):
+                continue
+        paths.append(path)
+        items.append(item)
+        entries.append(entry)
+        known.append(filestat)
+    stats.total = len(items)
+    pool = None
+    if workers:
+        #imported here since multiprocessing slows down importing this module for serial runs
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        #the workers are started by a fork server, since forking a process with threads (ex. the pipeline's) isn't safe
+        pool = ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context('forkserver'))
+        #the results come back in glob order, so the error log matches a serial run, and only a few chunks of 
+        #files are in flight at once, so memory doesn't grow with the collection
+        results = bounded_map(pool, _write_fits_label, [items, entries, known, repeat(template), repeat(values), repeat(kinds), 
+            repeat(extrablocks), repeat(settings), repeat(extractor), repeat(md5), repeat(statistics), repeat(hdus), repeat(output.in_place)], 
+            workers * 4, chunksize = FILES_PER_CHUNK)
+    else:
+        if prefetch and catalog is None:
+            #the time spent waiting on the prefetched headers is counted as the open stage
+            items = stats.timed(prefetch_records(items, keys, prefetch), 'open')
+        results = map(_write_fits_label, items, entries, known, repeat(template), repeat(values), repeat(kinds), repeat(extrablocks), 
+            repeat(settings), repeat(extractor), repeat(md5), repeat(statistics), repeat(hdus), repeat(output.in_place))
+    run_journal = start_journal(journal, run_key, resume = bool(done)) if paths and output.in_place else None
+    try:
+        for result in results:
+            if result['label'] is not None:
+                #the workers hand back the labels for sinks that aren't the archive tree, and they're written here in order
+                start = time.perf_counter()
+                output.write(result['path'].replace('.fits', '.xml'), result['label'])
+                result['durations']['write'] = time.perf_counter() - start
+            stats.file(result['path'], result['durations'], result['messages'], result['error'])
+            if result['error']:
+                errors += result['error']
+                error_count += 1
+                stats.count('errors')
+            else:
+                relpath = os.path.relpath(result['path'], root)
+                records['files'][relpath] = result['entry']
+                if run_journal is not None:
+                    journal_done(run_journal, relpath, result['entry'])
+                stats.count('labels written')
+    except BaseException:
+        if isinstance(sink, str):
+            output.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if run_journal is not None:
+            run_journal.close()
+    if isinstance(sink, str):
+        output.close()
+    if output.in_place:
+        if paths or done or rewrite == 'stale':
+            save_manifest(manifest, records)
+        #the run finished, so the manifest has everything the journal did
+        if os.path.exists(journal):
+            os.remove(journal)
+    #through the reporter, so quiet and JSON lines runs print nothing else
+    stats.message('****************\nCollection labels complete.\n****************')
+    if error_count == 0:
+        stats.message('No file errors were found!')
+    else:
+        stats.message('Error log:\nError count: ' + str(error_count) + ' \n ' + errors)
+    stats.summary()
+
+def _label_exists(path, index, output):
+    label = path.replace('.fits', '.xml')
+    if not output.in_place:
+        return output.exists(label)
+    if index is None:
+        return os.path.exists(label)
+    return index_file(index, label) is not None
+
+def _trim_seconds(obstime):
+    """Cut the fraction of a second in a 'Thh:mm:ss.ssss' time to at most 4 digits.
+
+    A time without a fraction, or no time at all, is returned as it is. Raises ValueError if the time
+    has no minutes and seconds.
+
+    """
+    if obstime == '':
+        return obstime
+    if ':' not in obstime:
+        raise ValueError('TIME FORMAT ERROR! ' + repr(obstime[1:]) + ' is not an hh:mm:ss time.')
+    seconds = obstime.rsplit(':',1)[1]
+    if '.' not in seconds:
+        return obstime
+    splitseconds = seconds.rsplit('.',1)[1]
+    while len(splitseconds) > 4:
+        splitseconds = splitseconds[:-1]
+    return obstime.rsplit('.',1)[0] + '.' + splitseconds
+
+def _write_fits_label(item, entry, filestat, template, values, kinds, extrablocks, settings, extractor, md5, statistics, hdus, in_place):
+    """Write the label for a single fits file.
+
+    Used by create_fits_labels, either directly or from a worker process. item is either the path to the 
+    file or its catalog record, entry is its manifest entry (or None), filestat is its size, mtime and ctime 
+    from the directory index (or None), and extractor is the collection's compiled instrument profile. The 
+    label is written next to the file if in_place, and otherwise handed back to be written to the sink.
+
+    Returns:
+        dict: The 'path' of the file, its 'error' record (None if the label was made), its manifest 'entry' 
+        (None if it wasn't), the 'label' if it wasn't written, the 'messages' to report for it and the 
+        'durations' of each stage in seconds.
+
+    """
+    messages = []
+    durations = {}
+    result = {'path': None, 'error': None, 'entry': None, 'label': None, 'messages': messages, 'durations': durations}
+    if isinstance(item, dict):
+        record = item
+    else:
+        messages.append('Opening: ' + item)
+        start = time.perf_counter()
+        record = file_record(item, extractor.keys + IMAGE_KEYS, filestat)
+        durations['open'] = time.perf_counter() - start
+    path = result['path'] = record['path']
+    filename = path.rsplit('/',1)[1]
+    if record['error'] is not None:
+        messages.append(record['error'])
+        messages.append('************\n!!!!!!!!!!!!!!\nSkipping  ' + path + '  due to error (see above)\n!!!!!!!!!!!!\n**************')
+        result['error'] = 'Error: ' + record['error'] + ' | File: ' + path + '\n'
+        return result
+    #a checksum from the manifest is reused as long as the file's size and mtime haven't changed. It's kept
+    #with statistics too, since they depend on the data and not just the header
+    checksum = cached_md5(entry, record['size'], record['mtime'])
+    if (md5 or statistics) and checksum is None:
+        start = time.perf_counter()
         try:
-            img = fits.open(path)
-            img[0].verify('fix')
-            hdr = img[0].header
+            checksum = file_md5(path)
         except OSError as e:
-            errors += 'Error: ' + str(e) + ' | File: ' + path + '\n'
-            error_count += 1
-            print(e)
-            print('************\n!!!!!!!!!!!!!!\nSkipping ', path, ' due to error (see above)\n!!!!!!!!!!!!\n**************')
-            continue
-        new_label = open(path.replace('.fits', '.xml'), 'w')
-        print('Writing label: ' + filename)
-        #prepare variables for filling in values below
-        #Prepare date and time for PRODUCT_CREATION_DATE
-        try:
-            obsdate = str(hdr['DATE-OBS'])
-        except KeyError:
-            try:
-                obsdate = str(hdr['DATEOBS'])
-            except KeyError:
-                try:
-                    obsdate = str(hdr['DATE_OBS'])
-                except KeyError:
-                    print('MISSING DATE! Check header key for observation date.')
-                    datenil = True
-                    obsdate = ''
-        if re.match("\d\d/\d\d/\d\d\d\d", obsdate):
-            yyyy = obsdate[6:]
-            mm = obsdate[0:2]
-            dd = obsdate[3:5]
-            datecoord = str(yyyy + '-' + mm + '-' + dd)
-        elif re.match("\d\d/\d\d/\d\d", obsdate):
-            yy = obsdate[6:]
-            mm = obsdate[0:2]
-            dd = obsdate[3:5]
-            if yy[0] == '9':
-                yyyy = '19' + yy
-            elif yy[0] == '0' or yy[0] == '1' or yy[0] == '2' or yy[0] == '3':
-                yyyy = '20' + yy
-            datecoord = str(yyyy + '-' + mm + '-' + dd)
-        elif re.match("\d\d\d\d\-\d\d\-\d\d", obsdate):
-            datecoord = str(obsdate)
-        elif obsdate == '':
-            datecoord = ''
-        else:
-            print('DATE FORMAT ERROR! Check header key for observation date.')
-            datenil = True
+            messages.append(str(e))
+            result['error'] = 'Error: ' + str(e) + ' | File: ' + path + '\n'
+            return result
+        durations['md5'] = time.perf_counter() - start
+    start = time.perf_counter()
+    hdr = record['header']
+    header_length = record['header_length']
+    messages.append('Writing label: ' + filename)
+    #prepare variables for filling in values below
+    observation = extractor(hdr)
+    #Prepare date and time for PRODUCT_CREATION_DATE
+    obsdate = observation['date']
+    if obsdate is None:
+        messages.append('MISSING DATE! Check header key for observation date.')
+        datecoord = ''
+    elif obsdate == '':
+        datecoord = ''
+    else:
+        datecoord = observation['iso_date']
+        if datecoord is None:
+            messages.append('DATE FORMAT ERROR! Check header key for observation date.')
             datecoord = ''
+    if observation['time'] is None:
+        messages.append('MISSING TIME! Check header key for observation start time.')
+        obstime = ''
+    else:
+        obstime = 'T' + observation['time']
+    try:
+        obstime = _trim_seconds(obstime)
+    except ValueError as e:
+        messages.append(str(e))
+        result['error'] = 'Error: ' + str(e) + ' | File: ' + path + '\n'
+        return result
+    timecoord = datecoord + obstime + 'Z'
+    #prepare date and time for PRODUCT_STOP_TIME
+    endtime = 'T' + observation['end'] if observation['end'] is not None else ''
+    endtimecoord = '>' + datecoord + endtime + 'Z'
+    #start_date_time and stop_date_time can't be the same, so check if they are, and if so, set the stop_date_time as nil
+    endtimenil = False
+    if endtimecoord == timecoord:
+        endtimenil = True
+    if endtimenil:
+        product_stop_time = ' xsi:nil="true" nilReason="unknown">'
+    else:
+        product_stop_time = endtimecoord
+    #prepare header offset for BYTES value
+    extension_areas = ''
+    array_type, array_scaling = values['ARRAY_TYPE'], ''
+    if hdus:
+        start = time.perf_counter()
         try:
-            obstime = 'T' + str(hdr['TIME-OBS'])
-        except KeyError:
-            try:
-                obstime = 'T' + str(hdr['TIME-STR'])
-            except KeyError:
-                try:
-                    obstime = 'T' + str(hdr['TIME_OBS'])
-                except KeyError:
-                    print('MISSING TIME! Check header key for observation start time.')
-                    obstime = ''
-        seconds = obstime.rsplit(':',1)[1]
-        splitseconds = seconds.rsplit('.',1)[1]
-        while len(splitseconds) > 4:
-            splitseconds = splitseconds[:-1]
-        obstime = obstime.rsplit('.',1)[0] + '.' + splitseconds
-        timecoord = datecoord + obstime + 'Z'
-        #prepare date and time for PRODUCT_STOP_TIME
+            image, extension_areas = _extension_areas(path, record['size'], values)
+        except (OSError, ValueError) as e:
+            messages.append(str(e))
+            result['error'] = 'Error: ' + str(e) + ' | File: ' + path + '\n'
+            return result
+        offsetbytes = image['data_offset']
+        lines, line_samples = image['header']['NAXIS2'], image['header']['NAXIS1']
+        array_type, array_scaling = BITPIX_TYPES[image['header']['BITPIX']], _scaling(image['header'])
+        durations['scan'] = time.perf_counter() - start
+    else:
+        lines, line_samples = hdr['NAXIS2'], hdr['NAXIS1']
+        hdrblocks = header_length // BLOCK_SIZE #number of logical blocks
+        hdrblocks = hdrblocks + extrablocks #accounts for additional header blocks that can't be read from the primary header
+        offsetbytes = hdrblocks * BLOCK_SIZE #offset bytes from the header to the array
+    #dictionaries
+    if filename[-7:] == 'mu.fits':
+        key = 'mu.fits'
+    elif filename[-9:] == 'cmap.fits':
+        key = 'cmap.fits'
+    elif filename[-9:] == 'vdop.fits':
+        key = "vdop.fits"
+    elif filename[-5:] == '.fits':
+        key = "fits"
+    else:
+        messages.append('Filename extension error. Not a fits file. Description may be missing in label.')
+        key = None
+    desc, prolvl, primdesc = kinds.get(key, (None, None, None))
+    val = {
+       'PRODUCT_ID': filename.rsplit('.',1)[0],
+       'LID': values['BUNDLE_NAME'] + ':' + values['COLLECTION_NAME'] + ':' + filename.rsplit('.',1)[0],
+       'DESCRIPTION': desc,
+       'MODIFICATION_DATE': datetime.date.fromtimestamp(record['ctime']).isoformat(),
+       'FILE_NAME': filename,
+       'PRODUCT_CREATION_DATE': timecoord,
+       'PRODUCT_STOP_TIME': product_stop_time,
+       'PROCESSING_LEVEL': prolvl,
+       'PRIMARY_DESCRIPTION': primdesc,
+       'FILE_SIZE': str(record['size'] - offsetbytes),
+       'BYTES': str(offsetbytes),
+       'LINE_SAMPLES': str(line_samples),
+       'LINES': str(lines),
+       'MD5_CHECKSUM': checksum,
+       'EXTENSION_AREAS': extension_areas,
+       'ARRAY_TYPE': array_type,
+       'ARRAY_SCALING': array_scaling,
+    }
+    durations['render'] = time.perf_counter() - start
+    if statistics:
+        start = time.perf_counter()
         try:
-            endtime = 'T' + str(hdr['TIME-END'])
-        except KeyError:
-            endtime = ''
-            endtimenil = True
-        endtimecoord = '>' + datecoord + endtime + 'Z'
-        #start_date_time and stop_date_time can't be the same, so check if they are, and if so, set the stop_date_time as nil
-        endtimenil = False
-        if endtimecoord == timecoord:
-            endtimenil = True
-        if endtimenil:
-            product_stop_time = ' xsi:nil="true" nilReason="unknown">'
-        else:
-            product_stop_time = endtimecoord
-        #prepare header offset for BYTES value
-        headerlen = len(hdr) #number of lines in the header
-        numbercards = headerlen/36 #number of 80-byte cards
-        hdrblocks = math.ceil(numbercards) #number of logical blocks
-        hdrblocks = hdrblocks + extrablocks #accounts for additional header blocks that can't be read by astropy
-        offsetbytes = str(hdrblocks * 2880) #offset bytes from the header to the array
-        #dictionaries
-        if filename[-7:] == 'mu.fits':
-            key = 'mu.fits'
-        elif filename[-9:] == 'cmap.fits':
-            key = 'cmap.fits'
-        elif filename[-9:] == 'vdop.fits':
-            key = "vdop.fits"
-        elif filename[-5:] == '.fits':
-            key = "fits"
-        else:
-            print('Filename extension error. Not a fits file. Description may be missing in label.')
-        desc = {"mu.fits": mu_desc, "cmap.fits": cmap_desc, "vdop.fits": vdop_desc, "fits": fits_desc}
-        prolvl = {"mu.fits": mu_prolvl, "cmap.fits": cmap_prolvl, "vdop.fits": vdop_prolvl, "fits": fits_prolvl}
-        primdesc = {"mu.fits": mu_primdesc, "cmap.fits": cmap_primdesc, "vdop.fits": vdop_primdesc, "fits": fits_primdesc}
-        for line in template:
-            if '$' not in line:
-                new_label.write(line)
-            else:
-                var = line[line.find('$')+1:line.rfind('$')]
-                val = {
-                   'PRODUCT_ID': filename.rsplit('.',1)[0],
-                   'LID': bundle_name + ':' + collection_name + ':' + filename.rsplit('.',1)[0],
-                   'COLLECTION_NAME': collection_name,
-                   'BUNDLE_NAME': bundle_name,
-                   'TITLE': title,
-                   'PRODUCT_CLASS': product_class,
-                   'PRODUCT_AUTHOR_LIST': product_author_list,
-                   'EDITOR_LIST': editor_list,
-                   'PUBLICATION_YEAR': publication_year,
-                   'DESCRIPTION':  desc.get(key),
-                   'MODIFICATION_DATE': datetime.date.fromtimestamp(os.path.getctime(path)).isoformat(),
-                   'FILE_NAME': filename,
-                   'REFERENCE_LID': bundle_name + ':document:' + document_lid,
-                   'PRODUCT_CREATION_DATE': timecoord,
-                   'PRODUCT_STOP_TIME': product_stop_time,
-                   'PROCESSING_LEVEL': prolvl.get(key),
-                   'PRIMARY_DESCRIPTION': primdesc.get(key),
-                   'WAVELENGTH_RANGE': wavelength_range,
-                   'INVESTIGATION_NAME': investigation_name,
-                   'INVESTIGATION_TYPE': investigation_type,
-                   'INVESTIGATION_LID': investigation_lid,
-                   'OBSERVING_SYSTEM': observing_system,
-                   'OBSERVATORY_NAME': observatory_name,
-                   'OBSERVATORY_LID': observatory_lid,
-                   'TELESCOPE_NAME': telescope_name,
-                   'TELESCOPE_LID': telescope_lid,
-                   'INSTRUMENT_NAME': instrument_name,
-                   'INSTRUMENT_LID': instrument_lid,
-                   'TARGET_NAME': target_name,
-                   'TARGET_TYPE': target_type,
-                   'TARGET_LID': target_lid,
-                   'DOCUMENT_LID': document_lid,
-                   'FILE_SIZE': str(os.path.getsize(path) - offsetbytes),
-                   'PARSING_STANDARD': parsing_standard,
-                   'HEADER_DESCRIPTION': header_description,
-                   'IMAGE_DESCRIPTION': image_description,
-                   'ARRAY_TYPE': array_type,
-                   'ARRAY_UNIT': array_unit,
-                   'BYTES': offsetbytes,
-                   'LINE_SAMPLES': str(hdr['NAXIS1']),
-                   'LINES': str(hdr['NAXIS2']),
-                }[var]
-                new_label.write(line.replace('$' + var + '$', val))
-        template.close()
-        new_label.close()
-    print('****************\nCollection labels complete.\n****************')
-    if error_count == 0:
-        print('No file errors were found!')
+            val.update(statistics_values(array_statistics(path, offsetbytes, (lines, line_samples), array_type)))
+        except (OSError, ValueError) as e:
+            messages.append(str(e))
+            result['error'] = 'Error: ' + str(e) + ' | File: ' + path + '\n'
+            return result
+        durations['statistics'] = time.perf_counter() - start
+    start = time.perf_counter()
+    label = render(template, val)
+    durations['render'] += time.perf_counter() - start
+    if in_place:
+        start = time.perf_counter()
+        #written to a temporary file and renamed, so an interrupted run never leaves a truncated label
+        atomic_write(path.replace('.fits', '.xml'), label)
+        durations['write'] = time.perf_counter() - start
     else:
-        print('Error log:\nError count:', error_count, '\n', errors)
+        result['label'] = label
+    summary = {'start': timecoord, 'stop': None if endtimenil else endtimecoord[1:], 'wavelength': observation['wavelength']}
+    result['entry'] = manifest_entry(record['size'], record['mtime'], record['header_hash'], settings, checksum, summary)
+    return result
+
+def _extension_areas(path, size, values):
+    """Find the first 2-D image of a fits file, and describe each HDU after it.
+
+    Returns:
+        tuple: The scan_hdus entry of the image, and the Header and Array elements of the HDUs after it for 
+        $EXTENSION_AREAS$.
+
+    Raises:
+        ValueError: If the file has no 2-D image, has data before it (which the label's Header would 
+            cover), has an image with an unknown BITPIX or is shorter than its headers say.
+
+    """
+    hdus = scan_hdus(path)
+    last = hdus[-1]
+    if last['data_offset'] + last['data_size'] > size:
+        raise ValueError('HDU ' + str(len(hdus) - 1) + ' runs past the end of the file, which is ' + str(size) + ' bytes')
+    image = None
+    for number, hdu in enumerate(hdus):
+        header = hdu['header']
+        if header.get('XTENSION', 'IMAGE').strip() == 'IMAGE' and header.get('NAXIS') == 2 and hdu['data_size']:
+            image = number
+            break
+        if hdu['data_size']:
+            raise ValueError('HDU ' + str(number) + ' has data before the first 2-D image. Label this file by hand.')
+    if image is None:
+        raise ValueError('No 2-D image found in ' + str(len(hdus)) + ' HDUs.')
+    for number in range(image, len(hdus)):
+        header = hdus[number]['header']
+        if header.get('XTENSION', 'IMAGE').strip() == 'IMAGE' and hdus[number]['data_size'] and header.get('BITPIX') not in BITPIX_TYPES:
+            raise ValueError('HDU ' + str(number) + ' has an unknown BITPIX: ' + repr(header.get('BITPIX')))
+    #local identifiers have to be unique in the label, and the template's image is 'Image'
+    identifiers = {'Image'}
+    areas = []
+    for number in range(image + 1, len(hdus)):
+        hdu = hdus[number]
+        header = hdu['header']
+        name = escape(str(header.get('EXTNAME') or 'HDU_' + str(number)))
+        kind = escape(str(header.get('XTENSION', '')).strip())
+        identifier = _local_identifier(header.get('EXTNAME'), number, identifiers)
+        areas.append('\n  <Header>\n   <local_identifier>' + identifier + '_Header</local_identifier>\n   <offset unit="byte">' + 
+            str(hdu['header_offset']) + '</offset>\n   <object_length unit="byte">' + str(hdu['header_length']) + 
+            '</object_length>\n   <parsing_standard_id>' + values['PARSING_STANDARD'] + '</parsing_standard_id>\n' + 
+            '   <description>Header of extension ' + str(number) + ', ' + kind + ' ' + name + '.</description>\n  </Header>')
+        if kind != 'IMAGE' or not hdu['data_size']:
+            #tables and empty extensions are only described by their headers
+            continue
+        naxis = header['NAXIS']
+        array_class, axis_names = ARRAY_CLASSES.get(naxis, ('Array', ['Axis_' + str(n) for n in range(1, naxis + 1)]))
+        element = ('     <data_type>' + BITPIX_TYPES[header['BITPIX']] + '</data_type>\n     <unit>' + values['ARRAY_UNIT'] + 
+            '</unit>' + _scaling(header) + '\n')
+        #fits lists the fastest axis first, and PDS4 the slowest
+        axes = ''.join('   <Axis_Array>\n    <axis_name>' + axis_name + '</axis_name>\n    <elements>' + 
+            str(header['NAXIS' + str(naxis - n)]) + '</elements>\n    <sequence_number>' + str(n + 1) + 
+            '</sequence_number>\n   </Axis_Array>\n' for n, axis_name in enumerate(axis_names))
+        areas.append('\n  <' + array_class + '>\n   <local_identifier>' + identifier + '</local_identifier>\n   <offset unit="byte">' + 
+            str(hdu['data_offset']) + '</offset>\n   <axes>' + str(naxis) + '</axes>\n   <axis_index_order>Last Index Fastest' + 
+            '</axis_index_order>\n   <description>Data of extension ' + str(number) + ', ' + name + '.</description>\n' + 
+            '   <Element_Array>\n' + element + '   </Element_Array>\n' + axes + '  </' + array_class + '>')
+    return hdus[image], ''.join(areas)
+
+def _local_identifier(extname, number, identifiers):
+    #EXTNAME with anything but letters, digits, _, . and - replaced, starting with a letter and not used yet
+    identifier = re.sub(r'[^A-Za-z0-9_.-]', '_', str(extname or '').strip())
+    if not re.match(r'[A-Za-z]', identifier):
+        identifier = 'HDU_' + str(number) + ('_' + identifier if identifier else '')
+    if identifier in identifiers or identifier + '_Header' in identifiers:
+        identifier = identifier + '_' + str(number)
+    while identifier in identifiers or identifier + '_Header' in identifiers:
+        identifier = identifier + '_'
+    identifiers.update([identifier, identifier + '_Header'])
+    return identifier
+
+def _scaling(header):
+    #the scaling_factor and value_offset of an image's Element_Array, from its BSCALE and BZERO
+    scaling = ''
+    if header.get('BSCALE', 1) != 1:
+        scaling += '\n     <scaling_factor>' + repr(header['BSCALE']) + '</scaling_factor>'
+    if header.get('BZERO', 0) != 0:
+        scaling += '\n     <value_offset>' + repr(header['BZERO']) + '</value_offset>'
+    return scaling
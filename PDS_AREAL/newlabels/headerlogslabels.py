@@ -1,8 +1,17 @@
 import datetime
 import glob
 import os
+from PDS_AREAL.utils.dirindex import index_file, index_glob
+from PDS_AREAL.utils.labeltemplate import compile_template, prerender, render
+from PDS_AREAL.utils.manifest import collection_root
+from PDS_AREAL.utils.progress import RunStats
+from PDS_AREAL.utils.sinks import open_sink
+import time
 
-def create_header_observing_labels(pathvar, templatevar, collection_name, bundle_name, bundle_title, product_author_list, instrument_lid, editor_list = 'Neakrase, Lynn; Huber, Lyle', publication_year = str(datetime.date.today().year), keyword = 'Jupiter', description = 'Observing log produced from FITS image headers'): 
+#template variables that change from file to file
+FILE_SLOTS = ['LID', 'MODIFICATION_DATE', 'FILE_NAME', 'CREATION_DTIME', 'LOCAL_ID']
+
+def create_header_observing_labels(pathvar, templatevar, collection_name, bundle_name, bundle_title, product_author_list, instrument_lid, editor_list = 'Neakrase, Lynn; Huber, Lyle', publication_year = str(datetime.date.today().year), keyword = 'Jupiter', description = 'Observing log produced from FITS image headers', reporter = 'print', index = None, sink = None, rewrite = False): 
     """Create Header Observing Logs Labels
     
     Create new xml labels for .txt observing logs (created from the FITS headers) in the documents collection.
@@ -28,35 +37,87 @@ def create_header_observing_labels(pathvar, templatevar, collection_name, bundle
         keyword (:obj:`str`, optional): The target of these observations. Defaults to 'Jupiter'.
         description (:obj:`str`, optional): A description for the logs label. 
             Defaults to 'Observing log produced from FITS image headers'.
+        reporter (:obj:`str`, optional): How to report progress. 'print' (the default) prints a message for 
+            every label, 'progress' shows a progress bar instead, 'jsonl' writes a JSON line per label and 
+            'quiet' prints nothing per label. Apart from 'quiet', a summary of throughput and of the time spent 
+            globbing, rendering and writing is printed at the end. See PDS_AREAL.utils.progress.RunStats.
+        index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering pathvar. The 
+            logs, whether their labels exist and their ctimes and mtimes are then looked up in the index rather 
+            than globbing and stat'ing each log. Default is None.
+        sink (:obj:`str` or sink, optional): Where to write the labels. Default is None, which writes each label 
+            next to its log. A path ending in .tar, .tar.gz or .zip streams the labels into that archive instead, 
+            named from the bundle directory down, and a sink from PDS_AREAL.utils.sinks can also be passed in. Labels only count as existing if they're 
+            in the sink.
+        rewrite (:obj:`bool` or :obj:`str`, optional): Default is False, which only labels logs that have no 
+            label. Set to True to label every log again, or to 'stale' to also relabel logs that were modified 
+            after their labels were written, ex. by create_header_observing_logs(..., rewrite = True), so the 
+            labels' dates describe the logs as they are now. With a sink that isn't next to the logs, 'stale' 
+            only labels logs that aren't in the sink.
 
     """
-    for path in glob.glob(pathvar):
-        if os.path.exists(path.replace('.txt', '.xml')):
-            continue
-        template = open(templatevar, 'r')
-        filename = path.rsplit('/',1)[1]
-        new_label = open(path.replace('.txt', '.xml'), 'w')
-        print('Writing label: ' + filename)
-        for line in template:
-            if '$' not in line:
-                new_label.write(line)
+    #values that are the same for every label
+    values = {
+       'TITLE': bundle_title + 'Observing Log',
+       'PRODUCT_AUTHOR_LIST': product_author_list,
+       'EDITOR_LIST': editor_list,
+       'PUBLICATION_YEAR': publication_year,
+       'KEYWORD': keyword,
+       'DESCRIPTION':  description,
+       'INSTRUMENT_LID': instrument_lid,
+    }
+    #the template is read once, and everything but the per-file values is filled in up front
+    template = compile_template(templatevar, list(values) + FILE_SLOTS)
+    template = prerender(template, values)
+    stats = RunStats(reporter)
+    #archive members are named from the bundle directory down
+    output = open_sink(sink, os.path.dirname(os.path.dirname(collection_root(pathvar, collection_name))))
+    with stats.stage('glob'):
+        paths = [path for path in (glob.glob(pathvar) if index is None else index_glob(index, pathvar)) 
+            if _needs_label(path, index, output, rewrite)]
+    stats.total = len(paths)
+    try:
+        for path in paths:
+            filename = path.rsplit('/',1)[1]
+            start = time.perf_counter()
+            if index is None:
+                filestats = os.stat(path)
+                ctime, mtime = filestats.st_ctime, filestats.st_mtime
             else:
-                var = line[line.find('$')+1:line.rfind('$')]
-                val = {
-                   'LID': bundle_name + ':' + collection_name + ':' + filename,
-                   'TITLE': bundle_title + 'Observing Log',
-                   'PRODUCT_AUTHOR_LIST': product_author_list,
-                   'EDITOR_LIST': editor_list,
-                   'PUBLICATION_YEAR': publication_year,
-                   'KEYWORD': keyword,
-                   'DESCRIPTION':  description,
-                   'MODIFICATION_DATE': datetime.date.fromtimestamp(os.path.getctime(path)).isoformat(),
-                   'INSTRUMENT_LID': instrument_lid,
-                   'FILE_NAME': filename,
-                   'CREATION_DTIME': datetime.datetime.utcfromtimestamp(int(os.path.getmtime(path))).strftime('%Y-%m-%dT%H:%M:%SZ'),
-                   'LOCAL_ID': filename.rsplit('.',1)[0],
-                }[var]
-                new_label.write(line.replace('$' + var + '$', val))
-        template.close()
-        new_label.close()
-    print('****************\nHeader logs labels complete.\n****************')
+                filestat = index_file(index, path)
+                ctime, mtime = filestat['ctime'], filestat['mtime'] / 1e9
+            label = render(template, {
+               'LID': bundle_name + ':' + collection_name + ':' + filename,
+               'MODIFICATION_DATE': datetime.date.fromtimestamp(ctime).isoformat(),
+               'FILE_NAME': filename,
+               'CREATION_DTIME': datetime.datetime.utcfromtimestamp(int(mtime)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+               'LOCAL_ID': filename.rsplit('.',1)[0],
+            })
+            durations = {'render': time.perf_counter() - start}
+            start = time.perf_counter()
+            output.write(path.replace('.txt', '.xml'), label)
+            durations['write'] = time.perf_counter() - start
+            stats.file(path, durations, ['Writing label: ' + filename])
+    except BaseException:
+        if isinstance(sink, str):
+            output.abort()
+        raise
+    if isinstance(sink, str):
+        output.close()
+    stats.message('****************\nHeader logs labels complete.\n****************')
+    stats.summary()
+
+def _needs_label(path, index, output, rewrite):
+    #whether the log at path has no label, or (with rewrite = 'stale') one older than the log
+    label = path.replace('.txt', '.xml')
+    if rewrite == True:
+        return True
+    if not output.in_place:
+        return not output.exists(label)
+    if index is None:
+        if not os.path.exists(label):
+            return True
+        return rewrite == 'stale' and os.stat(path).st_mtime_ns > os.stat(label).st_mtime_ns
+    labelstat = index_file(index, label)
+    if labelstat is None:
+        return True
+    return rewrite == 'stale' and index_file(index, path)['mtime'] > labelstat['mtime']
@@ -0,0 +1,280 @@
+"""Bundle pipeline
+
+Build a whole bundle with one command: catalog each collection, write the header observing logs and
+their labels, label the fits files and write every inventory. The stages run as a dependency graph, so
+stages that don't depend on each other (ex. two collections, or the labels and the inventory of one
+collection) run at the same time, and each collection's headers are read once into a catalog that every
+later stage shares.
+
+Run it with ``pds-areal-bundle bundle.json`` (or ``python -m PDS_AREAL.pipeline bundle.json``), where
+bundle.json looks like::
+
+    {
+        "bundle_path": "/prvt/juno1/PDART_files/jup_supp.irtf_mirsi",
+        "workers": 4,
+        "labels": {
+            "templatevar": "/home/bblakley/scripts/pdart_fits_label.txt",
+            "title": "NASA IRTF 3-Meter Telescope - MIRSI Observation",
+            "product_class": "Product_Observational",
+            "product_author_list": "Orton, Glenn",
+            ...
+        },
+        "collections": {
+            "data_raw": {"labels": {"fits_desc": "Ground Based FITS, raw data.", "fits_prolvl": "Raw", "fits_primdesc": "Raw data"}},
+            "data_calibrated": {"labels": {...}, "inventory": {"sort": true}}
+        },
+        "logs": {
+            "collection": "data_raw",
+            "labels": {"templatevar": "/home/bblakley/scripts/pdart_logs_label.txt", "bundle_title": "...", ...}
+        }
+    }
+
+"labels" at the top holds the create_fits_labels arguments shared by every collection, and each
+collection's "labels" adds to or overrides them. pathvar, collection_name, bundle_name and catalog are
+filled in by the pipeline. A collection's "inventory" holds extra create_inventory arguments, or is false
+to skip its inventory, and "validate": true checks its labels and inventory afterwards with
+PDS_AREAL.utils.validate, saving the report next to the collection. "logs" is optional: its "options" are passed to create_header_observing_logs and
+its "labels" to create_header_observing_labels, and the documents collection ("documents", default
+'document') gets an inventory of the logs. "collection_label" at the top holds the create_collection_label
+arguments shared by every collection, which each collection's "collection_label" adds to (or is false to
+skip), and "bundle_label" holds the create_bundle_label arguments. Both are optional and are made once the
+labels and inventories they summarize are done. Relative paths are taken from the directory of the config file.
+
+Rerunning the pipeline brings the bundle up to date with its files: the fits labels and the log labels
+default to rewrite = 'stale', and the logs and inventories default to rewrite = True.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+import os
+import sys
+import time
+from PDS_AREAL.utils.catalog import build_catalog
+from PDS_AREAL.utils.manifest import collection_file
+
+def load_config(config_path):
+    """Load Config
+
+    Args:
+        config_path (str): The path to a bundle config file (see the top of this module).
+
+    Returns:
+        dict: The config, with relative template paths made absolute.
+
+    """
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(config_path))
+    config['bundle_path'] = os.path.join(base, config['bundle_path'])
+    for labels in [config.get('labels'), config.get('logs', {}).get('labels'), config.get('collection_label'), config.get('bundle_label')] + [
+            collection.get(key) for collection in config.get('collections', {}).values() for key in ('labels', 'collection_label')]:
+        if labels and 'templatevar' in labels:
+            labels['templatevar'] = os.path.join(base, labels['templatevar'])
+    return config
+
+def bundle_stages(config):
+    """Bundle Stages
+
+    Turn a bundle config into the stages that build it.
+
+    Args:
+        config (dict): A bundle config (see the top of this module).
+
+    Returns:
+        dict: For each stage name, ex. 'labels:data_raw', a tuple of the names of the stages it depends on
+        and a function that runs it.
+
+    """
+    #imported here so the command line starts up quickly, ex. for --help
+    from PDS_AREAL.create.createinventory import create_inventory
+    from PDS_AREAL.create.createlogs import create_header_observing_logs
+    from PDS_AREAL.newlabels.collectionlabels import create_bundle_label, create_collection_label
+    from PDS_AREAL.newlabels.fitslabels import create_fits_labels
+    from PDS_AREAL.newlabels.headerlogslabels import create_header_observing_labels
+    bundle_path = config['bundle_path'].rstrip('/')
+    bundle_name = config.get('bundle_name', os.path.basename(bundle_path))
+    reporter = config.get('reporter', 'quiet')
+    use_catalog = config.get('catalog', True)
+    stages = {}
+    catalogs = {}
+    for name, collection in config.get('collections', {}).items():
+        collection_path = bundle_path + '/' + name
+        data_path = collection_path + '/*/*/*.fits'
+        catalog = None
+        after = ()
+        if use_catalog:
+            #every later stage of this collection reads its file list and headers from here
+            catalog = catalogs[name] = collection_file(collection_path, 'catalog.sqlite')
+            stages['catalog:' + name] = ((), _call(build_catalog, data_path, catalog, print_status = reporter == 'print'))
+            after = ('catalog:' + name,)
+        labels = dict(config.get('labels', {}))
+        labels.update(collection.get('labels', {}))
+        labels.setdefault('reporter', reporter)
+        #a rerun relabels the files that changed since the last one, so the bundle converges on its files
+        labels.setdefault('rewrite', 'stale')
+        stages['labels:' + name] = (after, _call(create_fits_labels, data_path, collection_name = name,
+            bundle_name = bundle_name, catalog = catalog, **labels))
+        inventory = collection.get('inventory', {})
+        if inventory is not False:
+            inventory = dict(inventory)
+            inventory.setdefault('data_path', data_path)
+            inventory.setdefault('file_extension', '.fits')
+            inventory.setdefault('catalog', catalog)
+            inventory.setdefault('rewrite', True)
+            stages['inventory:' + name] = (after, _call(create_inventory, bundle_name, collection_path, **inventory))
+        if collection.get('validate'):
+            inventory_path = collection_path + '/collection_' + bundle_name + '_' + name + '_inventory.csv'
+            stages['validate:' + name] = (('labels:' + name,) + (('inventory:' + name,) if 'inventory:' + name in stages else ()),
+                _call(_validate, collection_path + '/*/*/*.xml', labels['templatevar'], inventory_path if inventory is not False else None,
+                collection_file(collection_path, 'validation.json'), labels.get('workers')))
+        collection_label = collection.get('collection_label', {})
+        if config.get('collection_label') and collection_label is not False and inventory is not False:
+            collection_label = dict(config['collection_label'], **collection_label)
+            stages['collection_label:' + name] = (('labels:' + name, 'inventory:' + name),
+                _call(create_collection_label, collection_path, bundle_name = bundle_name, **collection_label))
+    logs = config.get('logs')
+    if logs:
+        documents = logs.get('documents', 'document')
+        logs_path = bundle_path + '/' + documents + '/' + logs.get('logs_dir', 'header_observing_logs') + '/'
+        source = logs.get('collection', 'data_raw')
+        options = dict(logs.get('options', {}))
+        options.setdefault('reporter', reporter)
+        options.setdefault('catalog', catalogs.get(source))
+        options.setdefault('rewrite', True)
+        stages['logs'] = (('catalog:' + source,) if source in catalogs else (),
+            _call(_write_logs, create_header_observing_logs, logs_path, bundle_path + '/' + source + '/*/*', documents, options))
+        log_labels = dict(logs.get('labels', {}))
+        log_labels.setdefault('reporter', reporter)
+        #logs the logs stage rewrote are newer than their labels, so they're labeled again
+        log_labels.setdefault('rewrite', 'stale')
+        stages['log_labels'] = (('logs',), _call(create_header_observing_labels, logs_path + '*.txt',
+            collection_name = documents, bundle_name = bundle_name, **log_labels))
+        inventory = logs.get('inventory', {})
+        if inventory is not False:
+            inventory = dict(inventory)
+            inventory.setdefault('data_path', logs_path + '*.txt')
+            inventory.setdefault('file_extension', '.txt')
+            inventory.setdefault('rewrite', True)
+            stages['inventory:' + documents] = (('log_labels',), _call(create_inventory, bundle_name,
+                bundle_path + '/' + documents, **inventory))
+    if config.get('bundle_label'):
+        #the bundle label lists each collection with an inventory, and spans the times of their labels
+        stages['bundle_label'] = (tuple(name for name in stages if name.startswith(('labels:', 'inventory:', 'collection_label:'))),
+            _call(create_bundle_label, bundle_path, bundle_name = bundle_name, **config['bundle_label']))
+    return stages
+
+def _call(function, *args, **kwargs):
+    return lambda: function(*args, **kwargs)
+
+def _write_logs(create_header_observing_logs, logs_path, day_path, documents, options):
+    os.makedirs(logs_path, exist_ok = True)
+    create_header_observing_logs(logs_path, day_path, documents, **options)
+
+def _validate(pathvar, templatevar, inventory, report, workers):
+    from PDS_AREAL.utils.validate import validate_collection
+    result = validate_collection(pathvar, templatevar, inventory, report, workers, print_status = False)
+    if result['labels_with_problems'] or result.get('missing_from_inventory') or result.get('missing_labels'):
+        raise ValueError(str(result['labels_with_problems']) + ' labels with problems, ' + str(len(result.get('missing_from_inventory', [])) + 
+            len(result.get('missing_labels', []))) + ' LIDs not matching the inventory. See ' + report)
+
+def run_stages(stages, workers=4):
+    """Run Stages
+
+    Run each stage as soon as the stages it depends on have finished, with up to workers stages at once.
+    If a stage fails, the stages that depend on it are skipped and the rest carry on.
+
+    Args:
+        stages (dict): Stages from bundle_stages.
+        workers (:obj:`int`, optional): The number of stages to run at once. Defaults to 4.
+
+    Returns:
+        dict: For each stage, a dictionary of its 'status' ('done', 'failed' or 'skipped'), its run time in
+        'seconds' and its 'error' if it failed.
+
+    """
+    for name, (after, call) in stages.items():
+        missing = [stage for stage in after if stage not in stages]
+        if missing:
+            raise ValueError('Stage ' + name + ' depends on unknown stages: ' + ', '.join(missing))
+    results = {}
+    waiting = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while waiting or running:
+            for name, (after, call) in list(waiting.items()):
+                if any(results.get(stage, {}).get('status') in ('failed', 'skipped') for stage in after):
+                    del waiting[name]
+                    results[name] = {'status': 'skipped', 'seconds': 0, 'error': None}
+                    print('Skipping ' + name + ' (an earlier stage failed)')
+                elif all(stage in results for stage in after):
+                    del waiting[name]
+                    print('Starting ' + name)
+                    running[pool.submit(_timed, call)] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                seconds, error = future.result()
+                results[name] = {'status': 'failed' if error else 'done', 'seconds': seconds, 'error': error}
+                if error:
+                    print('Failed ' + name + ': ' + error)
+                else:
+                    print('Finished ' + name + ' in ' + '%.2f' % seconds + ' s')
+    return results
+
+def _timed(call):
+    start = time.perf_counter()
+    try:
+        call()
+    except Exception as e:
+        return time.perf_counter() - start, type(e).__name__ + ': ' + str(e)
+    return time.perf_counter() - start, None
+
+def run_bundle(config, workers=None, stages=None):
+    """Run Bundle
+
+    Args:
+        config (:obj:`str` or :obj:`dict`): The path to a bundle config file, or the config itself.
+        workers (:obj:`int`, optional): The number of stages to run at once. Defaults to the config's
+            "workers", or 4.
+        stages (:obj:`list`, optional): Only run these stages, ex. ['labels:data_raw']. Their dependencies
+            are assumed to be done already. Defaults to every stage.
+
+    Returns:
+        dict: The results from run_stages.
+
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    graph = bundle_stages(config)
+    if stages is not None:
+        unknown = [name for name in stages if name not in graph]
+        if unknown:
+            raise ValueError('Unknown stages: ' + ', '.join(unknown) + '. The stages are: ' + ', '.join(graph))
+        graph = dict((name, (tuple(stage for stage in graph[name][0] if stage in stages), graph[name][1])) for name in stages)
+    start = time.perf_counter()
+    results = run_stages(graph, workers or config.get('workers', 4))
+    print('****************\nBundle complete in ' + '%.2f' % (time.perf_counter() - start) + ' s.\n****************')
+    for name, result in results.items():
+        print('%-32s %-8s %8.2f s' % (name, result['status'], result['seconds']))
+    return results
+
+def main(argv=None):
+    """Command line entry point, installed as pds-areal-bundle."""
+    parser = argparse.ArgumentParser(description='Build the logs, labels and inventories of a PDS bundle.')
+    parser.add_argument('config', help='the bundle config file (JSON)')
+    parser.add_argument('--workers', type=int, default=None, help='stages to run at once (default: the config\'s "workers", or 4)')
+    parser.add_argument('--stages', nargs='+', default=None, help='only run these stages, ex. labels:data_raw')
+    parser.add_argument('--dry-run', action='store_true', help='list the stages and what they depend on, without running them')
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    if args.dry_run:
+        for name, (after, call) in bundle_stages(config).items():
+            print(name + (' (after ' + ', '.join(after) + ')' if after else ''))
+        return 0
+    results = run_bundle(config, args.workers, args.stages)
+    return 1 if any(result['status'] != 'done' for result in results.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
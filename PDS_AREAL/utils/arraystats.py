@@ -0,0 +1,123 @@
+import os
+
+#PDS4 data types of the image arrays, and the numpy dtype each is stored as
+ARRAY_TYPES = {
+    'IEEE754MSBSingle': '>f4',
+    'IEEE754MSBDouble': '>f8',
+    'IEEE754LSBSingle': '<f4',
+    'IEEE754LSBDouble': '<f8',
+    'SignedByte': 'i1',
+    'UnsignedByte': 'u1',
+    'SignedMSB2': '>i2',
+    'SignedMSB4': '>i4',
+    'SignedMSB8': '>i8',
+    'UnsignedMSB2': '>u2',
+    'UnsignedMSB4': '>u4',
+    'UnsignedMSB8': '>u8',
+    'SignedLSB2': '<i2',
+    'SignedLSB4': '<i4',
+    'SignedLSB8': '<i8',
+    'UnsignedLSB2': '<u2',
+    'UnsignedLSB4': '<u4',
+    'UnsignedLSB8': '<u8',
+}
+#template variables filled in by array_statistics, by the name of each statistic
+STATISTICS_SLOTS = {
+    'minimum': 'ARRAY_MINIMUM',
+    'maximum': 'ARRAY_MAXIMUM',
+    'mean': 'ARRAY_MEAN',
+    'standard_deviation': 'ARRAY_STANDARD_DEVIATION',
+    'nan_count': 'ARRAY_NAN_COUNT',
+}
+#elements per chunk, so at most a few 8 MiB float64 copies are held at once
+CHUNK_SIZE = 1 << 20
+
+def array_statistics(path, offset, shape, array_type='IEEE754MSBSingle', chunk_size=CHUNK_SIZE):
+    """ Array Statistics
+
+    Work out the minimum, maximum, mean, standard deviation and number of NaNs of an image array without
+    loading it. The data block is memory-mapped and reduced a chunk at a time, and the chunks' means and
+    variances are combined as they go, so memory use is the same however large the image is.
+
+    Args:
+        path (str): The path to the fits file.
+        offset (int): The offset of the array from the start of the file in bytes, ex. the header length
+            from PDS_AREAL.utils.fitsheader.read_header.
+        shape (tuple): The dimensions of the array, ex. (NAXIS2, NAXIS1).
+        array_type (:obj:`str`, optional): The PDS4 data type of the array, one of ARRAY_TYPES. Defaults to
+            'IEEE754MSBSingle'.
+        chunk_size (:obj:`int`, optional): The number of elements reduced at a time. Defaults to CHUNK_SIZE.
+
+    Returns:
+        dict: The 'minimum', 'maximum', 'mean' and (population) 'standard_deviation' of the finite values,
+        each None if there are none, the 'nan_count' and the number of finite values in 'count'.
+
+    """
+    #imported here so the labels don't need numpy unless statistics are asked for
+    import numpy as np
+    if array_type not in ARRAY_TYPES:
+        raise ValueError('Unknown array_type ' + repr(array_type) + '. Use one of: ' + ', '.join(ARRAY_TYPES))
+    dtype = np.dtype(ARRAY_TYPES[array_type])
+    elements = 1
+    for length in shape:
+        elements *= int(length)
+    result = {'minimum': None, 'maximum': None, 'mean': None, 'standard_deviation': None, 'nan_count': 0, 'count': 0}
+    if elements == 0:
+        return result
+    if offset + elements * dtype.itemsize > os.path.getsize(path):
+        raise ValueError('The ' + str(elements) + ' element ' + array_type + ' array at byte ' + str(offset) + ' runs past the end of ' + path)
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for start in range(0, elements, chunk_size):
+        #each chunk is mapped on its own and unmapped once it's copied, so the pages read so far don't pile up
+        window = np.memmap(path, dtype=dtype, mode='r', offset=offset + start * dtype.itemsize, shape=(min(chunk_size, elements - start),))
+        chunk = window.astype(np.float64)
+        del window
+        finite = np.isfinite(chunk)
+        result['nan_count'] += int(np.isnan(chunk).sum())
+        if not finite.all():
+            chunk = chunk[finite]
+        n = chunk.size
+        if n == 0:
+            continue
+        low, high = float(chunk.min()), float(chunk.max())
+        if count == 0 or low < result['minimum']:
+            result['minimum'] = low
+        if count == 0 or high > result['maximum']:
+            result['maximum'] = high
+        #combine this chunk's mean and sum of squared deviations with the running ones
+        chunk_mean = float(chunk.mean())
+        chunk_m2 = float(np.square(chunk - chunk_mean).sum())
+        delta = chunk_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += chunk_m2 + delta * delta * count * n / total
+        count = total
+    result['count'] = count
+    if count:
+        result['mean'] = mean
+        result['standard_deviation'] = (m2 / count) ** 0.5
+    return result
+
+def statistics_values(statistics):
+    """ Statistics Values
+
+    Args:
+        statistics (dict): Statistics from array_statistics.
+
+    Returns:
+        dict: The template variable of each statistic (see STATISTICS_SLOTS) and its value as a string.
+        Statistics with no finite values to work from are 'NaN'.
+
+    """
+    values = {}
+    for name, slot in STATISTICS_SLOTS.items():
+        value = statistics[name]
+        if value is None:
+            values[slot] = 'NaN'
+        elif isinstance(value, int):
+            values[slot] = str(value)
+        else:
+            values[slot] = repr(value)
+    return values
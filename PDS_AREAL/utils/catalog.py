@@ -0,0 +1,193 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import json
+import os
+import sqlite3
+from PDS_AREAL.utils.dirindex import index_file, index_glob
+from PDS_AREAL.utils.fitsheader import read_header
+from PDS_AREAL.utils.manifest import hash_header
+from PDS_AREAL.utils.pdsutils import match_path
+from PDS_AREAL.utils.profiles import registered_keys
+
+#header cards used by create_fits_labels and create_header_observing_logs with the built in instrument profiles
+CATALOG_KEYS = registered_keys() + ['NAXIS1', 'NAXIS2']
+
+def file_record(path, keys, filestat=None):
+    """ File Record
+
+    Stat a fits file and read the header cards in keys.
+
+    Args:
+        path (str): The path to the fits file.
+        keys (list): The header keys to read.
+        filestat (:obj:`dict`, optional): The file's 'size', 'mtime' and 'ctime' if they're already known, ex.
+            from PDS_AREAL.utils.dirindex.index_file, so the file isn't stat'ed again.
+
+    Returns:
+        dict: The file's 'path', 'size', 'mtime' (in nanoseconds), 'ctime', 'header' (a dictionary of the
+        cards found), 'header_length' (in bytes) and 'header_hash'. If the file couldn't be read, 'error'
+        holds the reason and the header fields are None.
+
+    """
+    record = {'path': path, 'size': None, 'mtime': None, 'ctime': None, 'header': None, 'header_length': None,
+        'header_hash': None, 'error': None}
+    try:
+        if filestat is None:
+            stats = os.stat(path)
+            filestat = {'size': stats.st_size, 'mtime': stats.st_mtime_ns, 'ctime': stats.st_ctime}
+        record['size'] = filestat['size']
+        record['mtime'] = filestat['mtime']
+        record['ctime'] = filestat['ctime']
+        record['header'], record['header_length'] = read_header(path, keys)
+        record['header_hash'] = hash_header(path, record['header_length'])
+    except OSError as e:
+        record['error'] = str(e)
+    return record
+
+def prefetch_records(paths, keys, depth=16):
+    """ Prefetch Records
+
+    Read file records on a pool of threads, keeping up to depth reads in flight ahead of the consumer.
+    On a network file system this overlaps the round trips of many files, instead of waiting for each
+    open and read one at a time.
+
+    Args:
+        paths (iterable): The paths to the fits files. This can be a generator, ex. from pdsutils.iter_paths.
+        keys (list): The header keys to read.
+        depth (:obj:`int`, optional): The number of reads in flight at once. Defaults to 16.
+
+    Yields:
+        dict: The record (see file_record) of each file, in the same order as paths.
+
+    """
+    with ThreadPoolExecutor(max_workers=depth) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(file_record, path, keys))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def build_catalog(data_path, catalog_path, keys=CATALOG_KEYS, print_status=True, index=None):
+    """ Build Catalog
+
+    Scan a collection once and store the path, size, mtime and header cards of every file in an SQLite
+    table. create_fits_labels, create_header_observing_logs and create_inventory can then read the catalog
+    instead of opening every file again. Running this again on an existing catalog only rereads the files
+    whose size or mtime changed, and drops files that no longer exist.
+
+    Args:
+        data_path (str): The path all the way to individual fits files, using wildcards for the
+            subdirectories of the collection.
+            Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\*/\*/\*.fits'
+        catalog_path (str): The path to the catalog file. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/.data_raw.catalog.sqlite'
+        keys (:obj:`list`, optional): The header keys to store. Defaults to every key the labels and logs
+            use with their default arguments. If you pass different key names to create_header_observing_logs,
+            add them here.
+        print_status (:obj:`bool`, optional): By default, the function will print status to the terminal. For
+            quiet mode, change to False.
+        index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering data_path.
+            The files and their sizes and mtimes are then taken from the index instead of globbing and
+            stat'ing each file.
+
+    Returns:
+        int: The number of files in the catalog.
+
+    """
+    connection = sqlite3.connect(catalog_path)
+    with connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, '
+            'ctime REAL, header TEXT, header_length INTEGER, header_hash TEXT, error TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        row = connection.execute("SELECT value FROM meta WHERE name = 'keys'").fetchone()
+        if row is None or json.loads(row[0]) != list(keys):
+            #the stored headers are missing some of the keys, so every file has to be read again
+            connection.execute('DELETE FROM files')
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('keys', ?)", (json.dumps(list(keys)),))
+        known = dict(((path, (size, mtime)) for path, size, mtime in connection.execute('SELECT path, size, mtime FROM files')))
+        found = set()
+        for path in (glob.glob(data_path) if index is None else index_glob(index, data_path)):
+            found.add(path)
+            if index is None:
+                try:
+                    stats = os.stat(path)
+                    filestat = {'size': stats.st_size, 'mtime': stats.st_mtime_ns, 'ctime': stats.st_ctime}
+                except OSError:
+                    filestat = None
+            else:
+                filestat = index_file(index, path)
+            if filestat is not None and known.get(path) == (filestat['size'], filestat['mtime']):
+                continue
+            if print_status:
+                print('Cataloging: ' + path)
+            record = file_record(path, keys, filestat)
+            connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (path, record['size'],
+                record['mtime'], record['ctime'], json.dumps(record['header']), record['header_length'],
+                record['header_hash'], record['error']))
+        #files under data_path that have been removed since the last scan
+        connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in known
+            if path not in found and match_path(path, data_path)])
+        count = connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    connection.close()
+    if print_status:
+        print('Catalog complete: ' + str(count) + ' files in ' + catalog_path)
+    return count
+
+def check_catalog_keys(catalog_path, keys):
+    """ Check Catalog Keys
+
+    Raise a ValueError if the catalog doesn't exist or wasn't built with all of the header keys in keys,
+    rather than letting them be reported as missing from every file.
+
+    Args:
+        catalog_path (str): The path to a catalog made by build_catalog.
+        keys (list): Header keys the caller is going to use.
+
+    """
+    connection = _open_catalog(catalog_path)
+    try:
+        row = connection.execute("SELECT value FROM meta WHERE name = 'keys'").fetchone()
+    except sqlite3.DatabaseError:
+        row = None
+    connection.close()
+    if row is None:
+        raise ValueError(catalog_path + ' isn\'t a catalog made by build_catalog.')
+    missing = set(keys) - set(json.loads(row[0]))
+    if missing:
+        raise ValueError('Catalog ' + catalog_path + ' was built without the header keys: ' + ', '.join(sorted(missing)))
+
+def _open_catalog(catalog_path):
+    #opened read only, so a mistyped path raises an error rather than creating an empty catalog there
+    if not os.path.exists(catalog_path):
+        raise ValueError('No catalog found at ' + catalog_path + '. Run build_catalog first.')
+    uri = 'file:' + catalog_path.replace('%', '%25').replace('?', '%3f').replace('#', '%23') + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+def read_catalog(catalog_path, pattern=None, keys=None):
+    """ Read Catalog
+
+    Args:
+        catalog_path (str): The path to a catalog made by build_catalog.
+        pattern (:obj:`str`, optional): Only return files matching this wildcard path, with the same rules
+            as glob. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/2003/\*/\*.fits'
+        keys (:obj:`list`, optional): Header keys the caller is going to use. If the catalog wasn't built
+            with all of them, a ValueError is raised rather than reporting them as missing from every file.
+
+    Returns:
+        list: A record (see file_record) for each file, sorted by path.
+
+    """
+    if keys is not None:
+        check_catalog_keys(catalog_path, keys)
+    connection = _open_catalog(catalog_path)
+    records = []
+    for path, size, mtime, ctime, header, header_length, header_hash, error in connection.execute(
+            'SELECT path, size, mtime, ctime, header, header_length, header_hash, error FROM files ORDER BY path'):
+        if pattern is not None and not match_path(path, pattern):
+            continue
+        records.append({'path': path, 'size': size, 'mtime': mtime, 'ctime': ctime, 'header': json.loads(header),
+            'header_length': header_length, 'header_hash': header_hash, 'error': error})
+    connection.close()
+    return records
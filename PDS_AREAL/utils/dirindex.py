@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+from itertools import repeat
+import json
+import os
+import time
+from PDS_AREAL.utils.pdsutils import atomic_write
+
+#directories changed this close to the scan (in nanoseconds) are scanned again next time, since a change in the
+#same tick of a coarse file system clock (ex. 1 s on some NFS servers) wouldn't change their mtime
+SETTLE_TIME = 2 * 10**9
+
+def build_index(root, cache=None, workers=16):
+    """ Build Index
+
+    Walk a collection once with os.scandir, on a pool of threads so the directory listings and stats of
+    many directories are in flight at once, and keep the size, mtime and ctime of every file. Globbing
+    and looking up files in the index then needs no further calls to the file system. With a cache, only
+    the directories whose mtime changed since the last build are listed again, so an unchanged collection
+    costs one stat per directory.
+
+    A file rewritten in place (rather than written to a temporary file and renamed, as PDS_AREAL does)
+    doesn't change its directory's mtime, so its size and mtime in the cache stay as they were until
+    something is added to, renamed in or removed from its directory.
+
+    Args:
+        root (str): The directory to index, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw'.
+            Paths from the index start with root exactly as given, like glob's do.
+        cache (:obj:`str`, optional): Path to keep the index in between runs, ex.
+            '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/.data_raw.index.json'. Default is None, which
+            lists every directory.
+        workers (:obj:`int`, optional): The number of directories listed at once. Defaults to 16.
+
+    Returns:
+        dict: The index, for index_glob and index_file.
+
+    """
+    root = root.rstrip('/')
+    cached = {}
+    if cache is not None and os.path.exists(cache):
+        with open(cache, 'r') as f:
+            saved = json.load(f)
+        if saved.get('root') == root:
+            cached = saved['dirs']
+    started = time.time_ns()
+    dirs = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        #one level of the tree at a time, every directory of the level at once
+        level = [root]
+        while level:
+            listings = pool.map(_list_directory, level, repeat(cached))
+            next_level = []
+            for directory, listing in zip(level, listings):
+                if listing is None:
+                    continue
+                dirs[directory] = listing
+                next_level.extend(directory + '/' + name for name, entry in listing['entries'].items() if entry is None)
+            level = next_level
+    if root not in dirs:
+        raise ValueError('Can\'t index ' + root + ', it isn\'t a readable directory.')
+    index = {'root': root, 'dirs': dirs}
+    if cache is not None:
+        settled = dict((directory, listing if listing['mtime'] < started - SETTLE_TIME else dict(listing, mtime=None))
+            for directory, listing in dirs.items())
+        atomic_write(cache, json.dumps({'root': root, 'dirs': settled}))
+    return index
+
+def _list_directory(directory, cached):
+    #the listing of one directory: its mtime, and each entry by name in scandir order, None for a directory
+    #and [size, mtime, ctime] for anything else. None if the directory can't be read.
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+    listing = cached.get(directory)
+    if listing is not None and listing['mtime'] == mtime:
+        return listing
+    entries = {}
+    try:
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                try:
+                    if entry.is_dir():
+                        entries[entry.name] = None
+                    else:
+                        filestats = entry.stat()
+                        entries[entry.name] = [filestats.st_size, filestats.st_mtime_ns, filestats.st_ctime]
+                except OSError:
+                    #removed since the listing started
+                    continue
+    except OSError:
+        return None
+    return {'mtime': mtime, 'entries': entries}
+
+def index_glob(index, pattern):
+    """ Index Glob
+
+    glob.glob from an index, with the same matching rules and in the same order.
+
+    Args:
+        index (dict): An index from build_index.
+        pattern (str): The wildcard path, inside the indexed directory.
+            Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\\*/\\*/\\*.fits'
+
+    Returns:
+        list: Each path in the index matching pattern.
+
+    """
+    root = index['root']
+    if not pattern.startswith(root + '/'):
+        raise ValueError(pattern + ' isn\'t inside the indexed directory ' + root)
+    return list(_glob(index['dirs'], root, pattern[len(root) + 1:].split('/')))
+
+def _glob(dirs, directory, parts):
+    listing = dirs.get(directory)
+    if listing is None:
+        return
+    part, rest = parts[0], parts[1:]
+    entries = listing['entries']
+    if not any(char in part for char in '*?['):
+        names = [part] if part in entries else []
+    else:
+        names = [name for name in entries if fnmatch.fnmatchcase(name, part) and (part.startswith('.') or not name.startswith('.'))]
+    for name in names:
+        path = directory + '/' + name
+        if not rest:
+            yield path
+        elif entries[name] is None:
+            yield from _glob(dirs, path, rest)
+
+def index_walk(index, directory):
+    """ Index Walk
+
+    os.walk from an index, for every file under a directory however deep.
+
+    Args:
+        index (dict): An index from build_index.
+        directory (str): A directory inside the indexed directory, or the indexed directory itself.
+
+    Yields:
+        str: The path to each file under directory, top down, as os.walk would find them.
+
+    """
+    directory = directory.rstrip('/')
+    root = index['root']
+    if directory != root and not directory.startswith(root + '/'):
+        raise ValueError(directory + ' isn\'t inside the indexed directory ' + root)
+    listing = index['dirs'].get(directory)
+    if listing is None:
+        return
+    entries = listing['entries']
+    for name in entries:
+        if entries[name] is not None:
+            yield directory + '/' + name
+    for name in entries:
+        if entries[name] is None:
+            yield from index_walk(index, directory + '/' + name)
+
+def index_file(index, path):
+    """ Index File
+
+    Args:
+        index (dict): An index from build_index.
+        path (str): The path to a file, inside the indexed directory.
+
+    Returns:
+        dict: The file's 'size', 'mtime' (in nanoseconds) and 'ctime', like os.stat's st_size, st_mtime_ns
+        and st_ctime, or None if the index has no such file.
+
+    """
+    directory, _, name = path.rpartition('/')
+    listing = index['dirs'].get(directory)
+    if listing is None:
+        return None
+    entry = listing['entries'].get(name)
+    if entry is None:
+        return None
+    return {'size': entry[0], 'mtime': entry[1], 'ctime': entry[2]}
@@ -0,0 +1,187 @@
+import os
+
+BLOCK_SIZE = 2880 #size of a fits logical block in bytes
+CARD_SIZE = 80 #size of a single header card in bytes
+#header cards that give the type and layout of each HDU, up to the 999 axes the standard allows
+HDU_KEYS = ['XTENSION', 'EXTNAME', 'BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT', 'BSCALE', 'BZERO'] + ['NAXIS' + str(n) for n in range(1, 1000)]
+
+def read_header(path, keys=None):
+    """ Read Header
+
+    Read the primary header of a fits file straight from its 2880-byte header blocks, without loading the
+    file through astropy. Only the cards in keys are parsed. If the header is malformed (no END card,
+    non-ASCII bytes or a value that can't be read), the file is opened with astropy instead, after
+    verify('fix').
+
+    Args:
+        path (str): The path to the fits file.
+        keys (:obj:`list`, optional): The header keys to return, ex. ['DATE-OBS', 'NAXIS1', 'NAXIS2'].
+            By default, every keyword card in the header is returned.
+
+    Returns:
+        tuple: A dictionary of the requested keys found in the header (missing keys are left out, so
+        looking them up raises KeyError just like an astropy header), and the exact length of the
+        header in bytes, including the END card and the padding of the last block.
+
+    """
+    try:
+        return _parse_header(path, keys)
+    except (ValueError, UnicodeDecodeError):
+        return _read_header_astropy(path, keys)
+
+def _parse_header(path, keys):
+    if keys is not None:
+        #header keywords are case-insensitive, but results use the spelling that was asked for
+        keys = dict((key.upper(), key) for key in keys)
+    with open(path, 'rb') as f:
+        return _read_cards(f, path, keys)
+
+def _read_cards(f, path, keys):
+    #read one header from the current position of f, leaving f at the end of its last block
+    header = {}
+    header_length = 0
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if len(block) < BLOCK_SIZE:
+            raise ValueError('Header of ' + path + ' has no END card')
+        if header_length == 0 and block[:8] not in (b'SIMPLE  ', b'XTENSION'):
+            raise ValueError(path + ' does not start with a SIMPLE card')
+        header_length += BLOCK_SIZE
+        block = block.decode('ascii')
+        for start in range(0, BLOCK_SIZE, CARD_SIZE):
+            card = block[start:start + CARD_SIZE]
+            keyword = card[:8].rstrip().upper()
+            if keyword == 'END':
+                return header, header_length
+            if keys is not None:
+                if keyword not in keys:
+                    continue
+                keyword = keys[keyword]
+            if keyword in header or card[8:10] != '= ':
+                continue
+            header[keyword] = _parse_value(card[10:])
+
+def scan_hdus(path, keys=None):
+    """ Scan HDUs
+
+    Walk every header-data unit of a fits file in one pass: each header is read block by block and its
+    data is skipped with a seek, so no data is loaded however large or many the extensions are. The sizes
+    come from the BITPIX, NAXISn, PCOUNT and GCOUNT cards, as in the FITS standard. Malformed files are
+    scanned with astropy instead, as for read_header.
+
+    Args:
+        path (str): The path to the fits file.
+        keys (:obj:`list`, optional): Extra header keys to return from each header, ex. ['DATE-OBS'].
+            The cards that give the layout of the HDU (see HDU_KEYS) are always returned.
+
+    Returns:
+        list: A dictionary for each HDU in file order, with its 'header_offset' and 'header_length' (in bytes,
+        including the padding of the last block), its 'data_offset' and 'data_size' (in bytes, without the
+        padding of the last block, 0 if it has no data) and its 'header' cards. A truncated file's last HDU
+        is still listed, so check that its data fits in the file before reading it.
+
+    """
+    try:
+        return _scan_hdus(path, keys)
+    except (ValueError, UnicodeDecodeError):
+        return _scan_hdus_astropy(path, keys)
+
+def _scan_hdus(path, keys):
+    keys = dict((key.upper(), key) for key in HDU_KEYS + list(keys or []))
+    hdus = []
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset < end:
+            if hdus:
+                #anything after the last extension that isn't another extension is left alone
+                f.seek(offset)
+                if f.read(8) != b'XTENSION':
+                    break
+            f.seek(offset)
+            header, header_length = _read_cards(f, path, keys)
+            data_size = hdu_data_size(header)
+            hdus.append({'header_offset': offset, 'header_length': header_length, 'data_offset': offset + header_length,
+                'data_size': data_size, 'header': header})
+            offset += header_length + -(-data_size // BLOCK_SIZE) * BLOCK_SIZE
+    return hdus
+
+def hdu_data_size(header):
+    """ HDU Data Size
+
+    Args:
+        header (dict): The header cards of an HDU, with at least BITPIX, NAXIS and each NAXISn.
+
+    Returns:
+        int: The size of the HDU's data in bytes, without padding: \|BITPIX\| / 8 * GCOUNT * (PCOUNT +
+        NAXIS1 * ... * NAXISn). In random groups (NAXIS1 = 0), NAXIS1 is left out of the product.
+
+    """
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    elements = 1
+    for n in range(1, naxis + 1):
+        length = header['NAXIS' + str(n)]
+        if n == 1 and length == 0 and naxis > 1:
+            continue
+        elements *= length
+    return abs(header['BITPIX']) // 8 * header.get('GCOUNT', 1) * (header.get('PCOUNT', 0) + elements)
+
+def _parse_value(field):
+    field = field.strip()
+    if field[:1] == "'":
+        #strings end at the first single quote that isn't doubled
+        end = 1
+        while True:
+            end = field.find("'", end)
+            if end == -1:
+                raise ValueError('Unterminated string value: ' + field)
+            if field[end + 1:end + 2] == "'":
+                end += 2
+                continue
+            value = field[1:end].replace("''", "'").rstrip()
+            if value.endswith('&'):
+                #long strings continue over CONTINUE cards, which are left to astropy
+                raise ValueError('Long string value: ' + field)
+            return value
+    field = field.split('/', 1)[0].strip()
+    if field == 'T':
+        return True
+    if field == 'F':
+        return False
+    if field == '':
+        return ''
+    try:
+        return int(field)
+    except ValueError:
+        return float(field.replace('D', 'E'))
+
+def _read_header_astropy(path, keys):
+    #astropy takes most of a second to import, so it's only loaded for the odd malformed header
+    from astropy.io import fits
+    with fits.open(path) as img:
+        img[0].verify('fix')
+        hdr = img[0].header
+    if keys is None:
+        keys = hdr.keys()
+    header = {}
+    for key in keys:
+        if key in hdr:
+            header[key] = hdr[key]
+    return header, len(hdr.tostring())
+
+def _scan_hdus_astropy(path, keys):
+    from astropy.io import fits
+    hdus = []
+    with fits.open(path) as img:
+        for number, hdu in enumerate(img):
+            hdu.verify('fix')
+            info = img.fileinfo(number)
+            header = {}
+            for key in HDU_KEYS + list(keys or []):
+                if key in hdu.header:
+                    header[key] = hdu.header[key]
+            hdus.append({'header_offset': info['hdrLoc'], 'header_length': info['datLoc'] - info['hdrLoc'],
+                'data_offset': info['datLoc'], 'data_size': hdu_data_size(header), 'header': header})
+    return hdus
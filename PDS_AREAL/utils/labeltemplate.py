@@ -0,0 +1,70 @@
+import re
+
+SLOT = re.compile(r'\$([A-Za-z0-9_]+)\$')
+
+def compile_template(templatevar, names):
+    """ Compile Template
+
+    Read a txt label template once and split it into literal text and named $VAR$ slots, so labels can be
+    rendered without scanning the template again for every file.
+
+    Args:
+        templatevar (str): The absolute path to the txt label template.
+            Ex. '/home/bblakley/scripts/universal_fits_label.txt'
+        names (iterable): Every slot name the caller knows how to fill in, ex. ['LID', 'TITLE'].
+
+    Returns:
+        list: The compiled template. Even items are literal text and odd items are slot names.
+
+    Raises:
+        ValueError: If the template uses a $VAR$ that isn't in names. This is raised before any label is
+            written, rather than partway through a collection.
+
+    """
+    with open(templatevar, 'r') as template:
+        parts = SLOT.split(template.read())
+    unknown = sorted(set(parts[1::2]) - set(names))
+    if unknown:
+        raise ValueError('Unknown template variables in ' + templatevar + ': ' + ', '.join('$' + name + '$' for name in unknown))
+    return parts
+
+def prerender(parts, values):
+    """ Prerender
+
+    Fill in the slots that are the same for every label in a run (title, authors, LIDs, etc.), leaving the
+    rest of the slots for render.
+
+    Args:
+        parts (list): A template from compile_template.
+        values (dict): The slot values to fill in now. Slots missing from values are kept.
+
+    Returns:
+        list: A compiled template with the remaining slots.
+
+    """
+    rendered = [parts[0]]
+    for i in range(1, len(parts), 2):
+        name = parts[i]
+        if name in values:
+            rendered[-1] += values[name] + parts[i + 1]
+        else:
+            rendered.append(name)
+            rendered.append(parts[i + 1])
+    return rendered
+
+def render(parts, values):
+    """ Render
+
+    Fill in the remaining slots of a compiled template.
+
+    Args:
+        parts (list): A template from compile_template or prerender.
+        values (dict): A value for every slot left in parts.
+
+    Returns:
+        str: The whole label, ready to be written in one go.
+
+    """
+    text = parts[:]
+    text[1::2] = [values[name] for name in parts[1::2]]
+    return ''.join(text)
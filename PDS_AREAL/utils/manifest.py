@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+from PDS_AREAL.utils.fitsheader import read_header
+from PDS_AREAL.utils.pdsutils import atomic_write
+
+def collection_root(pathvar, collection_name):
+    """ Collection Root
+
+    Find the collection directory from a wildcard path to its files.
+
+    Args:
+        pathvar (str): The absolute path to the files, with wildcards.
+            Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\*/\*/\*.fits'
+        collection_name (str): The name of the collection directory. Ex. 'data_raw'
+
+    Returns:
+        str: The collection directory, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw'. If the
+        collection name isn't in the path, the deepest directory without wildcards is used instead.
+
+    """
+    if '/' + collection_name + '/' in pathvar:
+        return pathvar.split('/' + collection_name + '/', 1)[0] + '/' + collection_name
+    root = pathvar
+    while any(char in root for char in '*?['):
+        root = root.rsplit('/', 1)[0]
+    return root if root != pathvar else os.path.dirname(pathvar)
+
+def collection_file(collection_path, suffix):
+    """ Collection File
+
+    Args:
+        collection_path (str): The collection directory, ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw'
+        suffix (str): The kind of file, ex. 'manifest.json'
+
+    Returns:
+        str: The path of a hidden bookkeeping file kept next to the collection (not inside it, so it never
+        ends up in a delivery), ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/.data_raw.manifest.json'
+
+    """
+    collection_path = collection_path.rstrip('/')
+    return os.path.join(os.path.dirname(collection_path), '.' + os.path.basename(collection_path) + '.' + suffix)
+
+def load_manifest(manifest_path):
+    """ Load Manifest
+
+    Args:
+        manifest_path (str): The path to the manifest file.
+
+    Returns:
+        dict: The manifest, with one entry per file in manifest['files']. A missing or unreadable manifest
+        gives an empty one, so every file is treated as changed.
+
+    """
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}}
+    if not isinstance(manifest.get('files'), dict):
+        return {'files': {}}
+    return manifest
+
+def save_manifest(manifest_path, manifest):
+    """ Save Manifest
+
+    Write the manifest to a uniquely named temporary file and rename it into place, so an interrupted run
+    never leaves a half-written manifest behind, and two runs saving at once don't share a temporary file.
+
+    Args:
+        manifest_path (str): The path to the manifest file.
+        manifest (dict): The manifest from load_manifest.
+
+    """
+    atomic_write(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+
+def load_journal(journal_path, key):
+    """ Load Journal
+
+    Args:
+        journal_path (str): The path to the run journal, ex. collection_file(collection_path, 'journal').
+        key (str): A hash of everything that decides what the run writes, from hash_settings.
+
+    Returns:
+        dict: The manifest entry of each file (by path relative to the collection) that an interrupted run
+        with the same key finished. Empty if there is no journal or it was left by a different run.
+
+    """
+    done = {}
+    try:
+        with open(journal_path, 'r') as f:
+            lines = iter(f)
+            if json.loads(next(lines, '{}')).get('key') != key:
+                return {}
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    #the last line can be cut short by the interruption
+                    break
+                done[record['path']] = record['entry']
+    except (OSError, ValueError):
+        return {}
+    return done
+
+def start_journal(journal_path, key, resume=False):
+    """ Start Journal
+
+    Args:
+        journal_path (str): The path to the run journal.
+        key (str): The run's key, as for load_journal.
+        resume (:obj:`bool`, optional): Add to the journal of an interrupted run with the same key rather
+            than starting a new one. Defaults to False.
+
+    Returns:
+        file: The open journal, for journal_done.
+
+    """
+    if resume:
+        return open(journal_path, 'a')
+    journal = open(journal_path, 'w')
+    journal.write(json.dumps({'key': key}) + '\n')
+    journal.flush()
+    return journal
+
+def journal_done(journal, path, entry):
+    """Record in the journal that a file is finished, with its manifest entry."""
+    journal.write(json.dumps({'path': path, 'entry': entry}) + '\n')
+    #flushed for every file, so a killed run loses at most the file it was working on
+    journal.flush()
+
+def hash_settings(*settings):
+    """ Hash Settings
+
+    Args:
+        *settings: Everything that goes into a label other than the file itself, such as the compiled
+            template and the arguments the labels were made with. Must be JSON serializable.
+
+    Returns:
+        str: A hash that changes whenever any of the settings change.
+
+    """
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def hash_header(path, header_length):
+    """ Hash Header
+
+    Args:
+        path (str): The path to the fits file.
+        header_length (int): The length of the header in bytes, from fitsheader.read_header.
+
+    Returns:
+        str: A hash of the raw header bytes.
+
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(header_length)).hexdigest()
+
+def file_md5(path, chunk_size=1 << 20):
+    """ File MD5
+
+    Args:
+        path (str): The path to the file.
+        chunk_size (:obj:`int`, optional): The number of bytes read at a time. Defaults to 1 MiB, so large
+            files are hashed without being read into memory.
+
+    Returns:
+        str: The md5 checksum of the whole file, as PDS4 labels give it in md5_checksum.
+
+    """
+    checksum = hashlib.md5()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            checksum.update(view[:n])
+    return checksum.hexdigest()
+
+def cached_md5(entry, size, mtime):
+    """ Cached MD5
+
+    Args:
+        entry (dict): The file's manifest entry, or None if it has none.
+        size (int): The current size of the file in bytes.
+        mtime (int): The current modification time of the file in nanoseconds (st_mtime_ns).
+
+    Returns:
+        str: The md5 checksum recorded in the manifest, or None if there isn't one or the file has changed
+        since it was recorded.
+
+    """
+    if entry is None or entry.get('size') != size or entry.get('mtime') != mtime:
+        return None
+    return entry.get('md5')
+
+def manifest_entry(size, mtime, header, settings, md5=None, observation=None):
+    """ Manifest Entry
+
+    Args:
+        size (int): The size of the file in bytes.
+        mtime (int): The modification time of the file in nanoseconds (st_mtime_ns).
+        header (str): The header hash from hash_header.
+        settings (str): The settings hash from hash_settings.
+        md5 (:obj:`str`, optional): The md5 checksum of the file from file_md5, if it was computed.
+        observation (:obj:`dict`, optional): What the label says about the observation: its 'start' and
+            'stop' date times (stop is None if it's nil in the label) and its 'wavelength', so collection and
+            bundle labels can be summarized from the manifest without reading the headers again.
+
+    Returns:
+        dict: The manifest entry for the file.
+
+    """
+    entry = {'size': size, 'mtime': mtime, 'header': header, 'settings': settings, 'md5': md5}
+    if observation is not None:
+        entry['observation'] = observation
+    return entry
+
+def is_stale(entry, path, size, mtime, settings, md5=False, data=False):
+    """ Is Stale
+
+    Check whether a file's label needs to be made again.
+
+    Args:
+        entry (dict): The file's manifest entry, or None if it has none.
+        path (str): The path to the file.
+        size (int): The current size of the file in bytes.
+        mtime (int): The current modification time of the file in nanoseconds (st_mtime_ns).
+        settings (str): The settings hash for this run.
+        md5 (:obj:`bool`, optional): Whether the label holds the file's md5 checksum. If it does, a touched
+            file is checked against the recorded checksum rather than just its header.
+        data (:obj:`bool`, optional): Whether the label describes the file's data, ex. its array statistics.
+            If it does, a touched file is checked against the recorded checksum as with md5 = True, even if
+            the label doesn't hold it.
+
+    Returns:
+        bool: False if the file, its header, the template and the arguments are all unchanged since the
+        label was made. A file that was only touched keeps its label as long as its size and header (and
+        checksum, with md5 or data = True) are the same, and its entry is updated with the new mtime.
+
+    """
+    if entry is None or entry.get('settings') != settings or entry.get('size') != size:
+        return True
+    if entry.get('mtime') == mtime:
+        return False
+    try:
+        if hash_header(path, read_header(path, [])[1]) != entry.get('header'):
+            return True
+        if (md5 or data) and (entry.get('md5') is None or file_md5(path) != entry['md5']):
+            return True
+    except OSError:
+        return True
+    entry['mtime'] = mtime
+    return False
@@ -1,69 +1,124 @@
-import glob 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, repeat
+import fnmatch
+import functools
 import os
+import re
+import shutil
 
-def replace_text(rootdir, search_text, replace_text, print_status=True, file_type='.xml'):
+def replace_text(rootdir, search_text, replace_text=None, print_status=True, file_type='.xml', workers=None, index=None):
     """ Replace Text
     
-    Replace text in labels (or any .txt or .xml file).
+    Replace text in labels (or any .txt or .xml file). Several replacements can be made in a single pass 
+    over each file, and files that don't contain any of the search text are left untouched.
     
     Args:
         rootdir (str): The root directory of the files to look for the bad text. For example, if you wanted to
             look for all the xml files in a data_raw collection, they would be in many subdirectories, so the
             root directory would be data raw. Use an absolute path.
-        search_text (str): The text you wish to find and replace (the incorrect text).
-        replace_text (str): The text you wish to use as a replacement (the correct text)
+        search_text (str or dict): The text you wish to find and replace (the incorrect text). To make several
+            replacements at once, pass a dictionary of search text to replacement text instead, ex.
+            {'2021': '2022', 'Huber, Lyle': 'Huber, Lyle F.'}. All of the replacements are made in the same 
+            pass, so the output of one replacement is never searched again for another. Where two search 
+            texts start at the same place, the longer one is used.
+        replace_text (str): The text you wish to use as a replacement (the correct text). Leave this out when 
+            search_text is a dictionary. A ValueError is raised, before any file is read, if it's left out
+            otherwise.
         print_status (:obj:`bool`, optional): By default, the function will print status to the terminal. For 
             quiet mode, change to False.
         file_type (str): The type of file you wish to edit. By default, the function looks for XML files.
+        workers (:obj:`int`, optional): Number of threads to read and write files with. Default is None, which
+            handles one file at a time. Threads help most on network file systems.
+        index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering rootdir. The
+            files are then listed from the index instead of walking rootdir. Default is None.
+
+    Returns:
+        dict: A summary with 'files_checked', 'files_changed', and 'replacements', the number of 
+        replacements made for each search text.
 
     """
-    for dirpath, dirs, files in os.walk(rootdir):
-        for file in files:
-            if file.endswith(file_type):
-                filepath = os.path.join(dirpath, file)
-                if print_status:
-                    print('checking: ' + filepath)
-                with open(filepath, 'r') as activefile:
-                    text = activefile.read()
-                    text = text.replace(search_text, replace_text)
-                with open(filepath, 'w') as activefile:
-                    activefile.write(text)
+    if isinstance(search_text, dict):
+        replacements = dict(search_text)
+    elif replace_text is None:
+        raise ValueError('replace_text is needed when search_text is a single string: ' + repr(search_text))
+    else:
+        replacements = {search_text: replace_text}
+    if '' in replacements:
+        raise ValueError('Search text must not be empty')
+    pattern = re.compile('|'.join(re.escape(text) for text in sorted(replacements, key=len, reverse=True)))
+    if index is None:
+        filepaths = (os.path.join(dirpath, file) for dirpath, dirs, files in os.walk(rootdir) for file in files 
+            if file.endswith(file_type))
+    else:
+        #imported here since dirindex imports this module
+        from PDS_AREAL.utils.dirindex import index_walk
+        filepaths = (path for path in index_walk(index, rootdir) if path.endswith(file_type))
+    if workers:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_replace_in_file, filepaths, repeat(pattern), repeat(replacements), repeat(print_status)))
+    else:
+        results = map(_replace_in_file, filepaths, repeat(pattern), repeat(replacements), repeat(print_status))
+    summary = {'files_checked': 0, 'files_changed': 0, 'replacements': dict.fromkeys(replacements, 0)}
+    for counts in results:
+        summary['files_checked'] += 1
+        if counts:
+            summary['files_changed'] += 1
+            for text, count in counts.items():
+                summary['replacements'][text] += count
     print('Done')
+    return summary
+
+def _replace_in_file(filepath, pattern, replacements, print_status):
+    if print_status:
+        print('checking: ' + filepath)
+    with open(filepath, 'r') as activefile:
+        text = activefile.read()
+    if pattern.search(text) is None:
+        return None
+    counts = dict.fromkeys(replacements, 0)
+    def replacement(match):
+        counts[match.group(0)] += 1
+        return replacements[match.group(0)]
+    atomic_write(filepath, pattern.sub(replacement, text))
+    return counts
 
-def shorten_seconds(filestring):
+def shorten_seconds(filestring, digits=4):
     """ Shorten Seconds
     
     Unless you wish to only edit one file, use dir_shorten_seconds instead.
+
+    Cuts the decimal seconds in start_date_time and stop_date_time down to the precision the labeling code
+    uses. The file is read line by line and only rewritten if a time actually changed.
     
     Args:
         filestring (str): The path to the file you want to fix.
+        digits (:obj:`int`, optional): The number of decimal places to keep. Defaults to 4, the same as 
+            create_fits_labels.
+
+    Returns:
+        int: The number of times that were shortened.
 
     """
-    old_text = open(filestring, 'r')
-    new_text = ""
-    lines = old_text.readlines()
-    for line in lines:
-        if '<start_date_time>' not in line:
-            new_text += line
-        else:
-            indent = line.split('<',1)[0]
-            opentag = '<' + line.split('<',1)[1].split('>',1)[0] + '>'
-            closetag = '<' + line.split('<')[-1]
-            timestring = line.split('>',1)[1].split('<',1)[0]
-            mseconds = timestring[timestring.find('.'):-1]
-            if len(mseconds) > 4:
-                print('incorrect: ' + timestring)
-                timestring = timestring[:25] + 'Z'
-                print('corrected: ' + timestring)
-                reassemble = indent + opentag + timestring + closetag
-                new_text += reassemble
-                print('Edited ' + filestring)
-    old_text.close()
-    old_text = open(filestring, 'w')
-    old_text.write(new_text)
-    old_text.close()
-
-def dir_shorten_seconds(directory):
+    pattern = _seconds_pattern(digits)
+    new_text = []
+    count = 0
+    with open(filestring, 'r') as old_text:
+        for line in old_text:
+            if '_date_time>' in line:
+                line, found = pattern.subn(r'\1\3\4\5', line)
+                count += found
+            new_text.append(line)
+    if count:
+        atomic_write(filestring, ''.join(new_text))
+    return count
+
+@functools.lru_cache()
+def _seconds_pattern(digits):
+    #groups: opening tag, tag name, time up to the kept decimals, the trailing Z, closing tag
+    return re.compile(r'(<((?:start|stop)_date_time)>)([^<.]*\.\d{' + str(digits) + r'})\d+(Z?)(</\2>)')
+
+def dir_shorten_seconds(directory, workers=None, digits=4, index=None):
     """ Shorten Seconds - Directory
     
     The newest labeling code includes this, however for older labels, this will fix the extra decimals seconds
@@ -72,7 +127,176 @@ def dir_shorten_seconds(directory):
     Args:
         directory (str): The absolute path to the files in the directory you want to fix, with wildcards. 
             For example "/prvt/juno1/PDART_files/jup_supp.geminis_trecs/data_raw/\*/\*/\*.xml
+        workers (:obj:`int`, optional): Number of threads to read and write files with. Default is None, which
+            handles one file at a time.
+        digits (:obj:`int`, optional): The number of decimal places to keep. Defaults to 4.
+        index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering directory. 
+            The files are then listed from the index instead of globbing. Default is None.
+
+    Returns:
+        dict: A summary with 'files_checked', 'files_changed' and 'times_shortened'.
+
+    """
+    if index is None:
+        filestrings = iter_paths(directory)
+    else:
+        #imported here since dirindex imports this module
+        from PDS_AREAL.utils.dirindex import index_glob
+        filestrings = index_glob(index, directory)
+    if workers:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            counts = list(pool.map(shorten_seconds, filestrings, repeat(digits)))
+    else:
+        counts = map(shorten_seconds, filestrings, repeat(digits))
+    summary = {'files_checked': 0, 'files_changed': 0, 'times_shortened': 0}
+    for count in counts:
+        summary['files_checked'] += 1
+        if count:
+            summary['files_changed'] += 1
+            summary['times_shortened'] += count
+    print('Checked ' + str(summary['files_checked']) + ' files, shortened ' + str(summary['times_shortened']) + 
+        ' times in ' + str(summary['files_changed']) + ' files')
+    return summary
+
+def match_path(path, pattern):
+    """ Match Path
+
+    Check a path against a wildcard path with the same rules glob uses, so a wildcard only matches within
+    one directory level.
+
+    Args:
+        path (str): The path to check. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/2003/05-06/a.fits'
+        pattern (str): The wildcard path. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\*/\*/\*.fits'
+
+    Returns:
+        bool: True if glob.glob(pattern) would find path.
 
     """
-    for filestring in glob.glob(directory):
-        shorten_seconds(filestring)
+    parts = path.split('/')
+    pattern_parts = pattern.split('/')
+    if len(parts) != len(pattern_parts):
+        return False
+    for part, pattern_part in zip(parts, pattern_parts):
+        if part.startswith('.') and not pattern_part.startswith('.'):
+            return False
+        if not fnmatch.fnmatchcase(part, pattern_part):
+            return False
+    return True
+
+def atomic_write(filepath, text):
+    """ Atomic Write
+
+    Write a whole file to a temporary file in the same directory and rename it into place, so the file is
+    never left half written. An existing file keeps its permissions.
+
+    Args:
+        filepath (str): The path to the file to write.
+        text (:obj:`str` or :obj:`bytes`): The new contents of the file. bytes are written as they are.
+
+    """
+    handle, temp_path = temp_file(filepath)
+    try:
+        with os.fdopen(handle, 'wb' if isinstance(text, bytes) else 'w') as newfile:
+            newfile.write(text)
+        if os.path.exists(filepath):
+            shutil.copymode(filepath, temp_path)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def temp_file(filepath):
+    """ Temp File
+
+    Create a hidden temporary file next to filepath, to be renamed over it once it's written. It's created
+    with the permissions open() would give filepath, since the kernel applies the process umask.
+
+    Args:
+        filepath (str): The path the temporary file will be renamed to.
+
+    Returns:
+        tuple: The open file descriptor and the path of the temporary file.
+
+    """
+    directory, filename = os.path.split(filepath)
+    while True:
+        temp_path = os.path.join(directory, '.' + filename + '.' + os.urandom(6).hex() + '.tmp')
+        try:
+            return os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def iter_paths(pattern):
+    """ Iterate Paths
+
+    A lazy glob.glob that walks the directories with os.scandir and yields each path as soon as it's found,
+    in the same order glob.glob would list them. Memory use doesn't grow with the number of files.
+
+    Args:
+        pattern (str): The wildcard path. Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\\*/\\*/\\*.fits'
+
+    Yields:
+        str: Each path matching pattern.
+
+    """
+    if pattern.startswith('/'):
+        return _iter_paths('/', pattern[1:].split('/'))
+    return _iter_paths('', pattern.split('/'))
+
+def _iter_paths(directory, parts):
+    part, rest = parts[0], parts[1:]
+    if not any(char in part for char in '*?['):
+        path = os.path.join(directory, part)
+        if rest:
+            if os.path.isdir(path):
+                yield from _iter_paths(path, rest)
+        elif os.path.lexists(path):
+            yield path
+        return
+    try:
+        with os.scandir(directory or '.') as entries:
+            for entry in entries:
+                if entry.name.startswith('.') and not part.startswith('.'):
+                    continue
+                if not fnmatch.fnmatchcase(entry.name, part):
+                    continue
+                path = os.path.join(directory, entry.name)
+                if not rest:
+                    yield path
+                elif entry.is_dir():
+                    yield from _iter_paths(path, rest)
+    except OSError:
+        return
+
+def bounded_map(pool, function, iterables, window, chunksize=1):
+    """ Bounded Map
+
+    Like pool.map, but only window chunks are submitted ahead of the results that have been used, so the
+    arguments can come from a generator of any length and memory use stays flat. pool.map would read every
+    argument and submit every chunk up front.
+
+    Args:
+        pool (Executor): The pool to run function on, ex. a ProcessPoolExecutor.
+        function (function): A module level function, so it can be sent to worker processes.
+        iterables (list): The arguments of function, one iterable for each, as for map. Use itertools.repeat
+            for arguments that are the same for every call.
+        window (int): The number of chunks in flight at once, ex. twice the number of workers.
+        chunksize (:obj:`int`, optional): The number of calls sent to a worker at once. Defaults to 1.
+
+    Yields:
+        The result of each call, in the same order as the arguments.
+
+    """
+    calls = zip(*iterables)
+    pending = deque()
+    while True:
+        chunk = list(islice(calls, chunksize))
+        if chunk:
+            pending.append(pool.submit(_map_chunk, function, chunk))
+        if not pending:
+            return
+        if len(pending) >= window or not chunk:
+            yield from pending.popleft().result()
+
+def _map_chunk(function, chunk):
+    return [function(*args) for args in chunk]
@@ -0,0 +1,239 @@
+import copy
+import json
+import re
+
+#the parts of a profile, and what each one holds
+PROFILE_FIELDS = {
+    'instrument_names': 'values of the instrument key that select this profile, ex. ["MIRSI"]',
+    'instrument_keys': 'header keys naming the instrument, used to detect the profile',
+    'date_keys': 'header keys holding the observation date, in order of preference',
+    'time_keys': 'header keys holding the observation start time, in order of preference',
+    'end_keys': 'header keys holding the observation stop time, in order of preference',
+    'wavelength_keys': 'header keys holding the wavelength in microns, in order of preference',
+    'filter_keys': 'header keys holding the filter name, used when there is no wavelength key',
+    'chop_keys': 'header keys holding the chop frequency',
+    'mode_keys': 'header keys holding the observation mode',
+    'airmass_keys': 'header keys holding the air mass',
+    'date_formats': 'regular expressions for the observation date, with year, month and day groups',
+    'filters': 'wavelength in microns for each filter name',
+    'extrablocks': 'extra header blocks before the image that the primary header doesn\'t account for',
+}
+
+#the date formats seen so far: mm/dd/yyyy, mm/dd/yy and yyyy-mm-dd
+DATE_FORMATS = [r'(?P<month>\d\d)/(?P<day>\d\d)/(?P<year>\d\d\d\d)', r'(?P<month>\d\d)/(?P<day>\d\d)/(?P<year>\d\d)',
+    r'(?P<year>\d\d\d\d)-(?P<month>\d\d)-(?P<day>\d\d)']
+#filter wavelengths in microns, shared by the IRTF instruments
+IRTF_FILTERS = {'K': '2.2', 'N0': '7.9', 'N1': '8.7', 'N2': '9.6', 'N3': '10.3', 'N4': '11.7', 'N5': '12.5', 'Q0': '17.24',
+    'Q1': '17.93', 'Q2': '18.67', 'Q3': '20.82', 'Q4': '22.79', 'Qt': '24.2', 'Q5': '24.2', 'Q-s': '17.9', 'Q-1': '22.43',
+    'N': '10.79', 'M': '4.8'}
+
+#the profile used when no instrument is detected. It accepts every key variant the collections have used.
+DEFAULT_PROFILE = {
+    'instrument_names': [],
+    'instrument_keys': ['INSTRUME'],
+    'date_keys': ['DATE-OBS', 'DATEOBS', 'DATE_OBS'],
+    'time_keys': ['TIME-OBS', 'TIME-STR', 'TIME_OBS'],
+    'end_keys': ['TIME-END'],
+    'wavelength_keys': ['WAVELENG'],
+    'filter_keys': ['FILTER'],
+    'chop_keys': ['CHPFREQ'],
+    'mode_keys': ['OBSMODE'],
+    'airmass_keys': ['AIRMASS'],
+    'date_formats': DATE_FORMATS,
+    'filters': IRTF_FILTERS,
+    'extrablocks': 0,
+}
+
+PROFILES = {}
+
+def register_profile(name, profile, base='default'):
+    """ Register Profile
+
+    Add an instrument profile, or replace one, so it can be selected by name or detected from the headers.
+
+    Args:
+        name (str): The name of the profile, ex. 'mirsi'.
+        profile (dict): The parts of the profile that differ from base. See PROFILE_FIELDS for what each
+            part holds. Ex. {'instrument_names': ['MIRSI'], 'filters': {'N6': '13.1'}}. The filters are
+            added to base's filters, everything else replaces base's value.
+        base (:obj:`str`, optional): The profile to start from. Defaults to 'default'. Use None to give
+            every part of the profile.
+
+    Returns:
+        dict: The complete profile.
+
+    """
+    unknown = set(profile) - set(PROFILE_FIELDS) - {'name'}
+    if unknown:
+        raise ValueError('Unknown profile fields for ' + name + ': ' + ', '.join(sorted(unknown)))
+    full = copy.deepcopy(PROFILES[base]) if base is not None else {}
+    for field, value in profile.items():
+        if field == 'filters' and 'filters' in full:
+            full['filters'].update(value)
+        else:
+            full[field] = copy.deepcopy(value)
+    missing = set(PROFILE_FIELDS) - set(full)
+    if missing:
+        raise ValueError('Profile ' + name + ' is missing: ' + ', '.join(sorted(missing)))
+    for pattern in full['date_formats']:
+        if set(re.compile(pattern).groupindex) != {'year', 'month', 'day'}:
+            raise ValueError('Date format ' + pattern + ' in profile ' + name + ' needs year, month and day groups')
+    full['name'] = name
+    PROFILES[name] = full
+    return full
+
+def load_profiles(path):
+    """ Load Profiles
+
+    Register the profiles in a JSON file, so new instruments can be added without editing the code.
+
+    Args:
+        path (str): A JSON file of profiles by name, each given as for register_profile, with an optional
+            "base". Ex. {"michelle": {"instrument_names": ["michelle"], "time_keys": ["UTSTART"]}}
+
+    Returns:
+        list: The names of the profiles registered.
+
+    """
+    with open(path, 'r') as f:
+        profiles = json.load(f)
+    for name, profile in profiles.items():
+        profile = dict(profile)
+        base = profile.pop('base', 'default')
+        register_profile(name, profile, base)
+    return list(profiles)
+
+def profile_keys(profile):
+    """Every header key a profile reads, in order."""
+    keys = []
+    for field in ['instrument_keys', 'date_keys', 'time_keys', 'end_keys', 'wavelength_keys', 'filter_keys', 'chop_keys',
+            'mode_keys', 'airmass_keys']:
+        keys.extend(key for key in profile[field] if key not in keys)
+    return keys
+
+def registered_keys():
+    """Every header key any registered profile reads."""
+    keys = []
+    for profile in PROFILES.values():
+        keys.extend(key for key in profile_keys(profile) if key not in keys)
+    return keys
+
+def detect_profile(header):
+    """ Detect Profile
+
+    Args:
+        header (dict): A header from one of the collection's files, with at least the instrument keys.
+
+    Returns:
+        dict: The profile whose instrument_names match the instrument named in the header, or the default
+        profile if none do.
+
+    """
+    for profile in PROFILES.values():
+        for key in profile['instrument_keys']:
+            if key in header:
+                instrument = _normalize(header[key])
+                if any(instrument.startswith(_normalize(name)) for name in profile['instrument_names']):
+                    return profile
+    return PROFILES['default']
+
+def _normalize(name):
+    return re.sub(r'[\s_-]', '', str(name)).upper()
+
+def resolve_profile(profile=None, header=None):
+    """ Resolve Profile
+
+    Args:
+        profile (:obj:`str` or :obj:`dict`, optional): The name of a registered profile, or a complete profile.
+            Default is None, which detects the profile from header.
+        header (:obj:`dict`, optional): A sample header from the collection, used to detect the profile.
+
+    Returns:
+        dict: The profile.
+
+    """
+    if isinstance(profile, dict):
+        return profile
+    if profile is not None:
+        if profile not in PROFILES:
+            raise ValueError('Unknown profile ' + repr(profile) + '. Use one of: ' + ', '.join(PROFILES))
+        return PROFILES[profile]
+    if header is None:
+        return PROFILES['default']
+    return detect_profile(header)
+
+class Extractor:
+    """Extractor
+
+    A profile compiled for pulling the observation details out of each header of a collection. The key
+    lists and date formats are prepared once, so each header is read with plain lookups. Extractors can
+    be sent to worker processes.
+
+    Args:
+        profile (dict): A profile from resolve_profile.
+
+    """
+    def __init__(self, profile):
+        self.profile = profile
+        self.keys = profile_keys(profile)
+        self.date_keys = tuple(profile['date_keys'])
+        self.time_keys = tuple(profile['time_keys'])
+        self.end_keys = tuple(profile['end_keys'])
+        self.wavelength_keys = tuple(profile['wavelength_keys'])
+        self.filter_keys = tuple(profile['filter_keys'])
+        self.chop_keys = tuple(profile['chop_keys'])
+        self.mode_keys = tuple(profile['mode_keys'])
+        self.airmass_keys = tuple(profile['airmass_keys'])
+        self.date_formats = [re.compile(pattern) for pattern in profile['date_formats']]
+        self.filters = dict(profile['filters'])
+
+    def __call__(self, header):
+        """Pull the observation details out of a header.
+
+        Returns:
+            dict: The header's 'date', 'time', 'end', 'wavelength', 'chop_frequency', 'mode' and 'airmass' as
+            strings, each None if the header doesn't have it, and the date as 'yyyy-mm-dd' in 'iso_date' (None
+            if it isn't in one of the profile's date formats). The wavelength comes from the filter table when
+            there's no wavelength key.
+
+        """
+        date = _first(header, self.date_keys)
+        wavelength = _first(header, self.wavelength_keys)
+        if wavelength is None:
+            name = _first(header, self.filter_keys)
+            if name is not None:
+                wavelength = self.filters.get(name)
+        return {
+            'date': date,
+            'iso_date': self.iso_date(date) if date is not None else None,
+            'time': _first(header, self.time_keys),
+            'end': _first(header, self.end_keys),
+            'wavelength': wavelength,
+            'chop_frequency': _first(header, self.chop_keys),
+            'mode': _first(header, self.mode_keys),
+            'airmass': _first(header, self.airmass_keys),
+        }
+
+    def iso_date(self, date):
+        """Convert a date in one of the profile's formats to 'yyyy-mm-dd', or None if it's in none of them."""
+        for pattern in self.date_formats:
+            match = pattern.match(date)
+            if match:
+                year = match.group('year')
+                if len(year) == 2:
+                    year = ('19' if year >= '50' else '20') + year
+                return year + '-' + match.group('month') + '-' + match.group('day')
+        return None
+
+def _first(header, keys):
+    for key in keys:
+        if key in header:
+            return str(header[key])
+    return None
+
+register_profile('default', DEFAULT_PROFILE, base=None)
+register_profile('mirsi', {'instrument_names': ['MIRSI']})
+register_profile('trecs', {'instrument_names': ['TReCS', 'T-ReCS']})
+register_profile('comics', {'instrument_names': ['COMICS']})
+register_profile('mirlin', {'instrument_names': ['MIRLIN']})
+register_profile('mirac', {'instrument_names': ['MIRAC']})
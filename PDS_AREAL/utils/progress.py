@@ -0,0 +1,169 @@
+import contextlib
+import json
+import sys
+import time
+
+class RunStats:
+    """Run Stats
+
+    Record how long each stage of a run takes (glob, open, render, write, ...) and count what happened,
+    passing per-file messages and progress on to a reporter. The entry points create one of these from
+    their reporter argument, and print its summary at the end of the run.
+
+    Args:
+        reporter (:obj:`str` or reporter, optional): 'print' (the default) prints every per-file message, the
+            way the functions always have. 'quiet' prints nothing per file and no summary. 'progress' shows
+            a single updating progress line instead of the per-file messages. 'jsonl' writes one JSON object
+            per file to stdout, followed by a JSON summary. Any object with message, file and summary
+            methods (see PrintReporter) can also be passed in.
+        unit (:obj:`str`, optional): What is being counted in the summary. Defaults to 'files'.
+
+    """
+    def __init__(self, reporter='print', unit='files'):
+        self.reporter = get_reporter(reporter)
+        self.unit = unit
+        self.durations = {}
+        self.counts = {}
+        self.files = 0
+        self.total = None
+        self.start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the code in a with block as one run of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def timed(self, iterable, name):
+        """Iterate over iterable, timing how long each item takes to arrive as one run of a stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def add(self, name, seconds):
+        """Record one run of a stage that was timed elsewhere, ex. in a worker process."""
+        self.durations.setdefault(name, []).append(seconds)
+
+    def count(self, name, n=1):
+        """Add n to a counter, ex. stats.count('errors')."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def message(self, text):
+        """Pass on a per-file message, ex. 'Opening: /path/to/file.fits'."""
+        self.reporter.message(text)
+
+    def file(self, path, durations=None, messages=(), error=None):
+        """Record that a file is done, with the stage durations and messages that came back for it."""
+        self.files += 1
+        for text in messages:
+            self.reporter.message(text)
+        if durations:
+            for name, seconds in durations.items():
+                self.add(name, seconds)
+        self.reporter.file({'path': path, 'durations': durations or {}, 'messages': list(messages),
+            'error': error, 'done': self.files, 'total': self.total})
+
+    def summary(self):
+        """Report and return the throughput, counters and latency percentiles of each stage."""
+        elapsed = time.perf_counter() - self.start
+        summary = {'unit': self.unit, 'files': self.files, 'seconds': elapsed,
+            'files_per_sec': self.files / elapsed if elapsed else None, 'counts': dict(self.counts), 'stages': {}}
+        for name, durations in self.durations.items():
+            durations = sorted(durations)
+            summary['stages'][name] = {'count': len(durations), 'total': sum(durations),
+                'p50': _percentile(durations, 50), 'p90': _percentile(durations, 90), 'p99': _percentile(durations, 99)}
+        self.reporter.summary(summary)
+        return summary
+
+def _percentile(durations, percent):
+    #nearest-rank percentile of a sorted list
+    index = max(0, -(-len(durations) * percent // 100) - 1)
+    return durations[index]
+
+def get_reporter(reporter):
+    """Turn a reporter name into a reporter. Reporter objects are returned as they are."""
+    if not isinstance(reporter, str):
+        return reporter
+    reporters = {'print': PrintReporter, 'quiet': QuietReporter, 'progress': ProgressReporter, 'jsonl': JsonLinesReporter}
+    if reporter not in reporters:
+        raise ValueError('Unknown reporter ' + repr(reporter) + '. Use one of: ' + ', '.join(reporters))
+    return reporters[reporter]()
+
+class QuietReporter:
+    """Report nothing."""
+    def message(self, text):
+        pass
+
+    def file(self, record):
+        pass
+
+    def summary(self, summary):
+        pass
+
+class PrintReporter(QuietReporter):
+    """Print every per-file message, then a summary table."""
+    def message(self, text):
+        print(text)
+
+    def summary(self, summary):
+        print(format_summary(summary))
+
+class ProgressReporter(QuietReporter):
+    """Show one progress line that updates in place, then a summary table."""
+    def __init__(self, stream=None, interval=0.2):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.last = 0
+
+    def file(self, record):
+        now = time.perf_counter()
+        if now - self.last < self.interval and record['done'] != record['total']:
+            return
+        self.last = now
+        if record['total']:
+            width = 30
+            filled = width * record['done'] // record['total']
+            line = '[' + '#' * filled + '-' * (width - filled) + '] ' + str(record['done']) + '/' + str(record['total'])
+        else:
+            line = str(record['done']) + ' done'
+        self.stream.write('\r' + line)
+        self.stream.flush()
+
+    def summary(self, summary):
+        self.stream.write('\n')
+        self.stream.flush()
+        print(format_summary(summary))
+
+class JsonLinesReporter(QuietReporter):
+    """Write one JSON object per file, then one for the summary."""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def file(self, record):
+        self.stream.write(json.dumps(record) + '\n')
+
+    def summary(self, summary):
+        self.stream.write(json.dumps({'summary': summary}) + '\n')
+        self.stream.flush()
+
+def format_summary(summary):
+    """Format a summary from RunStats.summary as a table."""
+    lines = [str(summary['files']) + ' ' + summary['unit'] + ' in ' + '%.2f' % summary['seconds'] + ' s (' +
+        '%.1f' % (summary['files_per_sec'] or 0) + ' ' + summary['unit'] + '/s)']
+    if summary['counts']:
+        lines.append(', '.join(name + ': ' + str(count) for name, count in sorted(summary['counts'].items())))
+    if summary['stages']:
+        lines.append('%-10s %8s %10s %10s %10s %10s' % ('stage', 'count', 'total s', 'p50 ms', 'p90 ms', 'p99 ms'))
+        for name, stage in summary['stages'].items():
+            lines.append('%-10s %8d %10.3f %10.3f %10.3f %10.3f' % (name, stage['count'], stage['total'],
+                stage['p50'] * 1000, stage['p90'] * 1000, stage['p99'] * 1000))
+    return '\n'.join(lines)
@@ -0,0 +1,153 @@
+import io
+import os
+import threading
+import time
+from PDS_AREAL.utils.pdsutils import atomic_write, temp_file
+
+#tarfile stream modes for each archive extension
+TAR_MODES = {'.tar': 'w|', '.tar.gz': 'w|gz', '.tgz': 'w|gz', '.tar.bz2': 'w|bz2', '.tar.xz': 'w|xz'}
+
+def open_sink(sink, root=None):
+    """Turn a sink argument into a sink. None is the archive tree itself, a path ending in .zip or one of
+    TAR_MODES opens an ArchiveSink there with its member names relative to root (the entry points pass the
+    directory the bundle is in), and sink objects are returned as they are."""
+    if sink is None:
+        return DirectorySink()
+    if not isinstance(sink, str):
+        return sink
+    return ArchiveSink(sink, root or None)
+
+class DirectorySink:
+    """Directory Sink
+
+    Where the labels and logs are written. This one writes each file in place in the archive tree (via a
+    temporary file that's renamed into place), the way the functions always have. The other sinks take the
+    same calls, so any of them can be passed as an entry point's sink argument.
+
+    """
+    #True if the files are written where their paths say, so they can be read back from the file system
+    in_place = True
+
+    def exists(self, path):
+        """Whether path has been written, so the labels that already exist can be skipped."""
+        return os.path.exists(path)
+
+    def write(self, path, text):
+        """Write a whole file."""
+        atomic_write(path, text)
+
+    def close(self):
+        """Finish writing. Sinks opened by an entry point from a path are closed by it."""
+        pass
+
+class MemorySink(DirectorySink):
+    """Memory Sink
+
+    Keep the files in the files dictionary, by path, instead of writing them. For tests and dry runs.
+
+    """
+    in_place = False
+
+    def __init__(self):
+        self.files = {}
+
+    def exists(self, path):
+        return path in self.files
+
+    def write(self, path, text):
+        self.files[path] = text
+
+class ArchiveSink(DirectorySink):
+    """Archive Sink
+
+    Stream the files into one tar or zip archive for delivery, rather than creating each small file in the
+    archive tree. The archive is written sequentially to a temporary file next to archive_path and renamed
+    into place when it's closed, so an interrupted run never leaves a partial archive. Use it in a with
+    block, or call close, to finish the archive. One sink can be passed to several entry points (ex. the
+    fits labels, the logs and the log labels) to put all of their files in the same archive.
+
+    Args:
+        archive_path (str): The archive to write, ending in .zip, .tar, .tar.gz, .tgz, .tar.bz2 or .tar.xz.
+            Ex. '/prvt/juno1/delivery/jup_supp.irtf_mirsi_labels.tar.gz'
+        root (:obj:`str`, optional): Member names are the paths relative to root, ex. with root
+            '/prvt/juno1/PDART_files', 'jup_supp.irtf_mirsi/data_raw/2003/05-06/a.xml'. Default is None,
+            which uses the whole path without its leading slash, like tar does.
+
+    """
+    in_place = False
+
+    def __init__(self, archive_path, root=None):
+        self.archive_path = archive_path
+        self.root = root
+        self.names = set()
+        self.lock = threading.Lock()
+        if archive_path.endswith('.zip'):
+            mode = None
+        else:
+            mode = next((mode for extension, mode in TAR_MODES.items() if archive_path.endswith(extension)), None)
+            if mode is None:
+                raise ValueError('Unknown archive type for ' + archive_path + '. Use .zip or one of: ' + ', '.join(TAR_MODES))
+        handle, self.temp_path = temp_file(archive_path)
+        self.stream = os.fdopen(handle, 'wb')
+        #imported here so the entry points don't load them unless they're writing an archive
+        if mode is None:
+            import zipfile
+            self.archive = zipfile.ZipFile(self.stream, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            import tarfile
+            self.archive = tarfile.open(fileobj=self.stream, mode=mode)
+        self.zip = mode is None
+
+    def exists(self, path):
+        return self.name(path) in self.names
+
+    def name(self, path):
+        """The member name of path in the archive."""
+        if self.root is None:
+            return path.lstrip('/')
+        return os.path.relpath(path, self.root)
+
+    def write(self, path, text):
+        data = text.encode('utf-8')
+        name = self.name(path)
+        with self.lock:
+            if self.zip:
+                import zipfile
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                self.archive.writestr(info, data)
+            else:
+                import tarfile
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = time.time()
+                info.mode = 0o644
+                self.archive.addfile(info, io.BytesIO(data))
+            self.names.add(name)
+
+    def close(self):
+        if self.archive is None:
+            return
+        with self.lock:
+            self.archive.close()
+            self.stream.close()
+            self.archive = None
+        os.replace(self.temp_path, self.archive_path)
+
+    def abort(self):
+        """Stop writing and remove the partial archive."""
+        if self.archive is None:
+            return
+        self.archive = None
+        self.stream.close()
+        os.unlink(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            self.close()
+        else:
+            self.abort()
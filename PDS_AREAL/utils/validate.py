@@ -0,0 +1,214 @@
+from itertools import repeat
+import io
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from PDS_AREAL.utils.labeltemplate import SLOT
+from PDS_AREAL.utils.pdsutils import atomic_write, bounded_map, iter_paths
+
+PDS_NAMESPACE = '{http://pds.nasa.gov/pds4/pds/v1}'
+DISP_NAMESPACE = '{http://pds.nasa.gov/pds4/disp/v1}'
+#yyyy-mm-ddThh:mm:ss with optional fractional seconds and Z
+DATE_TIME = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d?):(\d\d):(\d\d(?:\.\d*)?)Z?$')
+#elements whose values are checked
+CHECKED = {'Identification_Area/logical_identifier', 'Observation_Area/Time_Coordinates/start_date_time',
+    'Observation_Area/Time_Coordinates/stop_date_time', 'File_Area_Observational/File/file_name',
+    'File_Area_Observational/File/file_size', 'File_Area_Observational/Header/object_length'}
+
+def required_elements(templatevar):
+    """ Required Elements
+
+    Args:
+        templatevar (str): The absolute path to the txt label template the labels were made from.
+            Ex. '/home/bblakley/scripts/pdart_fits_label.txt'
+
+    Returns:
+        set: The path of every element in the template, ex. 'Identification_Area/logical_identifier'.
+        Elements outside the PDS namespace keep their prefix, ex. 'Observation_Area/Discipline_Area/disp:Display_Settings'.
+
+    """
+    with open(templatevar, 'r') as template:
+        text = template.read()
+    #fill in the slots so the template parses. The stop time slot closes its own tag.
+    text = text.replace('$PRODUCT_STOP_TIME$', '>')
+    text = SLOT.sub('0', text)
+    elements = set()
+    stack = []
+    for event, element in ET.iterparse(io.BytesIO(text.encode('utf-8')), events=('start', 'end')):
+        if event == 'start':
+            stack.append(_name(element.tag))
+            if len(stack) > 1:
+                elements.add('/'.join(stack[1:]))
+        else:
+            stack.pop()
+    return elements
+
+def _name(tag):
+    if tag.startswith(PDS_NAMESPACE):
+        return tag[len(PDS_NAMESPACE):]
+    if tag.startswith(DISP_NAMESPACE):
+        return 'disp:' + tag[len(DISP_NAMESPACE):]
+    return tag
+
+def validate_label(path, required):
+    """ Validate Label
+
+    Check a single label, reading it incrementally so only the current element is held in memory.
+
+    Args:
+        path (str): The path to the xml label.
+        required (set): The element paths every label must have, from required_elements.
+
+    Returns:
+        dict: The label's 'path', its 'lid' (None if it has none) and a list of 'problems' (empty if the
+        label passed every check).
+
+    """
+    problems = []
+    found = set()
+    values = {}
+    stop_nil = False
+    stack = []
+    try:
+        for event, element in ET.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                stack.append(_name(element.tag))
+                if len(stack) > 1:
+                    found.add('/'.join(stack[1:]))
+                continue
+            location = '/'.join(stack[1:])
+            text = element.text or ''
+            slots = SLOT.findall(' '.join([text] + list(element.attrib.values())))
+            if slots:
+                problems.append('Unfilled template variable in ' + location + ': ' + ', '.join('$' + slot + '$' for slot in sorted(set(slots))))
+            if location in CHECKED:
+                values[location] = text.strip()
+                if location == 'Observation_Area/Time_Coordinates/stop_date_time':
+                    stop_nil = element.get('{http://www.w3.org/2001/XMLSchema-instance}nil') == 'true'
+            stack.pop()
+            element.clear()
+    except ET.ParseError as e:
+        return {'path': path, 'lid': None, 'problems': ['Not well-formed XML: ' + str(e)]}
+    for location in sorted(required - found):
+        problems.append('Missing element: ' + location)
+    #the observation has to end after it starts
+    start = values.get('Observation_Area/Time_Coordinates/start_date_time')
+    stop = values.get('Observation_Area/Time_Coordinates/stop_date_time')
+    if start is not None and not stop_nil and stop is not None:
+        start_time, stop_time = parse_time(start), parse_time(stop)
+        if start_time is None or stop_time is None:
+            problems.append('Unreadable start_date_time or stop_date_time: ' + start + ', ' + stop)
+        elif not start_time < stop_time:
+            problems.append('start_date_time ' + start + ' is not before stop_date_time ' + stop)
+    #the header and the data have to add up to the whole file
+    file_name = values.get('File_Area_Observational/File/file_name')
+    file_size = values.get('File_Area_Observational/File/file_size')
+    if file_name is not None and file_size is not None:
+        offset = values.get('File_Area_Observational/Header/object_length', '0')
+        try:
+            actual = os.stat(os.path.join(os.path.dirname(path), file_name)).st_size
+            if int(offset) + int(file_size) != actual:
+                problems.append('Header offset ' + offset + ' plus file_size ' + file_size + ' is not the file size ' + str(actual))
+        except OSError as e:
+            problems.append('Labeled file not readable: ' + str(e))
+        except ValueError:
+            problems.append('Header offset ' + offset + ' or file_size ' + file_size + ' is not a number')
+    return {'path': path, 'lid': values.get('Identification_Area/logical_identifier'), 'problems': problems}
+
+def parse_time(text):
+    """Split a PDS date time into (year, month, day, hour, minute, seconds) numbers for comparing, or None
+    if it isn't one. The hours and fractions of a second aren't always the same length, so the text doesn't
+    sort on its own."""
+    match = DATE_TIME.match(text)
+    if match is None:
+        return None
+    return tuple(int(group) for group in match.groups()[:5]) + (float(match.group(6)),)
+
+def inventory_lids(inventory):
+    """ Inventory LIDs
+
+    Args:
+        inventory (str): The path to a CSV made by create_inventory.
+
+    Returns:
+        set: The LID of every product in the inventory, without its version.
+
+    """
+    lids = set()
+    with open(inventory, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                lids.add(line.split(',', 1)[1].strip().split('::', 1)[0])
+    return lids
+
+def validate_collection(pathvar, templatevar, inventory=None, report=None, workers=None, print_status=True):
+    """ Validate Collection
+
+    Check every label in a collection: that it has every element of the template, that no $VAR$ was left
+    unfilled, that start_date_time is before stop_date_time, that the header offset plus file_size is the
+    size of the labeled file, and that the labels' LIDs are exactly the LIDs in the inventory. Labels are
+    streamed from the directories and parsed incrementally, so memory use stays flat however large the
+    collection is, apart from the set of LIDs.
+
+    Args:
+        pathvar (str): The absolute path to the labels, with wildcards.
+            Ex. '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/\*/\*/\*.xml'
+        templatevar (str): The absolute path to the txt label template the labels were made from.
+        inventory (:obj:`str`, optional): The path to the collection's inventory CSV, ex.
+            '/prvt/juno1/PDART_files/jup_supp.irtf_mirsi/data_raw/collection_jup_supp.irtf_mirsi_data_raw_inventory.csv'.
+            Default is None, which skips the LID check.
+        report (:obj:`str`, optional): Path to save the report to as JSON. Default is None.
+        workers (:obj:`int`, optional): Number of worker processes to check the labels with. Default is
+            None, which checks them one at a time in this process.
+        print_status (:obj:`bool`, optional): By default, the function will print each problem found and a
+            summary. For quiet mode, change to False.
+
+    Returns:
+        dict: The report: 'labels_checked', 'labels_with_problems', the 'problems' of each failing label by
+        path, and with an inventory, the LIDs 'missing_from_inventory' and 'missing_labels' (in the inventory
+        but not labeled).
+
+    """
+    required = required_elements(templatevar)
+    result = {'labels_checked': 0, 'labels_with_problems': 0, 'problems': {}}
+    lids = set()
+    pool = None
+    if workers:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        #started by a fork server, since forking a process with threads (ex. the pipeline's) isn't safe
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+        #a few chunks at a time are in flight, so the labels are streamed however many there are
+        results = bounded_map(pool, validate_label, [iter_paths(pathvar), repeat(required)], workers * 2, chunksize=64)
+    else:
+        results = map(validate_label, iter_paths(pathvar), repeat(required))
+    try:
+        for label in results:
+            result['labels_checked'] += 1
+            if label['lid'] is not None:
+                lids.add(label['lid'])
+            if label['problems']:
+                result['labels_with_problems'] += 1
+                result['problems'][label['path']] = label['problems']
+                if print_status:
+                    for problem in label['problems']:
+                        print(label['path'] + ': ' + problem)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if inventory is not None:
+        listed = inventory_lids(inventory)
+        result['missing_from_inventory'] = sorted(lids - listed)
+        result['missing_labels'] = sorted(listed - lids)
+        if print_status:
+            for lid in result['missing_from_inventory']:
+                print('Labeled but not in ' + inventory + ': ' + lid)
+            for lid in result['missing_labels']:
+                print('In ' + inventory + ' but not labeled: ' + lid)
+    if report is not None:
+        atomic_write(report, json.dumps(result, indent=1))
+    if print_status:
+        print('Checked ' + str(result['labels_checked']) + ' labels, ' + str(result['labels_with_problems']) + ' with problems.')
+    return result
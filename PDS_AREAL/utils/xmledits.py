@@ -1,119 +1,238 @@
 import glob
-import xml.etree.ElementTree as ET
-ET.register_namespace('',"http://pds.nasa.gov/pds4/pds/v1")
-ET.register_namespace('xsi',"http://www.w3.org/2001/XMLSchema-instance")
-ET.register_namespace('disp',"http://pds.nasa.gov/pds4/disp/v1")
-
-def update_descriptions(textHeader, textImage, pathvar):
-	xmlversion = '''<?xml version="1.0" encoding="UTF-8"?>
-<?xml-model href="https://pds.nasa.gov/pds4/pds/v1/PDS4_PDS_1A10.sch" schematypens="http://purl.oclc.org/dsdl/schematron"?>\n'''
-	search_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
-		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	replace_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
-		xmlns:disp="http://pds.nasa.gov/pds4/disp/v1"
-		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	for file in glob.glob(pathvar):
-		with open(file, 'r') as activefile:
-			text = activefile.read()
-			text = text.replace(search_text, replace_text)
-		with open(file, 'w') as activefile:
-			activefile.write(text)
-		tree = ET.parse(file)
-		root = tree.getroot()
-		FileAreaObservational = root.find('{http://pds.nasa.gov/pds4/pds/v1}File_Area_Observational')
-		Header = FileAreaObservational.find('{http://pds.nasa.gov/pds4/pds/v1}Header')
-		HeaderDescription = Header.find('{http://pds.nasa.gov/pds4/pds/v1}description')
-		Array2DImage = FileAreaObservational.find('{http://pds.nasa.gov/pds4/pds/v1}Array_2D_Image')
-		ImageDescription = Array2DImage.find('{http://pds.nasa.gov/pds4/pds/v1}description')
-		HeaderDescription.text = textHeader
-		ImageDescription.text = textImage
-		tree.write(file)
-		with open(file, 'r') as f:
-			filedata = f.read()
-		filedata = xmlversion + filedata
-		with open(file, 'w') as f:
-			f.write(filedata)
-
-def update_pubyear(year, pathvar):
-	xmlversion = '''<?xml version="1.0" encoding="UTF-8"?>
-<?xml-model href="https://pds.nasa.gov/pds4/pds/v1/PDS4_PDS_1A10.sch" schematypens="http://purl.oclc.org/dsdl/schematron"?>\n'''
-	search_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
-		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	replace_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
-		xmlns:disp="http://pds.nasa.gov/pds4/disp/v1"
-		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	for file in glob.glob(pathvar):
-		with open(file, 'r') as activefile:
-			text = activefile.read()
-			text = text.replace(search_text, replace_text)
-		with open(file, 'w') as activefile:
-			activefile.write(text)
-		tree = ET.parse(file)
-		root = tree.getroot()
-		IDArea = root.find('{http://pds.nasa.gov/pds4/pds/v1}Identification_Area')
-		CitationInfo = IDArea.find('{http://pds.nasa.gov/pds4/pds/v1}Citation_Information')
-		PubYear = CitationInfo.find('{http://pds.nasa.gov/pds4/pds/v1}publication_year')
-		PubYear.text = year
-		tree.write(file)
-		with open(file, 'r') as f:
-			filedata = f.read()
-		filedata = xmlversion + filedata
-		with open(file, 'w') as f:
-			f.write(filedata)
-
-def update_time(start_date_time, stop_date_time, pathvar):
-	xmlversion = '''<?xml version="1.0" encoding="UTF-8"?>
-<?xml-model href="https://pds.nasa.gov/pds4/pds/v1/PDS4_PDS_1A10.sch" schematypens="http://purl.oclc.org/dsdl/schematron"?>\n'''
-	search_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
-		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	replace_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
-		xmlns:disp="http://pds.nasa.gov/pds4/disp/v1"
-		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	for file in glob.glob(pathvar):
-		with open(file, 'r') as activefile:
-			text = activefile.read()
-			text = text.replace(search_text, replace_text)
-		with open(file, 'w') as activefile:
-			activefile.write(text)
-		tree = ET.parse(file)
-		root = tree.getroot()
-		ContextArea = root.find('{http://pds.nasa.gov/pds4/pds/v1}Context_Area')
-		TimeCoord = ContextArea.find('{http://pds.nasa.gov/pds4/pds/v1}Time_Coordinates')
-		start = TimeCoord.find('{http://pds.nasa.gov/pds4/pds/v1}start_date_time')
-		stop = TimeCoord.find('{http://pds.nasa.gov/pds4/pds/v1}stop_date_time')
-		start.text = start_date_time
-		stop.text = stop_date_time
-		tree.write(file)
-		with open(file, 'r') as f:
-			filedata = f.read()
-		filedata = xmlversion + filedata
-		with open(file, 'w') as f:
-			f.write(filedata)
-
-def fixLIDs(bundleID,collectionID,pathvar):
-	xmlversion = '''<?xml version="1.0" encoding="UTF-8"?>
-<?xml-model href="https://pds.nasa.gov/pds4/pds/v1/PDS4_PDS_1A10.sch" schematypens="http://purl.oclc.org/dsdl/schematron"?>\n'''
-	search_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
+from xml.parsers import expat
+from PDS_AREAL.utils.dirindex import index_glob
+from PDS_AREAL.utils.pdsutils import atomic_write
+
+NAMESPACES = {'pds': 'http://pds.nasa.gov/pds4/pds/v1', 'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+	'disp': 'http://pds.nasa.gov/pds4/disp/v1'}
+#where Time_Coordinates is in observational products, and in collection and bundle labels
+TIME_AREAS = ['Observation_Area', 'Context_Area']
+search_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
 		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	replace_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
+replace_text = '''<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
 		xmlns:disp="http://pds.nasa.gov/pds4/disp/v1"
 		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'''
-	for file in glob.glob(pathvar):
-		filename = file.rsplit('/',1)[1]
-		fileID = filename.rsplit('.',1)[0]
-		with open(file, 'r') as activefile:
-			text = activefile.read()
-			text = text.replace(search_text, replace_text)
-		with open(file, 'w') as activefile:
-			activefile.write(text)
-		tree = ET.parse(file)
-		root = tree.getroot()
-		IDArea = root.find('{http://pds.nasa.gov/pds4/pds/v1}Identification_Area')
-		LID = IDArea.find('{http://pds.nasa.gov/pds4/pds/v1}logical_identifier')
-		LID.text = 'urn:nasa:pds:' + bundleID + ':' + collectionID + ':' + fileID
-		tree.write(file)
-		with open(file, 'r') as f:
-			filedata = f.read()
-		filedata = xmlversion + filedata
-		with open(file, 'w') as f:
-			f.write(filedata)
+
+def set_text(path, text):
+	"""Set Text
+
+	An edit for apply_edits that sets the text of one element.
+
+	Args:
+		path (str): The path to the element from the root of the label, ex.
+			'Identification_Area/Citation_Information/publication_year'. Elements are in the PDS namespace
+			unless they have a prefix, ex. 'Observation_Area/Discipline_Area/disp:Display_Settings'.
+		text (str): The new text of the element.
+
+	"""
+	return ('text', path, text)
+
+def fix_namespaces():
+	"""Fix Namespaces
+
+	An edit for apply_edits that adds the disp namespace to the Product_Observational element.
+
+	"""
+	return ('namespaces',)
+
+def lid_from_filename(bundleID, collectionID):
+	"""LID From Filename
+
+	An edit for apply_edits that rewrites the logical_identifier from the label's file name.
+
+	Args:
+		bundleID (str): The name of the bundle, ex. 'jup_supp.irtf_mirsi'.
+		collectionID (str): The name of the collection, ex. 'data_raw'.
+
+	"""
+	return ('lid', bundleID, collectionID)
+
+def set_times(start_date_time, stop_date_time):
+	"""Set Times
+
+	An edit for apply_edits that sets the start_date_time and stop_date_time of the label's Time_Coordinates,
+	which are in the Observation_Area of observational products and the Context_Area of collection and
+	bundle labels.
+
+	Args:
+		start_date_time (str): The new start time, ex. '2003-05-06T08:12:45.0000Z'.
+		stop_date_time (str): The new stop time.
+
+	"""
+	return ('times', start_date_time, stop_date_time)
+
+def apply_edits(pathvar, edits, index=None):
+	"""Apply Edits
+
+	Apply a list of edits to every label in pathvar with a single read, parse and write per label. Only the
+	text of the edited elements changes: the new values are spliced into the label at the byte offsets the
+	parser reports, so the prolog, indentation, attribute order and comments are kept exactly as they were.
+	Each label is written to a temporary file and renamed into place, so an interrupted run never leaves a
+	truncated label, and labels the edits don't change aren't written at all.
+
+	Args:
+		pathvar (str): The absolute path to the labels, with wildcards.
+			Ex. '/prvt/juno1/PDART_files/jup_supp.geminis_trecs/data_raw/\*/\*/\*.xml'
+		edits (list): Edits from set_text, set_times, fix_namespaces and lid_from_filename, applied in order.
+			Ex. [fix_namespaces(), set_text('Identification_Area/Citation_Information/publication_year', '2022')]
+		index (:obj:`dict`, optional): An index from PDS_AREAL.utils.dirindex.build_index covering pathvar. The
+			labels are then listed from the index instead of globbing. The update_* functions and fixLIDs take
+			it too. Default is None.
+
+	"""
+	for file in (glob.glob(pathvar) if index is None else index_glob(index, pathvar)):
+		edit_label(file, edits)
+
+def edit_label(file, edits):
+	"""Edit Label
+
+	Apply a list of edits to a single label. See apply_edits.
+
+	Args:
+		file (str): The path to the label.
+		edits (list): Edits from set_text, set_times, fix_namespaces and lid_from_filename.
+
+	"""
+	with open(file, 'rb') as activefile:
+		data = activefile.read()
+	edited = data
+	if fix_namespaces() in edits:
+		edited = edited.replace(search_text.encode('utf-8'), replace_text.encode('utf-8'))
+	#the new text of each element, by its path. A later edit of the same element wins.
+	values = {}
+	#elements that may be in any one of several places, as a list of the paths for each place
+	alternatives = []
+	for edit in edits:
+		if edit[0] == 'text':
+			values[_qualify(edit[1])] = edit[2]
+		elif edit[0] == 'times':
+			places = []
+			for area in TIME_AREAS:
+				paths = [_qualify(area + '/Time_Coordinates/start_date_time'), _qualify(area + '/Time_Coordinates/stop_date_time')]
+				values[paths[0]], values[paths[1]] = edit[1], edit[2]
+				places.append(paths)
+			alternatives.append(places)
+		elif edit[0] == 'lid':
+			filename = file.rsplit('/',1)[1]
+			fileID = filename.rsplit('.',1)[0]
+			values[_qualify('Identification_Area/logical_identifier')] = 'urn:nasa:pds:' + edit[1] + ':' + edit[2] + ':' + fileID
+	spans = find_text_spans(edited, values)
+	optional = set()
+	for places in alternatives:
+		if not any(all(path in spans for path in paths) for paths in places):
+			raise ValueError(' or '.join(_unqualify(paths[0]).rsplit('/', 1)[0] for paths in places) + ' not found in ' + file)
+		optional.update(path for paths in places for path in paths)
+	for path in values:
+		if path not in spans and path not in optional:
+			raise ValueError(_unqualify(path) + ' not found in ' + file)
+	#splice from the end of the label back, so the offsets of the earlier spans stay put
+	for path, (start, end, opening, closing) in sorted(spans.items(), key=lambda item: item[1][0], reverse=True):
+		text = escape(values[path]).encode('ascii', 'xmlcharrefreplace')
+		edited = edited[:start] + opening + text + closing + edited[end:]
+	if edited != data:
+		atomic_write(file, edited)
+
+def find_text_spans(data, paths):
+	"""Find Text Spans
+
+	Find where the text of each element is in a label, with an incremental parse that stops as soon as
+	every element has been found.
+
+	Args:
+		data (bytes): The label.
+		paths (iterable): The elements to find, each as a tuple of the '{namespace}name' steps from the root of
+			the label, ex. ('{http://pds.nasa.gov/pds4/pds/v1}Identification_Area', '{http://pds.nasa.gov/pds4/pds/v1}logical_identifier').
+			Only the first element on each path is found.
+
+	Returns:
+		dict: For each path found, the byte offsets of the start and end of the element's text, and the bytes
+		to put before and after the new text. These are empty unless the element was written as an empty tag
+		(ex. <stop_date_time xsi:nil="true"/>), whose '/>' is replaced by '>', the text and a closing tag.
+
+	"""
+	wanted = set(paths)
+	spans = {}
+	stack = []
+	#the path and the byte offset of the start tag of the element being read, while it's one we want
+	current = []
+	parser = expat.ParserCreate(namespace_separator='}')
+
+	def start_element(name, attributes):
+		stack.append('{' + name if '}' in name else name)
+		if current:
+			raise ValueError(_unqualify(current[0]) + ' has child elements, so its text can\'t be set')
+		path = tuple(stack[1:])
+		if path in wanted and path not in spans:
+			current[:] = [path, parser.CurrentByteIndex]
+
+	def end_element(name):
+		if current:
+			path, start = current
+			tag_end = _tag_end(data, start)
+			if data[tag_end - 1:tag_end] == b'/':
+				#an empty tag like <a/>, which is opened up in place of its '/>'
+				qname = data[start + 1:tag_end].split()[0].rstrip(b'/')
+				spans[path] = (tag_end - 1, tag_end + 1, b'>', b'</' + qname + b'>')
+			else:
+				spans[path] = (tag_end + 1, parser.CurrentByteIndex, b'', b'')
+			del current[:]
+			if len(spans) == len(wanted):
+				raise StopIteration
+		stack.pop()
+
+	parser.StartElementHandler = start_element
+	parser.EndElementHandler = end_element
+	try:
+		parser.Parse(data, True)
+	except StopIteration:
+		pass
+	return spans
+
+def _tag_end(data, start):
+	#the offset of the '>' ending the tag that starts at start, skipping any '>' in the attribute values
+	quote = None
+	for index in range(start, len(data)):
+		character = data[index:index + 1]
+		if quote is not None:
+			if character == quote:
+				quote = None
+		elif character in (b'"', b"'"):
+			quote = character
+		elif character == b'>':
+			return index
+	raise ValueError('Unterminated tag at byte ' + str(start))
+
+def escape(text):
+	"""Escape &, < and > in text for an XML element, like xml.sax.saxutils.escape, which would import urllib
+	and http along with it."""
+	return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _qualify(path):
+	steps = []
+	for step in path.split('/'):
+		prefix, _, name = step.rpartition(':')
+		steps.append('{' + NAMESPACES[prefix or 'pds'] + '}' + name)
+	return tuple(steps)
+
+def _unqualify(path):
+	prefixes = dict((namespace, prefix) for prefix, namespace in NAMESPACES.items())
+	steps = []
+	for step in path:
+		namespace, _, name = step[1:].partition('}')
+		steps.append(name if prefixes[namespace] == 'pds' else prefixes[namespace] + ':' + name)
+	return '/'.join(steps)
+
+def update_descriptions(textHeader, textImage, pathvar, index=None):
+	apply_edits(pathvar, [fix_namespaces(),
+		set_text('File_Area_Observational/Header/description', textHeader),
+		set_text('File_Area_Observational/Array_2D_Image/description', textImage)], index)
+
+def update_pubyear(year, pathvar, index=None):
+	apply_edits(pathvar, [fix_namespaces(),
+		set_text('Identification_Area/Citation_Information/publication_year', year)], index)
+
+def update_time(start_date_time, stop_date_time, pathvar, index=None):
+	apply_edits(pathvar, [fix_namespaces(), set_times(start_date_time, stop_date_time)], index)
+
+def fixLIDs(bundleID,collectionID,pathvar,index=None):
+	apply_edits(pathvar, [fix_namespaces(), lid_from_filename(bundleID, collectionID)], index)
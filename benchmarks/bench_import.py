@@ -0,0 +1,79 @@
+"""PDS_AREAL import benchmark
+
+Time how long a fresh interpreter takes to import each entry point module, and check that none of them
+pulls in a heavy dependency (astropy, numpy) or prints anything at import. Short cron and shell
+invocations pay this cost on every run. Ex.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --max-seconds 0.3
+
+Exits with status 1 if a module imports a heavy dependency, prints on import or is slower than --max-seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['PDS_AREAL', 'PDS_AREAL.create.createinventory', 'PDS_AREAL.create.createlogs', 'PDS_AREAL.newlabels.fitslabels',
+    'PDS_AREAL.newlabels.headerlogslabels', 'PDS_AREAL.newlabels.collectionlabels', 'PDS_AREAL.utils.pdsutils', 'PDS_AREAL.utils.xmledits', 'PDS_AREAL.utils.catalog']
+#modules that should only be loaded when they're actually used
+HEAVY = ['astropy', 'numpy']
+#run in the child interpreter: import the module, then report the time and which heavy modules got loaded
+CHILD = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+sys.stdout.write(json.dumps({{'seconds': seconds, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+def time_import(module, repeat=5):
+    """Time Import
+
+    Args:
+        module (str): The module to import, ex. 'PDS_AREAL.create.createinventory'.
+        repeat (:obj:`int`, optional): The number of fresh interpreters to time it in. Defaults to 5.
+
+    Returns:
+        dict: The median 'seconds' of the import, the 'heavy' dependencies it loaded, and any 'output'
+        it printed.
+
+    """
+    times = []
+    for i in range(repeat):
+        result = subprocess.run([sys.executable, '-c', CHILD.format(module=module, heavy=HEAVY)], cwd=REPO,
+            capture_output=True, text=True, check=True)
+        #anything before the JSON on stdout was printed by the import
+        output, _, data = result.stdout.rpartition('{"seconds"')
+        data = json.loads('{"seconds"' + data)
+        times.append(data['seconds'])
+    return {'seconds': statistics.median(times), 'heavy': data['heavy'], 'output': output}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time importing the PDS_AREAL modules in fresh interpreters.')
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5, help='interpreters per module (default 5)')
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail if an import takes longer than this')
+    parser.add_argument('--output', help='save the results as JSON')
+    args = parser.parse_args()
+    results = {}
+    failed = False
+    print('%-40s %10s  %s' % ('module', 'ms', 'problems'))
+    for module in args.modules:
+        result = results[module] = time_import(module, args.repeat)
+        problems = []
+        if result['heavy']:
+            problems.append('imports ' + ', '.join(result['heavy']))
+        if result['output']:
+            problems.append('prints on import')
+        if args.max_seconds is not None and result['seconds'] > args.max_seconds:
+            problems.append('slower than ' + str(args.max_seconds) + ' s')
+        failed = failed or bool(problems)
+        print('%-40s %10.1f  %s' % (module, result['seconds'] * 1000, '; '.join(problems)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,168 @@
+"""PDS_AREAL benchmarks
+
+Generate a synthetic bundle and time each entry point on it. Every stage runs in its own process so its
+peak RSS can be measured, and the results are saved as JSON so runs from different versions can be
+compared. Ex.
+
+    python benchmarks/run_benchmarks.py --files 5000 --output before.json
+    python benchmarks/run_benchmarks.py --files 5000 --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from benchmarks.synthbundle import make_bundle
+
+FITS_TEMPLATE = os.path.join(REPO, 'templates', 'pdart_fits_label.txt')
+LOGS_TEMPLATE = os.path.join(REPO, 'templates', 'pdart_logs_label.txt')
+#stages in the order they run; later stages use the output of earlier ones
+STAGES = ['create_header_observing_logs', 'create_header_observing_labels', 'create_fits_labels', 'create_inventory',
+    'update_descriptions', 'update_pubyear', 'update_time', 'fixLIDs']
+
+def run_stage(name, bundle_path, workers=None):
+    """Run Stage
+
+    Run one benchmark stage on a synthetic bundle.
+
+    Args:
+        name (str): One of STAGES.
+        bundle_path (str): The bundle made by synthbundle.make_bundle.
+        workers (:obj:`int`, optional): Passed on to create_fits_labels.
+
+    Returns:
+        dict: 'seconds', 'files', 'files_per_sec', 'peak_rss_kb' and 'error' (None if the stage ran).
+
+    """
+    data_raw = os.path.join(bundle_path, 'data_raw')
+    logs_path = os.path.join(bundle_path, 'document', 'header_observing_logs') + '/'
+    fits_path = data_raw + '/*/*/*.fits'
+    labels_path = data_raw + '/*/*/*.xml'
+    if name == 'create_header_observing_logs':
+        from PDS_AREAL.create.createlogs import create_header_observing_logs
+        os.makedirs(logs_path, exist_ok=True)
+        files = len(glob.glob(fits_path))
+        call = lambda: create_header_observing_logs(logs_path, data_raw + '/*/*')
+    elif name == 'create_header_observing_labels':
+        from PDS_AREAL.newlabels.headerlogslabels import create_header_observing_labels
+        files = len(glob.glob(logs_path + '*.txt'))
+        call = lambda: create_header_observing_labels(logs_path + '*.txt', LOGS_TEMPLATE, 'document', 'bundle',
+            'Synthetic Observation ', 'Orton, Glenn', 'irtf-maunakea.3m2.mirsi')
+    elif name == 'create_fits_labels':
+        from PDS_AREAL.newlabels.fitslabels import create_fits_labels
+        files = len(glob.glob(fits_path))
+        call = lambda: create_fits_labels(fits_path, FITS_TEMPLATE, 'data_raw', 'bundle', 'Synthetic Observation',
+            'Product_Observational', 'Orton, Glenn', 'Synthetic Observing System', 'Synthetic Telescope',
+            'synthetic.telescope', 'Synthetic Instrument', 'synthetic.telescope.instrument', 'synthetic_userguide',
+            'Ground Based FITS, raw data.', 'Raw', 'Raw data', rewrite=True, workers=workers)
+    elif name == 'create_inventory':
+        from PDS_AREAL.create.createinventory import create_inventory
+        for inventory in glob.glob(data_raw + '/collection_*_inventory.csv'):
+            os.remove(inventory)
+        files = len(glob.glob(fits_path))
+        call = lambda: create_inventory('bundle', data_raw, fits_path, '.fits')
+    else:
+        from PDS_AREAL.utils import xmledits
+        files = len(glob.glob(labels_path))
+        call = {
+            'update_descriptions': lambda: xmledits.update_descriptions('Header description', 'Image description', labels_path),
+            'update_pubyear': lambda: xmledits.update_pubyear('2030', labels_path),
+            'update_time': lambda: xmledits.update_time('2003-05-06T00:00:00Z', '2003-05-06T00:01:00Z', labels_path),
+            'fixLIDs': lambda: xmledits.fixLIDs('bundle', 'data_raw', labels_path),
+        }[name]
+    error = None
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            call()
+        except Exception as e:
+            error = type(e).__name__ + ': ' + str(e)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'files': files, 'files_per_sec': files / seconds if seconds else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'error': error}
+
+def run_benchmarks(files=1000, days=20, size=64, workers=None, stages=STAGES, root=None):
+    """Run Benchmarks
+
+    Args:
+        files (:obj:`int`, optional): The number of fits files in the synthetic bundle. Defaults to 1000.
+        days (:obj:`int`, optional): The number of day directories. Defaults to 20.
+        size (:obj:`int`, optional): The width and height of each image. Defaults to 64.
+        workers (:obj:`int`, optional): Passed on to create_fits_labels.
+        stages (:obj:`list`, optional): The stages to run. Defaults to all of STAGES.
+        root (:obj:`str`, optional): Where to write the bundle. Defaults to a temporary directory that is
+            removed afterwards.
+
+    Returns:
+        dict: The run settings and a result from run_stage for each stage.
+
+    """
+    results = {
+        'version': _version(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'files': files, 'days': days, 'size': size, 'workers': workers},
+        'stages': {},
+    }
+    with tempfile.TemporaryDirectory(dir=root) as directory:
+        bundle_path = make_bundle(directory, files, days, (size, size))
+        for name in stages:
+            #a fresh process for each stage, so peak RSS belongs to that stage alone
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results['stages'][name] = pool.submit(run_stage, name, bundle_path, workers).result()
+    return results
+
+def _version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def _report(results, baseline=None):
+    print('%-32s %10s %12s %12s %10s' % ('stage', 'seconds', 'files/sec', 'peak RSS MB', 'vs base'))
+    for name, stage in results['stages'].items():
+        if stage['error']:
+            print('%-32s %s' % (name, stage['error']))
+            continue
+        change = ''
+        if baseline and name in baseline['stages'] and baseline['stages'][name]['seconds'] and not baseline['stages'][name]['error']:
+            change = '%.2fx' % (baseline['stages'][name]['seconds'] / stage['seconds'])
+        print('%-32s %10.3f %12.1f %12.1f %10s' % (name, stage['seconds'], stage['files_per_sec'],
+            stage['peak_rss_kb'] / 1024.0, change))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark PDS_AREAL on a synthetic bundle.')
+    parser.add_argument('--files', type=int, default=1000, help='number of fits files (default 1000)')
+    parser.add_argument('--days', type=int, default=20, help='number of day directories (default 20)')
+    parser.add_argument('--size', type=int, default=64, help='width and height of each image (default 64)')
+    parser.add_argument('--workers', type=int, default=None, help='workers for create_fits_labels')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--root', default=None, help='directory for the synthetic bundle (default: system temp)')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+    results = run_benchmarks(args.files, args.days, args.size, args.workers, args.stages, args.root)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    _report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    #a stage that failed has no numbers worth comparing, so the run fails too
+    if any(stage['error'] for stage in results['stages'].values()):
+        sys.exit(1)
@@ -0,0 +1,92 @@
+"""Synthetic bundle generator
+
+Write a bundle of small fits files in the bundle/data_raw/yyyy/mm-dd/\*.fits layout for benchmarking.
+The headers are written directly, so astropy isn't needed to make them.
+
+Run ``python benchmarks/synthbundle.py --help`` for the options.
+"""
+import argparse
+import os
+
+BLOCK_SIZE = 2880
+#date and time header variants seen across the collections
+DATE_VARIANTS = ['DATE-OBS', 'DATEOBS', 'DATE_OBS']
+FILTERS = ['K', 'N0', 'N1', 'N2', 'N3', 'N4', 'N5', 'Q0', 'Q1', 'Q2', 'Q3', 'Q4', 'Qt', 'Q-s', 'M', 'N']
+SUFFIXES = ['', '', '', '', 'mu', 'cmap', 'vdop']
+
+def make_bundle(root, files=1000, days=20, shape=(64, 64), bundle_name='bundle', extra_cards=20):
+    """Make Bundle
+
+    Args:
+        root (str): The directory to write the bundle in.
+        files (:obj:`int`, optional): The number of fits files. Defaults to 1000.
+        days (:obj:`int`, optional): The number of day directories to spread them across. Defaults to 20.
+        shape (:obj:`tuple`, optional): The (NAXIS2, NAXIS1) shape of each image. Defaults to (64, 64).
+        bundle_name (:obj:`str`, optional): The name of the bundle directory. Defaults to 'bundle'.
+        extra_cards (:obj:`int`, optional): The number of filler cards in each header. Defaults to 20.
+
+    Returns:
+        str: The path to the bundle directory.
+
+    Each file cycles through the header variants: the date is in DATE-OBS (yyyy-mm-dd), DATEOBS (mm/dd/yy)
+    or DATE_OBS (mm/dd/yyyy), and the wavelength is given by WAVELENG, by FILTER, by both or by neither.
+
+    """
+    bundle_path = os.path.join(root, bundle_name)
+    data = bytes(_padded(shape[0] * shape[1] * 4))
+    for i in range(files):
+        day = i % days
+        year = 2000 + day % 10
+        month = day // 28 % 12 + 1
+        date = day % 28 + 1
+        directory = os.path.join(bundle_path, 'data_raw', str(year), '%02d-%02d' % (month, date))
+        os.makedirs(directory, exist_ok=True)
+        cards = [('SIMPLE', True), ('BITPIX', -32), ('NAXIS', 2), ('NAXIS1', shape[1]), ('NAXIS2', shape[0])]
+        variant = DATE_VARIANTS[i % 3]
+        if variant == 'DATE-OBS':
+            cards.append((variant, '%04d-%02d-%02d' % (year, month, date)))
+        elif variant == 'DATEOBS':
+            cards.append((variant, '%02d/%02d/%02d' % (month, date, year % 100)))
+        else:
+            cards.append((variant, '%02d/%02d/%04d' % (month, date, year)))
+        cards.append(('TIME-OBS', '%02d:%02d:%02d.%06d' % (i // 3600 % 24, i // 60 % 60, i % 60, i * 7919 % 1000000)))
+        end = i + 1
+        cards.append(('TIME-END', '%02d:%02d:%02d.5' % (end // 3600 % 24, end // 60 % 60, end % 60)))
+        if i % 4 in (0, 1):
+            cards.append(('WAVELENG', [7.9, 8.7, 10.3, 17.93][i // 4 % 4]))
+        if i % 4 in (1, 2):
+            cards.append(('FILTER', FILTERS[i % len(FILTERS)]))
+        cards.extend([('CHPFREQ', 4.0), ('OBSMODE', 'chop-nod'), ('AIRMASS', 1.0 + i % 50 / 100.0)])
+        cards.extend(('HISTORY', 'synthetic card ' + str(n)) for n in range(extra_cards))
+        suffix = SUFFIXES[i % len(SUFFIXES)]
+        with open(os.path.join(directory, 'syn%07d%s.fits' % (i, suffix)), 'wb') as f:
+            f.write(_header(cards))
+            f.write(data)
+    return bundle_path
+
+def _header(cards):
+    text = ''.join(_card(key, value) for key, value in cards) + 'END'.ljust(80)
+    return text.ljust(_padded(len(text))).encode('ascii')
+
+def _card(key, value):
+    if key == 'HISTORY':
+        return (key.ljust(8) + value).ljust(80)
+    if isinstance(value, bool):
+        value = ('T' if value else 'F').rjust(20)
+    elif isinstance(value, str):
+        value = ("'" + value.replace("'", "''").ljust(8) + "'").ljust(20)
+    else:
+        value = repr(value).upper().rjust(20)
+    return (key.ljust(8) + '= ' + value).ljust(80)
+
+def _padded(length):
+    return -(-length // BLOCK_SIZE) * BLOCK_SIZE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic fits bundle for benchmarking.')
+    parser.add_argument('root', help='directory to write the bundle in')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--size', type=int, default=64, help='width and height of each image')
+    args = parser.parse_args()
+    print(make_bundle(args.root, args.files, args.days, (args.size, args.size)))
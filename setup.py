@@ -2,5 +2,8 @@ from setuptools import setup, find_packages
 setup(
 	name="PDS_AREAL",
 	version="1.02",
-	packages=find_packages()
+	packages=find_packages(),
+	entry_points={
+		"console_scripts": ["pds-areal-bundle=PDS_AREAL.pipeline:main"],
+	},
 )